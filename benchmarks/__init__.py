@@ -0,0 +1,4 @@
+"""
+Scripts de benchmark (charge HTTP et micro-benchmarks) du backend AI4D.
+Lancer depuis la racine du projet : python -m benchmarks.<script> --help
+"""
@@ -0,0 +1,292 @@
+"""
+Benchmark de bout en bout des chemins IA, avec le faux backend LLM
+(LLM_BACKEND=fake, src.ai_agents.fake_llm) : aucun appel OpenAI, latence
+simulée et reproductible (LLM_FAKE_SEED).
+
+Cibles en process (Mongo et Redis locaux requis pour le workflow) :
+- profiling  : AILearningWorkflow.start_profiling (profiler + génération de questions) ;
+- evaluation : AILearningWorkflow.evaluate_responses sur les sessions créées par profiling ;
+- roadmap    : CourseManagerAgent.create_course_roadmap et
+               CourseRecommendationAgent.create_learning_roadmap ;
+- scheduler  : charge de chat normale (appels interactifs) en parallèle
+               d'appels de fond sur le même modèle, sans Redis ni Mongo ;
+               échoue si l'ordonnanceur (src.ai_agents.llm_scheduler) a
+               différé le fond alors que le chat n'attend pas.
+
+Cibles HTTP, contre un serveur et un worker Celery locaux lancés avec le
+même backend :
+- chat-http  : POST /api/ai/v1/chat ;
+- chat-ws    : WebSocket /api/ai/v1/realtime/chat/{user_id} (délai du
+               premier chunk en plus de la latence totale).
+
+    export LLM_BACKEND=fake LLM_FAKE_LATENCY_MEDIAN_MS=800 LLM_FAKE_TOKENS_PER_SECOND=60
+    python -m benchmarks.bench_ai_pipeline --targets profiling evaluation roadmap --label $(git rev-parse --short HEAD)
+
+    uvicorn src:app & celery -A src.celery_tasks worker &
+    python -m benchmarks.bench_ai_pipeline --targets chat-http chat-ws --output bench.jsonl
+
+Les résultats (p50/p95/p99, débit) s'ajoutent à --output en JSON lines,
+libellés par --label : un run par commit permet de suivre les régressions.
+"""
+import argparse
+import asyncio
+import json
+import time
+import uuid
+from typing import Any, Dict, List
+
+import httpx
+
+from benchmarks.common import percentile, print_results, run_load
+
+IN_PROCESS_TARGETS = {"profiling", "evaluation", "roadmap", "scheduler"}
+
+CHAT_MESSAGES = [
+    "Peux-tu m'expliquer la rétropropagation simplement ?",
+    "Quelle différence entre surapprentissage et sous-apprentissage ?",
+    "Comment choisir le taux d'apprentissage ?",
+    "Donne-moi un exercice sur les réseaux convolutifs.",
+]
+
+USER_PROFILE = {
+    "status": "Etudiant",
+    "niveau_technique": 5,
+    "competences": ["Python", "Statistiques"],
+    "objectifs_apprentissage": "Comprendre le deep learning",
+}
+
+
+def _answers(questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Réponses plausibles (les deux formats lus par l'évaluateur : `reponse` et `answer`)."""
+    answers = []
+    for i, q in enumerate(questions, start=1):
+        if q.get("type") == "ChoixMultiple":
+            answer = "A"
+        else:
+            answer = "Le modèle ajuste ses poids en propageant le gradient de l'erreur, par exemple sur MNIST."
+        answers.append({"numero": q.get("numero", i), "reponse": answer, "answer": answer})
+    return answers
+
+
+def _add_ttft(result: Dict[str, Any], ttfts: List[float]) -> Dict[str, Any]:
+    result["p50_ttft_ms"] = round(percentile(ttfts, 50) * 1000, 2)
+    result["p95_ttft_ms"] = round(percentile(ttfts, 95) * 1000, 2)
+    return result
+
+
+# --- En process ---
+async def bench_workflow(args: argparse.Namespace, targets: List[str]) -> List[Dict[str, Any]]:
+    from src.ai_agents.workflow import ai_learning_workflow
+
+    run_id = uuid.uuid4().hex[:8]
+    sessions: Dict[int, Dict[str, Any]] = {}
+    results = []
+
+    async def profiling(i: int):
+        user_id, session_id = f"bench_{run_id}_{i}", f"bench_session_{i}"
+        started = await ai_learning_workflow.start_profiling(user_id, session_id, dict(USER_PROFILE))
+        if not started.get("questions"):
+            raise RuntimeError("aucune question générée")
+        sessions[i] = {"user_id": user_id, "session_id": session_id, "questions": started["questions"]}
+
+    async def evaluation(i: int):
+        session = sessions[i]
+        result = await ai_learning_workflow.evaluate_responses(
+            session["user_id"], session["session_id"], _answers(session["questions"])
+        )
+        if not result.get("evaluation_results"):
+            raise RuntimeError("évaluation vide")
+
+    # evaluation réutilise les sessions de profiling : toujours exécuté avant
+    profiling_result = await run_load(f"{args.label}:profiling", profiling, total=args.requests,
+                                      concurrency=args.concurrency)
+    if "profiling" in targets:
+        results.append(profiling_result)
+    if "evaluation" in targets:
+        done = sorted(sessions)
+
+        async def evaluate_done(n: int):
+            await evaluation(done[n])
+
+        results.append(await run_load(f"{args.label}:evaluation", evaluate_done, total=len(done),
+                                      concurrency=args.concurrency))
+    return results
+
+
+async def bench_roadmap(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from src.ai_agents.agents.course_manager_agent import course_manager_agent
+    from src.ai_agents.agents.course_recommendation_agent import course_recommendation_agent
+
+    async def course(i: int):
+        roadmap = await course_manager_agent.create_course_roadmap(
+            course_topic="Réseaux de neurones", user_level=1 + i % 10,
+            user_objectives="Comprendre le deep learning", duration_weeks=6,
+        )
+        if not roadmap.get("modules"):
+            raise RuntimeError("roadmap sans modules")
+
+    async def learning(i: int):
+        roadmap = await course_recommendation_agent.create_learning_roadmap(
+            user_level=1 + i % 10, user_objectives="Machine learning",
+            user_competences=["Python"], duration_weeks=12,
+        )
+        if roadmap.get("error"):
+            raise RuntimeError(roadmap["error"])
+
+    return [
+        await run_load(f"{args.label}:roadmap-course", course, total=args.requests, concurrency=args.concurrency),
+        await run_load(f"{args.label}:roadmap-learning", learning, total=args.requests, concurrency=args.concurrency),
+    ]
+
+
+async def bench_scheduler(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    from src.config import Config
+    from src.ai_agents.agents.chatbot_agent import CHATBOT_MODEL
+    from src.ai_agents.llm_provider import get_chat_model
+    from src.ai_agents.llm_scheduler import scheduler
+
+    # Contrôle en process : pas de signal Redis, pas de coalescence (prompts distincts)
+    Config.LLM_SCHEDULER_SHARED_PRESSURE = False
+    Config.LLM_COALESCE_ENABLED = False
+    chat = get_chat_model(CHATBOT_MODEL, temperature=0.7, agent="ChatbotAgent")
+    background = get_chat_model(CHATBOT_MODEL, temperature=0.6, agent="CourseManagerAgent")
+
+    async def interactive(i: int):
+        await chat.ainvoke(f"{CHAT_MESSAGES[i % len(CHAT_MESSAGES)]} ({i})")
+
+    async def roadmap(i: int):
+        await background.ainvoke(f"Crée la roadmap du cours Réseaux de neurones, niveau {1 + i % 10} ({i}).")
+
+    # Le fond démarre une fois que l'échantillon de latence interactive est constitué
+    chat_load = asyncio.ensure_future(run_load(f"{args.label}:scheduler-chat", interactive, total=args.requests,
+                                               concurrency=args.concurrency))
+    await asyncio.sleep(Config.LLM_FAKE_LATENCY_MEDIAN_MS / 1000 * 3)
+    background_result = await run_load(f"{args.label}:scheduler-background", roadmap,
+                                       total=max(1, args.requests // 4), concurrency=2)
+    chat_result = await chat_load
+
+    stats = scheduler.stats()["models"].get(CHATBOT_MODEL, {})
+    background_result["deferred"] = stats.get("deferred", 0)
+    chat_result["interactive_p95_ms"] = stats.get("interactive_p95_ms")
+    chat_result["p95_queue_ms"] = (stats.get("p95_queue_ms") or {}).get("interactive")
+    return [chat_result, background_result]
+
+
+# --- HTTP / WebSocket ---
+async def _login(client: httpx.AsyncClient, args: argparse.Namespace) -> Dict[str, str]:
+    token = args.token
+    if not token:
+        resp = await client.post("/api/auth/v1/login", json={"email": args.email, "password": args.password})
+        resp.raise_for_status()
+        token = resp.json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    user_id = args.user_id
+    if not user_id:
+        resp = await client.get("/api/auth/v1/me", headers=headers)
+        resp.raise_for_status()
+        user_id = str(resp.json()["id"])
+    return {"token": token, "user_id": user_id}
+
+
+async def bench_chat_http(args: argparse.Namespace, client: httpx.AsyncClient, auth: Dict[str, str]) -> Dict[str, Any]:
+    headers = {"Authorization": f"Bearer {auth['token']}"}
+
+    async def call(i: int):
+        resp = await client.post(
+            "/api/ai/v1/chat",
+            json={"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)], "session_id": f"bench_http_{i % args.concurrency}"},
+            headers=headers,
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"HTTP {resp.status_code}")
+
+    return await run_load(f"{args.label}:chat-http", call, total=args.requests,
+                          concurrency=args.concurrency, warmup=args.warmup)
+
+
+async def bench_chat_ws(args: argparse.Namespace, auth: Dict[str, str]) -> Dict[str, Any]:
+    import websockets
+
+    url = args.base_url.replace("http", "ws", 1) + f"/api/ai/v1/realtime/chat/{auth['user_id']}"
+    ttfts: List[float] = []
+
+    async def call(i: int):
+        # Une connexion par échange : le serveur indexe les connexions par user_id
+        async with websockets.connect(url, open_timeout=30) as ws:
+            started = time.perf_counter()
+            first = None
+            await ws.send(json.dumps({"message": CHAT_MESSAGES[i % len(CHAT_MESSAGES)], "session_id": f"bench_ws_{i}"}))
+            while True:
+                data = json.loads(await asyncio.wait_for(ws.recv(), timeout=120))
+                if data.get("type") == "chunk" and first is None:
+                    first = time.perf_counter() - started
+                if data.get("type") == "error":
+                    raise RuntimeError(data.get("error"))
+                if data.get("type") == "complete":
+                    break
+            if first is not None:
+                ttfts.append(first)
+
+    result = await run_load(f"{args.label}:chat-ws", call, total=args.requests,
+                            concurrency=args.concurrency, warmup=args.warmup)
+    return _add_ttft(result, ttfts)
+
+
+async def main(args: argparse.Namespace) -> None:
+    targets = args.targets
+    results: List[Dict[str, Any]] = []
+
+    in_process = IN_PROCESS_TARGETS & set(targets)
+    if in_process:
+        from src.config import Config
+
+        if Config.LLM_BACKEND != "fake" and not args.allow_real_llm:
+            raise SystemExit("LLM_BACKEND=fake requis (ou --allow-real-llm pour appeler OpenAI)")
+    if {"profiling", "evaluation"} & set(targets):
+        results.extend(await bench_workflow(args, targets))
+    if "roadmap" in targets:
+        results.extend(await bench_roadmap(args))
+    if "scheduler" in targets:
+        results.extend(await bench_scheduler(args))
+
+    if {"chat-http", "chat-ws"} & set(targets):
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=120.0) as client:
+            auth = await _login(client, args)
+            if "chat-http" in targets:
+                results.append(await bench_chat_http(args, client, auth))
+            if "chat-ws" in targets:
+                results.append(await bench_chat_ws(args, auth))
+
+    if in_process:
+        from src.ai_agents.llm_telemetry import llm_metrics
+
+        # Appels LLM simulés par agent (vérifie que chaque chemin est bien exercé)
+        for agent, models in llm_metrics()["agents"].items():
+            for model, summary in models.items():
+                print(f"  {agent:<28} {model:<12} calls={summary['calls']:<6} errors={summary['errors']:<4} "
+                      f"p95={summary['p95_latency_ms']}ms")
+
+    print_results(results, args.output)
+
+    deferred = sum(result.get("deferred", 0) for result in results)
+    if deferred:
+        raise SystemExit(f"{deferred} appels de fond différés sous une charge de chat normale")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", default=["profiling", "evaluation", "roadmap"],
+                        choices=["profiling", "evaluation", "roadmap", "scheduler", "chat-http", "chat-ws"])
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=5, help="Requêtes HTTP/WS non mesurées")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", help="Access token (sinon login avec --email/--password)")
+    parser.add_argument("--user-id", help="Identifiant pour le WebSocket (sinon /api/auth/v1/me)")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--allow-real-llm", action="store_true", help="Autoriser les cibles en process sans faux backend")
+    parser.add_argument("--label", default="fake")
+    parser.add_argument("--output", help="Fichier JSON lines où ajouter les résultats")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""
+Benchmark de débit des endpoints authentifiés (/api/auth/v1/me et profil).
+
+Chaque requête passe par get_current_user, donc par get_session() : c'est le
+chemin qui mesure le coût d'ouverture d'une connexion PostgreSQL.
+
+Comparer avant / après le pool de connexions :
+
+    DB_POOL_DISABLED=true  uvicorn src:app --workers 1   # avant (NullPool)
+    python -m benchmarks.bench_auth_endpoints --label nullpool --output bench.jsonl
+
+    DB_POOL_DISABLED=false uvicorn src:app --workers 1   # après (pool asyncpg)
+    python -m benchmarks.bench_auth_endpoints --label pooled --output bench.jsonl
+"""
+import argparse
+import asyncio
+
+import httpx
+
+from benchmarks.common import print_results, run_load
+
+ENDPOINTS = {
+    "me": "/api/auth/v1/me",
+    "profile": "/api/profile/v1/",
+    "profile_stats": "/api/profile/v1/stats",
+}
+
+
+async def _login(client: httpx.AsyncClient, email: str, password: str) -> str:
+    resp = await client.post("/api/auth/v1/login", json={"email": email, "password": password})
+    resp.raise_for_status()
+    return resp.json()["access_token"]
+
+
+async def main(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30.0) as client:
+        token = args.token or await _login(client, args.email, args.password)
+        headers = {"Authorization": f"Bearer {token}"}
+
+        results = []
+        for name in args.endpoints:
+            path = ENDPOINTS[name]
+
+            async def call(_i: int, path: str = path):
+                resp = await client.get(path, headers=headers)
+                # 404 sur le profil = pas encore de questionnaire, la requête a quand même traversé l'auth
+                if resp.status_code >= 500 or resp.status_code in (401, 403):
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+
+            results.append(await run_load(
+                f"{args.label}:{name}",
+                call,
+                total=args.requests,
+                concurrency=args.concurrency,
+                warmup=args.warmup,
+            ))
+
+    print_results(results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--token", help="Access token (sinon login avec --email/--password)")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--endpoints", nargs="+", default=["me", "profile"], choices=sorted(ENDPOINTS))
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--warmup", type=int, default=50)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Fichier JSON lines où ajouter les résultats")
+    asyncio.run(main(parser.parse_args()))
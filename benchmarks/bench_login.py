@@ -0,0 +1,112 @@
+"""
+Benchmark du login (argon2) : débit HTTP et coût du hachage dans la boucle.
+
+Mode http : POST /api/auth/v1/login en concurrence contre un serveur lancé.
+Les réponses 429 (pool de hachage saturé) sont comptées à part.
+
+    uvicorn src:app --workers 4
+    python -m benchmarks.bench_login http --concurrency 64 --label pool --output bench.jsonl
+
+Mode local : même charge de vérifications argon2 dans un seul process,
+exécutées directement dans la boucle (avant) puis via src.users.hashing
+(après). Mesure aussi le retard de la boucle : un ping toutes les 10 ms
+qui n'est pas servi à temps montre que la boucle était bloquée.
+
+    python -m benchmarks.bench_login local --requests 400 --concurrency 32
+"""
+import argparse
+import asyncio
+import os
+import time
+
+import httpx
+
+from benchmarks.common import percentile, print_results, run_load
+
+
+async def _bench_http(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    shed = 0
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30.0) as client:
+        async def call(_i: int):
+            nonlocal shed
+            resp = await client.post("/api/auth/v1/login", json={"email": args.email, "password": args.password})
+            if resp.status_code == 429:
+                shed += 1
+            if resp.status_code != 200:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+
+        result = await run_load(
+            f"{args.label}:login",
+            call,
+            total=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+        )
+
+    result["shed_429"] = shed
+    result["cpu_count"] = os.cpu_count()
+    print_results([result], args.output)
+
+
+async def _loop_lag(stop: asyncio.Event, samples: list) -> None:
+    interval = 0.01
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(time.perf_counter() - start - interval)
+
+
+async def _bench_local(args: argparse.Namespace) -> None:
+    from src.users import hashing
+    from src.users.utils import password_context, verify_password_hash
+
+    stored = password_context.hash(args.password)
+
+    async def inline(_i: int):
+        if not verify_password_hash(args.password, stored):
+            raise RuntimeError("verification failed")
+
+    async def pooled(_i: int):
+        valid, _ = await hashing.verify_password(args.password, stored)
+        if not valid:
+            raise RuntimeError("verification failed")
+
+    results = []
+    for label, call in (("inline", inline), ("pool", pooled)):
+        lag: list = []
+        stop = asyncio.Event()
+        probe = asyncio.create_task(_loop_lag(stop, lag))
+        result = await run_load(
+            f"{args.label}:{label}",
+            call,
+            total=args.requests,
+            concurrency=args.concurrency,
+            warmup=args.warmup,
+        )
+        stop.set()
+        await probe
+        result["loop_lag_p99_ms"] = round(percentile(lag, 99) * 1000, 2)
+        result["loop_lag_max_ms"] = round(max(lag) * 1000, 2) if lag else 0.0
+        result["cpu_count"] = os.cpu_count()
+        results.append(result)
+
+    results[-1]["hashing"] = hashing.hashing_stats()
+    hashing.shutdown_hash_executor()
+    print_results(results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("mode", choices=["http", "local"])
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--email", default="bench@example.com")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Fichier JSON lines où ajouter les résultats")
+    cli_args = parser.parse_args()
+    asyncio.run(_bench_http(cli_args) if cli_args.mode == "http" else _bench_local(cli_args))
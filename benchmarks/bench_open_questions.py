@@ -0,0 +1,109 @@
+"""
+Benchmark de l'analyse des questions ouvertes (OpenQuestionAnalyzer), avec
+un faux LLM : aucune requête réseau, latence simulée.
+
+Compare, pour un quiz de --questions réponses ouvertes :
+- sequential : un appel après l'autre (comportement d'origine) ;
+- concurrent : un appel par réponse, en parallèle (OPEN_QUESTION_CONCURRENCY) ;
+- batch      : un seul appel pour toutes les réponses (prompt plus long,
+               réponse plus longue : --per-item-ms par réponse générée).
+
+    python -m benchmarks.bench_open_questions --questions 4 --quizzes 50 --latency-ms 1500
+"""
+import argparse
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+from benchmarks.common import print_results, run_load
+
+ANALYSIS = {
+    "scores": {"comprehension": 6, "profondeur": 5, "exemples": 4, "clarte": 6},
+    "score_global": 5.25,
+    "niveau_reel_estime": 5,
+    "niveau_label": "Intermédiaire bas",
+    "feedback": "Réponse correcte mais peu détaillée.",
+    "points_forts": ["Vocabulaire juste"],
+    "points_amelioration": ["Ajouter un exemple"],
+    "suggestions": ["Implémenter un petit réseau"],
+}
+
+
+class FakeChatModel:
+    """Répond au format attendu après une latence simulée (base + coût par réponse générée)."""
+
+    def __init__(self, latency_ms: float, per_item_ms: float, jitter: float):
+        self.latency_ms = latency_ms
+        self.per_item_ms = per_item_ms
+        self.jitter = jitter
+        self.calls = 0
+
+    async def ainvoke(self, messages, config=None, **kwargs):
+        self.calls += 1
+        prompt = messages[-1].content
+        items = prompt.count("### RÉPONSE")
+        delay = self.latency_ms + self.per_item_ms * max(0, items - 1)
+        await asyncio.sleep(delay * random.uniform(1 - self.jitter, 1 + self.jitter) / 1000)
+        if items:
+            body = {"analyses": [{"index": i, **ANALYSIS} for i in range(1, items + 1)]}
+        else:
+            body = ANALYSIS
+        return SimpleNamespace(content=json.dumps(body, ensure_ascii=False))
+
+
+def _quiz(size: int) -> list:
+    return [
+        {
+            "question": f"Question ouverte {i} : expliquer la rétropropagation.",
+            "user_answer": "Le gradient de la perte est propagé couche par couche pour ajuster les poids du réseau.",
+            "expected_answer": "Dérivation en chaîne, mise à jour des poids.",
+        }
+        for i in range(size)
+    ]
+
+
+async def main(args: argparse.Namespace) -> None:
+    from src.ai_agents.agents.open_question_analyzer import OpenQuestionAnalyzer
+
+    analyzer = OpenQuestionAnalyzer()
+    fake = FakeChatModel(args.latency_ms, args.per_item_ms, args.jitter)
+    analyzer.llm = fake
+    quiz = _quiz(args.questions)
+
+    async def sequential(_i: int):
+        for qa in quiz:
+            await analyzer.analyze_open_question(qa["question"], qa["user_answer"], qa["expected_answer"])
+
+    async def concurrent(_i: int):
+        await analyzer.analyze_multiple_open_questions(quiz, batch=False)
+
+    async def batch(_i: int):
+        await analyzer.analyze_multiple_open_questions(quiz, batch=True)
+
+    results = []
+    for label, call in (("sequential", sequential), ("concurrent", concurrent), ("batch", batch)):
+        fake.calls = 0
+        result = await run_load(
+            f"{args.label}:{label}:q{args.questions}",
+            call,
+            total=args.quizzes,
+            concurrency=args.concurrency,
+        )
+        result["llm_calls"] = fake.calls
+        results.append(result)
+
+    print_results(results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=4, help="Réponses ouvertes par quiz")
+    parser.add_argument("--quizzes", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=8, help="Quiz évalués en parallèle")
+    parser.add_argument("--latency-ms", type=float, default=1500.0, help="Latence simulée d'un appel")
+    parser.add_argument("--per-item-ms", type=float, default=400.0, help="Surcoût par réponse supplémentaire en batch")
+    parser.add_argument("--jitter", type=float, default=0.2)
+    parser.add_argument("--label", default="fake")
+    parser.add_argument("--output", help="Fichier JSON lines où ajouter les résultats")
+    asyncio.run(main(parser.parse_args()))
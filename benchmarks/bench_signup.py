@@ -0,0 +1,89 @@
+"""
+Benchmark de l'inscription (POST /api/auth/v1/signup).
+
+Chaque requête utilise un email et un username uniques ; le scénario
+"duplicate" renvoie un compte existant et mesure le chemin 409 (détecté par
+les contraintes uniques, sans requête de vérification préalable).
+
+    uvicorn src:app --workers 4
+    python -m benchmarks.bench_signup --requests 500 --concurrency 32 --label constraints --output bench.jsonl
+
+Les emails de vérification sont écrits dans la table email_outbox, dans la
+transaction de l'inscription : après le benchmark, les laisser drainer par
+drain_email_outbox_task (purge_sent_emails les supprime ensuite) ou
+supprimer directement les lignes destinées au préfixe, par exemple
+
+    DELETE FROM email_outbox WHERE recipients::text LIKE '%bench_signup+%';
+
+Les comptes créés utilisent le préfixe --prefix pour pouvoir être supprimés
+ensuite.
+"""
+import argparse
+import asyncio
+import uuid
+
+import httpx
+
+from benchmarks.common import print_results, run_load
+
+
+def _payload(prefix: str, suffix: str, password: str) -> dict:
+    return {
+        "nom": "Bench",
+        "prenom": "Signup",
+        "username": f"{prefix}_{suffix}",
+        "email": f"{prefix}+{suffix}@example.com",
+        "motDePasseHash": password,
+        "status": "Etudiant",
+        "domaine": "Informatique",
+    }
+
+
+async def main(args: argparse.Namespace) -> None:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    run_id = uuid.uuid4().hex[:8]
+
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=30.0) as client:
+        async def signup(i: int):
+            resp = await client.post("/api/auth/v1/signup", json=_payload(args.prefix, f"{run_id}_{i}", args.password))
+            if resp.status_code != 201:
+                raise RuntimeError(f"HTTP {resp.status_code}")
+
+        results = [await run_load(
+            f"{args.label}:signup",
+            signup,
+            total=args.requests,
+            concurrency=args.concurrency,
+            warmup=0,
+        )]
+
+        if "duplicate" in args.scenarios:
+            duplicate = _payload(args.prefix, f"{run_id}_0", args.password)
+
+            async def signup_duplicate(_i: int):
+                resp = await client.post("/api/auth/v1/signup", json=duplicate)
+                if resp.status_code != 409:
+                    raise RuntimeError(f"HTTP {resp.status_code}")
+
+            results.append(await run_load(
+                f"{args.label}:duplicate",
+                signup_duplicate,
+                total=args.requests,
+                concurrency=args.concurrency,
+                warmup=0,
+            ))
+
+    print_results(results, args.output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--prefix", default="bench_signup")
+    parser.add_argument("--password", default="benchmark-password")
+    parser.add_argument("--scenarios", nargs="+", default=["signup", "duplicate"], choices=["signup", "duplicate"])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--label", default="run")
+    parser.add_argument("--output", help="Fichier JSON lines où ajouter les résultats")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,94 @@
+"""
+Utilitaires partagés par les benchmarks : exécution concurrente et statistiques.
+"""
+import asyncio
+import json
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Percentile (interpolation linéaire) d'une liste de mesures."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    k = (len(ordered) - 1) * (pct / 100.0)
+    lower = int(k)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (k - lower)
+
+
+def summarize(label: str, latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Construit le résumé d'un run (latences en millisecondes)."""
+    total = len(latencies) + errors
+    return {
+        "label": label,
+        "requests": total,
+        "errors": errors,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed > 0 else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2) if latencies else 0.0,
+    }
+
+
+async def run_load(
+    label: str,
+    call: Callable[[int], Awaitable[Any]],
+    total: int,
+    concurrency: int,
+    warmup: int = 0,
+) -> Dict[str, Any]:
+    """
+    Exécute `total` appels de `call(i)` avec au plus `concurrency` en vol.
+    Un appel qui lève une exception est compté comme erreur.
+    """
+    for i in range(warmup):
+        try:
+            await call(i)
+        except Exception:
+            pass
+
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                i = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                await call(i)
+                latencies.append(time.perf_counter() - start)
+            except Exception:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    elapsed = time.perf_counter() - started
+    return summarize(label, latencies, errors, elapsed)
+
+
+def print_results(results: List[Dict[str, Any]], output: Optional[str] = None) -> None:
+    """Affiche les résultats sous forme de tableau et les ajoute en JSON lines si demandé."""
+    header = f"{'label':<40} {'req':>7} {'err':>5} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['label']:<40} {r['requests']:>7} {r['errors']:>5} {r['throughput_rps']:>9} "
+            f"{r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9}"
+        )
+
+    if output:
+        with open(output, "a", encoding="utf-8") as fh:
+            for r in results:
+                fh.write(json.dumps(r, ensure_ascii=False) + "\n")
@@ -0,0 +1,33 @@
+"""Case-insensitive unique index on utilisateur.email
+
+Revision ID: a93e5f17b2c8
+Revises: f2a8d6c4e519
+Create Date: 2026-10-17 16:40:55.208316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'a93e5f17b2c8'
+down_revision: Union[str, Sequence[str], None] = 'f2a8d6c4e519'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Échoue si deux comptes ne diffèrent que par la casse de l'email : les fusionner avant
+    op.create_index(
+        'ux_utilisateur_email_lower',
+        'utilisateur',
+        [sa.text('lower(email)')],
+        unique=True
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ux_utilisateur_email_lower', table_name='utilisateur')
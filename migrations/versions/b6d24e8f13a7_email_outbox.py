@@ -0,0 +1,49 @@
+"""Transactional email outbox
+
+Revision ID: b6d24e8f13a7
+Revises: a93e5f17b2c8
+Create Date: 2026-10-17 17:58:12.630481
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'b6d24e8f13a7'
+down_revision: Union[str, Sequence[str], None] = 'a93e5f17b2c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'email_outbox',
+        sa.Column('id', sa.BIGINT(), autoincrement=True, nullable=False),
+        sa.Column('recipients', postgresql.JSONB(), nullable=False),
+        sa.Column('subject', sa.Text(), nullable=False),
+        sa.Column('body', sa.Text(), nullable=False),
+        sa.Column('status', sa.Text(), nullable=False, server_default='pending'),
+        sa.Column('attempts', sa.INTEGER(), nullable=False, server_default=sa.text('0')),
+        sa.Column('next_attempt_at', postgresql.TIMESTAMP(), nullable=False),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.Column('created_at', postgresql.TIMESTAMP(), nullable=False),
+        sa.Column('sent_at', postgresql.TIMESTAMP(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(
+        'ix_email_outbox_pending',
+        'email_outbox',
+        ['next_attempt_at', 'id'],
+        unique=False,
+        postgresql_where=sa.text("status = 'pending'")
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_email_outbox_pending', table_name='email_outbox')
+    op.drop_table('email_outbox')
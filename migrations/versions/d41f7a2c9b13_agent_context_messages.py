@@ -0,0 +1,87 @@
+"""Append-only agent_context_messages table
+
+Revision ID: d41f7a2c9b13
+Revises: c58d463d64c9
+Create Date: 2026-10-17 10:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41f7a2c9b13'
+down_revision: Union[str, Sequence[str], None] = 'c58d463d64c9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        'agent_contexts',
+        sa.Column('message_count', sa.INTEGER(), nullable=False, server_default=sa.text('0'))
+    )
+    op.create_table(
+        'agent_context_messages',
+        sa.Column('id', sa.BIGINT(), autoincrement=True, nullable=False),
+        sa.Column('context_id', sa.UUID(), nullable=False),
+        sa.Column('seq', sa.INTEGER(), nullable=False),
+        sa.Column('agent', sa.Text(), nullable=False),
+        sa.Column('message_type', sa.Text(), nullable=False),
+        sa.Column('message', sa.Text(), nullable=False),
+        sa.Column('created_at', postgresql.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('NOW()')),
+        sa.PrimaryKeyConstraint('id'),
+        sa.ForeignKeyConstraint(['context_id'], ['agent_contexts.id'], ondelete='CASCADE')
+    )
+    op.create_index(
+        'ix_agent_context_messages_context_id_seq',
+        'agent_context_messages',
+        ['context_id', 'seq'],
+        unique=True
+    )
+
+    # Reprise de l'historique JSON existant, dans l'ordre
+    op.execute("""
+        INSERT INTO agent_context_messages (context_id, seq, agent, message_type, message, created_at)
+        SELECT c.id,
+               e.ord,
+               COALESCE(e.value->>'agent', 'system'),
+               COALESCE(e.value->>'type', 'agent'),
+               COALESCE(e.value->>'message', ''),
+               COALESCE((e.value->>'timestamp')::timestamptz, c.updated_at, NOW())
+        FROM agent_contexts c,
+             json_array_elements(c.conversation_history) WITH ORDINALITY AS e(value, ord)
+        WHERE c.conversation_history IS NOT NULL
+          AND json_typeof(c.conversation_history) = 'array'
+    """)
+    op.execute("""
+        UPDATE agent_contexts
+        SET message_count = json_array_length(conversation_history)
+        WHERE conversation_history IS NOT NULL
+          AND json_typeof(conversation_history) = 'array'
+    """)
+    op.drop_column('agent_contexts', 'conversation_history')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('agent_contexts', sa.Column('conversation_history', sa.JSON(), nullable=True))
+    op.execute("""
+        UPDATE agent_contexts c
+        SET conversation_history = COALESCE((
+            SELECT json_agg(json_build_object(
+                       'timestamp', m.created_at,
+                       'agent', m.agent,
+                       'type', m.message_type,
+                       'message', m.message
+                   ) ORDER BY m.seq)
+            FROM agent_context_messages m
+            WHERE m.context_id = c.id
+        ), '[]'::json)
+    """)
+    op.drop_index('ix_agent_context_messages_context_id_seq', table_name='agent_context_messages')
+    op.drop_table('agent_context_messages')
+    op.drop_column('agent_contexts', 'message_count')
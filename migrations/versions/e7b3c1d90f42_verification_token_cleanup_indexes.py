@@ -0,0 +1,40 @@
+"""Indexes for verification_token cleanup
+
+Revision ID: e7b3c1d90f42
+Revises: d41f7a2c9b13
+Create Date: 2026-10-17 14:03:27.512930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e7b3c1d90f42'
+down_revision: Union[str, Sequence[str], None] = 'd41f7a2c9b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(
+        op.f('ix_verification_token_expires_at'),
+        'verification_token',
+        ['expires_at'],
+        unique=False
+    )
+    op.create_index(
+        'ix_verification_token_used_at',
+        'verification_token',
+        ['used_at'],
+        unique=False,
+        postgresql_where=sa.text('is_used')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_verification_token_used_at', table_name='verification_token')
+    op.drop_index(op.f('ix_verification_token_expires_at'), table_name='verification_token')
@@ -0,0 +1,34 @@
+"""Keyset pagination indexes on utilisateur
+
+Revision ID: f2a8d6c4e519
+Revises: e7b3c1d90f42
+Create Date: 2026-10-17 15:21:08.947103
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2a8d6c4e519'
+down_revision: Union[str, Sequence[str], None] = 'e7b3c1d90f42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_utilisateur_created_at_id', 'utilisateur', ['created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_utilisateur_status_created_at_id',
+        'utilisateur',
+        ['status', 'created_at', 'id'],
+        unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_utilisateur_status_created_at_id', table_name='utilisateur')
+    op.drop_index('ix_utilisateur_created_at_id', table_name='utilisateur')
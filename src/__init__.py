@@ -1,3 +1,6 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from src.users.router import user_router
 from src.profile.router import router
@@ -7,12 +10,56 @@ from .error import *
 from .middelware import register_middlewares
 from src.ai_agents.router import ai_router
 from src.ai_agents.router_realtime import realtime_router
+from src.db.main import dispose_engine
+from src.db.mongo_db import close_mongo_clients
+from src.db.mongo_indexes import ensure_indexes, verify_query_shapes
+from src.db.local_cache import start_invalidation_listener, stop_invalidation_listener
+from src.users.hashing import shutdown_hash_executor
+from src.ai_agents.llm_provider import close_llm_clients
+from src.db.token_blocklist import start_blocklist_mirror, stop_blocklist_mirror
+from src.config import Config
 
 version = "v1"
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarrage / arrêt de l'application (ressources partagées du process)"""
+    # Index MongoDB (idempotent) : ne bloque pas le démarrage si Mongo est indisponible
+    if Config.MONGO_ENSURE_INDEXES_ON_STARTUP:
+        try:
+            await ensure_indexes()
+            if Config.MONGO_VERIFY_QUERY_SHAPES_ON_STARTUP:
+                for result in await verify_query_shapes():
+                    if not result["ok"]:
+                        logger.warning(f"Mongo query '{result['name']}' uses COLLSCAN: {result['stages']}")
+        except Exception as e:
+            logger.warning(f"Mongo index bootstrap skipped: {e}")
+
+    # Cache L1 : actif uniquement une fois abonné au canal d'invalidation
+    start_invalidation_listener()
+    # Blocklist des tokens : miroir local alimenté par le stream Redis
+    if Config.TOKEN_BLOCKLIST_MIRROR_ENABLED:
+        start_blocklist_mirror()
+
+    yield
+    await stop_blocklist_mirror()
+    await stop_invalidation_listener()
+    # Fermer proprement le pool PostgreSQL
+    await dispose_engine()
+    # Fermer les clients MongoDB du registre
+    close_mongo_clients()
+    shutdown_hash_executor()
+    # Fermer le transport HTTP partagé des clients LLM
+    await close_llm_clients()
+
+
 app = FastAPI(
     version=version,
     title="Backend du projet AI4D",
     description="Plateforme d'apprentissage IA scalable avec agents multi-tâches",
+    lifespan=lifespan,
 )
 
 # Register all custom exception handlers
@@ -2,15 +2,16 @@
 Agent Chatbot - Assistant conversationnel avec contexte utilisateur persistant.
 """
 from typing import Dict, Any, List, Optional
-from langchain_openai import ChatOpenAI
-from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage
-import json
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.prompt_builder import build_chat_prompt
 from datetime import datetime, UTC
 
 from src.config import Config
 from src.ai_agents.shared_context import shared_context_service
 
 
+CHATBOT_MODEL = "gpt-4o"
+
 CHATBOT_SYSTEM_PROMPT = """
 Tu es un assistant pédagogique IA expert et bienveillant qui aide les apprenants dans leur parcours d'apprentissage.
 
@@ -67,8 +68,8 @@ class ChatbotAgent:
     """
 
     def __init__(self):
-        # Lazy init pour éviter les problèmes de fork dans Celery
-        self.llm = None
+        # Poignée légère : les clients HTTP sont résolus à l'appel (réinitialisés après fork)
+        self.llm = get_chat_model(CHATBOT_MODEL, temperature=0.7, agent="ChatbotAgent")
         self.name = "ChatbotAgent"
 
     async def chat(
@@ -91,19 +92,13 @@ class ChatbotAgent:
             Réponse avec contexte et métadonnées
         """
         try:
-            # Initialiser le LLM à la première utilisation (dans le bon process)
-            if self.llm is None:
-                self.llm = ChatOpenAI(
-                    model="gpt-4o",
-                    api_key=Config.OPENAI_API_KEY,
-                    temperature=0.7
-                )
-
             # Récupérer le contexte partagé
             context = await shared_context_service.get_or_create_context(user_id, session_id)
 
-            # Récupérer l'historique récent de conversation
-            conversation_history = context.get("conversation_history", [])[-10:] if context else []
+            # Récupérer l'historique récent de conversation (fenêtre bornée)
+            conversation_history = await shared_context_service.get_recent_messages(
+                user_id, session_id, limit=Config.CHAT_HISTORY_MAX_MESSAGES, message_type="chat"
+            )
 
             # Construire le contexte utilisateur
             if not user_context:
@@ -111,39 +106,10 @@ class ChatbotAgent:
                 user_context = context_data.get("user_profile", {})
 
             user_level = user_context.get("niveau_technique", 5)
-            current_courses = user_context.get("current_courses", [])
-            strengths = user_context.get("strengths", [])
-            weaknesses = user_context.get("weaknesses", [])
-            learning_path = user_context.get("learning_path", {})
-
-            # Construire le contexte complet
-            context_str = f"""
-PROFIL APPRENANT :
-- Niveau : {user_level}/10
-- Forces : {', '.join(strengths) if strengths else 'Non identifiées'}
-- Faiblesses : {', '.join(weaknesses) if weaknesses else 'Non identifiées'}
-- Cours actifs : {len(current_courses)} cours en cours
-- Parcours : {learning_path.get('titre', 'Non défini')}
-
-PROGRESSION ACTUELLE :
-{json.dumps(user_context.get('progression', {}), indent=2, ensure_ascii=False)}
-"""
-
-            # Construire les messages pour le LLM
-            messages: List[BaseMessage] = [SystemMessage(content=CHATBOT_SYSTEM_PROMPT)]
-
-            # Ajouter le contexte utilisateur
-            messages.append(SystemMessage(content=f"CONTEXTE UTILISATEUR:\n{context_str}"))
 
-            # Ajouter l'historique de conversation
-            for hist in conversation_history[-5:]:  # 5 derniers échanges
-                if hist.get("role") == "user":
-                    messages.append(HumanMessage(content=hist.get("content", "")))
-                elif hist.get("role") == "assistant":
-                    messages.append(AIMessage(content=hist.get("content", "")))
-
-            # Ajouter le message actuel
-            messages.append(HumanMessage(content=message))
+            # Prompt sous budget de tokens (contexte compact, historique tronqué/résumé)
+            prompt = build_chat_prompt(CHATBOT_SYSTEM_PROMPT, user_context, conversation_history, message)
+            messages = prompt.as_langchain()
 
             # Obtenir la réponse
             response = await self.llm.ainvoke(messages)
@@ -185,7 +151,8 @@ PROGRESSION ACTUELLE :
                 "intention": intention,
                 "conversation_id": session_id,
                 "timestamp": datetime.now(UTC).isoformat(),
-                "suggestions": await self._generate_suggestions(intention, user_context)
+                "suggestions": await self._generate_suggestions(intention, user_context),
+                "prompt_tokens": prompt.stats()
             }
 
         except Exception as e:
@@ -293,19 +260,10 @@ PROGRESSION ACTUELLE :
         Récupérer l'historique de conversation.
         """
         try:
-            context = await shared_context_service.get_context(user_id, session_id)
-            if not context:
-                return []
-
-            history = context.conversation_history[-limit:]
-
-            # Filtrer uniquement les messages de chat
-            chat_history = [
-                msg for msg in history
-                if msg.get("message_type") == "chat"
-            ]
-
-            return chat_history
+            # Uniquement les messages de chat, lus directement en base
+            return await shared_context_service.get_recent_messages(
+                user_id, session_id, limit=limit, message_type="chat"
+            )
 
         except Exception as e:
             print(f"Erreur récupération historique: {e}")
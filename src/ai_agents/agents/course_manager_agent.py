@@ -1,13 +1,12 @@
 """
 Agent de gestion de cours - Gère les cours, modules, roadmaps et ressources.
 """
-from typing import Dict, Any, List, Optional
-from langchain_openai import ChatOpenAI
+from typing import Any, Callable, Dict, List, Optional
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import astream_llm_json
 from langchain_core.messages import HumanMessage, SystemMessage
-import json
 from datetime import datetime, timedelta, UTC
 
-from src.config import Config
 from src.ai_agents.shared_context import shared_context_service
 
 
@@ -218,11 +217,7 @@ class CourseManagerAgent:
     """
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.6  # Balance créativité et structure
-        )
+        self.llm = get_chat_model("gpt-4o", temperature=0.6, agent="CourseManagerAgent")  # Balance créativité et structure
         self.name = "CourseManagerAgent"
 
     async def create_course_roadmap(
@@ -230,7 +225,8 @@ class CourseManagerAgent:
         course_topic: str,
         user_level: int,
         user_objectives: str,
-        duration_weeks: int = 6
+        duration_weeks: int = 6,
+        on_module: Optional[Callable[[Dict[str, Any]], Any]] = None
     ) -> Dict[str, Any]:
         """
         Créer une roadmap de cours complète avec ressources.
@@ -240,6 +236,8 @@ class CourseManagerAgent:
             user_level: Niveau de l'utilisateur (1-10)
             user_objectives: Objectifs de l'utilisateur
             duration_weeks: Durée souhaitée en semaines
+            on_module: Appelé (fonction ou coroutine) avec chaque module dès
+                qu'il est complet dans le flux, avant la fin de la génération
 
         Returns:
             Roadmap complète du cours
@@ -274,16 +272,8 @@ Génère maintenant la roadmap complète en JSON.
                 """)
             ]
 
-            response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            # Parser JSON
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            roadmap = json.loads(response_text)
+            # Chaque module est transmis à on_module dès sa génération
+            roadmap = await astream_llm_json(self.llm, messages, on_item=on_module)
 
             # Ajouter métadonnées
             roadmap["meta"] = {
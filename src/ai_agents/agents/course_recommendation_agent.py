@@ -3,13 +3,12 @@ Agent de recommandation de ressources avec MCP (Model Context Protocol).
 Recherche et recommande des cours gratuits sur YouTube, Coursera, edX, etc.
 """
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import parse_llm_output
 from langchain_core.messages import HumanMessage, SystemMessage
-import json
 import httpx
 from urllib.parse import quote_plus
 
-from src.config import Config
 
 
 RECOMMENDATION_SYSTEM_PROMPT = """
@@ -84,11 +83,7 @@ class CourseRecommendationAgent:
     """Agent de recommandation avec recherche web (MCP)."""
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.5
-        )
+        self.llm = get_chat_model("gpt-4o", temperature=0.5, agent="CourseRecommendationAgent")
         self.name = "CourseRecommendationAgent"
 
     async def search_youtube_videos(
@@ -570,14 +565,7 @@ Retourne un JSON structuré.
 
         try:
             response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            roadmap = json.loads(response_text)
+            roadmap = parse_llm_output(response.content, self.llm.agent, self.llm.model_name)
 
             # Enrichir avec recherches réelles
             youtube_videos = await self.search_youtube_videos(user_objectives)
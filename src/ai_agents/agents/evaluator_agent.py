@@ -2,13 +2,13 @@
 Agent d'évaluation - Évalue les réponses avec focus sur les questions ouvertes.
 """
 from typing import Dict, Any  # List supprimé
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import parse_llm_output
 from langchain_core.messages import HumanMessage, SystemMessage
 
-from src.config import Config
 from src.ai_agents.agent_state import AgentState
 from src.ai_agents.shared_context import shared_context_service
-from src.ai_agents.agents.open_question_analyzer import open_question_analyzer
+from src.ai_agents.agents.open_question_analyzer import open_question_analyzer, heuristic_open_scores
 
 
 EVALUATOR_SYSTEM_PROMPT = """
@@ -110,11 +110,7 @@ class EvaluatorAgent:
     """
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",  # Modèle plus puissant pour l'évaluation
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.2  # Très faible pour objectivité
-        )
+        self.llm = get_chat_model("gpt-4o", temperature=0.2, agent="EvaluatorAgent")  # Très faible pour objectivité
         self.name = "EvaluatorAgent"
 
     def _deterministic_evaluation(self, questions: list, responses: list) -> Dict[str, Any]:  # changé async -> sync
@@ -142,30 +138,11 @@ class EvaluatorAgent:
 
             if q_type in open_types:
                 # Score 0 si réponse absente ou vide
+                score_components = heuristic_open_scores(user_answer)
+                avg_score = sum(score_components.values()) / 4.0
                 if not user_answer or not str(user_answer).strip():
-                    score_components = {
-                        "sens_coherence": 0,
-                        "profondeur": 0,
-                        "precision": 0,
-                        "exhaustivite": 0
-                    }
-                    avg_score = 0.0
                     comment = "Réponse manquante → score 0"
                 else:
-                    # Pour une première version déterministe sans LLM, on applique un heuristique simple
-                    text = str(user_answer).strip()
-                    length = len(text.split())
-                    tech_terms = sum(1 for t in ["réseau", "neurone", "gradient", "perte", "loss", "backpropagation", "activation", "couche", "transformer", "attention"] if t.lower() in text.lower())
-                    score_components = {
-                        "sens_coherence": 5 if length >= 5 else 3,
-                        "profondeur": 2 + min(5, tech_terms),
-                        "precision": 3 + min(4, tech_terms // 2),
-                        "exhaustivite": 2 + (2 if length > 30 else 0) + (2 if tech_terms >= 3 else 0)
-                    }
-                    # Clamp 0-10
-                    for k, v in score_components.items():
-                        score_components[k] = max(0, min(10, v))
-                    avg_score = sum(score_components.values()) / 4.0
                     comment = "Heuristique appliquée (sans LLM)"
                 open_scores.append(avg_score)
                 open_analysis.append({
@@ -413,12 +390,7 @@ class EvaluatorAgent:
         ]
         try:
             llm_resp = await self.llm.ainvoke(messages)
-            llm_text = llm_resp.content
-            if "```json" in llm_text:
-                llm_text = llm_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in llm_text:
-                llm_text = llm_text.split("```")[1].split("```")[0].strip()
-            enriched = json.loads(llm_text)
+            enriched = parse_llm_output(llm_resp.content, self.llm.agent, self.llm.model_name)
         except Exception:
             enriched = {}
 
@@ -2,13 +2,18 @@
 Analyseur approfondi de questions ouvertes avec GPT-4.
 Évalue le sens, la profondeur et la qualité des réponses ouvertes.
 """
-from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from typing import Dict, Any, List, Optional, Tuple
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import parse_llm_output
 from langchain_core.messages import HumanMessage, SystemMessage
-import json
+import asyncio
+import logging
 
 from src.config import Config
 
+logger = logging.getLogger("open_question_analyzer")
+logger.setLevel(logging.INFO)
+
 
 OPEN_QUESTION_ANALYSIS_PROMPT = """
 Tu es un expert en évaluation pédagogique spécialisé en Intelligence Artificielle.
@@ -93,51 +98,136 @@ FORMAT JSON STRICT :
 """
 
 
+OPEN_QUESTION_BATCH_INSTRUCTIONS = """
+Tu reçois PLUSIEURS réponses numérotées. Analyse chacune indépendamment,
+avec les mêmes critères et le même format qu'une analyse unique.
+
+FORMAT JSON STRICT :
+{
+  "analyses": [
+    {"index": 1, "scores": {...}, "score_global": ..., "niveau_reel_estime": ..., "niveau_label": "...",
+     "feedback": "...", "points_forts": [...], "points_amelioration": [...], "suggestions": [...]}
+  ]
+}
+Une entrée par réponse, dans l'ordre, avec son "index".
+"""
+
+HEURISTIC_TECH_TERMS = [
+    "réseau", "neurone", "gradient", "perte", "loss", "backpropagation",
+    "activation", "couche", "transformer", "attention"
+]
+
+
+def heuristic_open_scores(user_answer: Any) -> Dict[str, int]:
+    """
+    Scores heuristiques (sans LLM) d'une réponse ouverte, sur les critères de
+    l'évaluation déterministe. Réponse absente ou vide -> 0 partout.
+    """
+    if not user_answer or not str(user_answer).strip():
+        return {"sens_coherence": 0, "profondeur": 0, "precision": 0, "exhaustivite": 0}
+
+    text = str(user_answer).strip()
+    length = len(text.split())
+    tech_terms = sum(1 for t in HEURISTIC_TECH_TERMS if t.lower() in text.lower())
+    score_components = {
+        "sens_coherence": 5 if length >= 5 else 3,
+        "profondeur": 2 + min(5, tech_terms),
+        "precision": 3 + min(4, tech_terms // 2),
+        "exhaustivite": 2 + (2 if length > 30 else 0) + (2 if tech_terms >= 3 else 0)
+    }
+    # Clamp 0-10
+    return {k: max(0, min(10, v)) for k, v in score_components.items()}
+
+
+def _niveau_from_score(score: float) -> Tuple[int, str]:
+    """Niveau estimé (1-10) et libellé à partir d'un score moyen sur 10."""
+    if score <= 2.5:
+        return 2, "Débutant"
+    if score <= 4:
+        return 3, "Débutant+"
+    if score <= 5.5:
+        return 5, "Intermédiaire bas"
+    if score <= 7:
+        return 6, "Intermédiaire"
+    if score <= 8:
+        return 7, "Intermédiaire avancé"
+    if score <= 9:
+        return 8, "Avancé"
+    return 10, "Expert"
+
+
+def _empty_answer_analysis() -> Dict[str, Any]:
+    return {
+        "scores": {
+            "comprehension": 0,
+            "profondeur": 0,
+            "exemples": 0,
+            "clarte": 0
+        },
+        "score_global": 0.0,
+        "niveau_reel_estime": 1,
+        "niveau_label": "Débutant absolu",
+        "feedback": "Aucune réponse fournie. Il est essentiel de répondre aux questions ouvertes pour évaluer ton niveau réel.",
+        "points_forts": [],
+        "points_amelioration": ["Prendre le temps de formuler une réponse"],
+        "suggestions": ["Réessayer en expliquant avec tes propres mots"]
+    }
+
+
+def _complete_analysis(analysis: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    score_global (et niveau) recalculés depuis `scores` quand le LLM les omet ;
+    lève ValueError si aucun score n'est exploitable (repli heuristique).
+    """
+    if not isinstance(analysis.get("score_global"), (int, float)):
+        scores = analysis.get("scores")
+        values = [v for v in scores.values() if isinstance(v, (int, float))] if isinstance(scores, dict) else []
+        if not values:
+            raise ValueError("analysis without usable scores")
+        analysis["score_global"] = round(sum(values) / len(values), 2)
+    if "niveau_reel_estime" not in analysis:
+        analysis["niveau_reel_estime"], analysis["niveau_label"] = _niveau_from_score(analysis["score_global"])
+    return analysis
+
+
+def heuristic_analysis(user_answer: Any, error: str) -> Dict[str, Any]:
+    """Analyse de repli (LLM en erreur ou trop lent), au format de l'analyse GPT-4."""
+    components = heuristic_open_scores(user_answer)
+    scores = {
+        "comprehension": components["sens_coherence"],
+        "profondeur": components["profondeur"],
+        "exemples": components["exhaustivite"],
+        "clarte": components["precision"]
+    }
+    score_global = round(sum(scores.values()) / 4.0, 2)
+    niveau, label = _niveau_from_score(score_global)
+    return {
+        "scores": scores,
+        "score_global": score_global,
+        "niveau_reel_estime": niveau,
+        "niveau_label": label,
+        "feedback": "Analyse automatique indisponible. Score estimé par heuristique.",
+        "points_forts": [],
+        "points_amelioration": [],
+        "suggestions": [],
+        "fallback": "heuristic",
+        "error": error
+    }
+
+
 class OpenQuestionAnalyzer:
     """Analyseur approfondi de questions ouvertes avec GPT-4."""
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",  # GPT-4 pour analyse de qualité
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.3  # Peu de créativité, plus de précision
-        )
+        self.llm = get_chat_model("gpt-4o", temperature=0.3, agent="OpenQuestionAnalyzer")  # Peu de créativité, plus de précision
 
-    async def analyze_open_question(
+    async def _llm_analysis(
         self,
         question: str,
         user_answer: str,
         expected_answer: str = None
     ) -> Dict[str, Any]:
-        """
-        Analyse une réponse à une question ouverte en profondeur.
-
-        Args:
-            question: La question posée
-            user_answer: La réponse de l'utilisateur
-            expected_answer: Réponse attendue/correction (optionnel)
-
-        Returns:
-            Dict avec scores détaillés et feedback
-        """
-        # Cas de réponse vide
-        if not user_answer or not str(user_answer).strip():
-            return {
-                "scores": {
-                    "comprehension": 0,
-                    "profondeur": 0,
-                    "exemples": 0,
-                    "clarte": 0
-                },
-                "score_global": 0.0,
-                "niveau_reel_estime": 1,
-                "niveau_label": "Débutant absolu",
-                "feedback": "Aucune réponse fournie. Il est essentiel de répondre aux questions ouvertes pour évaluer ton niveau réel.",
-                "points_forts": [],
-                "points_amelioration": ["Prendre le temps de formuler une réponse"],
-                "suggestions": ["Réessayer en expliquant avec tes propres mots"]
-            }
-
+        """Un appel LLM pour une réponse ; lève une exception si le résultat est inexploitable."""
         context = ""
         if expected_answer:
             context = f"\n\nRÉPONSE ATTENDUE (pour référence) :\n{expected_answer}"
@@ -163,98 +253,153 @@ Retourne un JSON avec les scores, le niveau estimé et un feedback constructif.
             """)
         ]
 
-        try:
-            response = await self.llm.ainvoke(messages)
-            response_text = response.content
+        response = await self.llm.ainvoke(messages)
+        return _complete_analysis(parse_llm_output(response.content, self.llm.agent, self.llm.model_name))
 
-            # Nettoyer et parser JSON
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            analysis = json.loads(response_text)
+    async def analyze_open_question(
+        self,
+        question: str,
+        user_answer: str,
+        expected_answer: str = None,
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Analyse une réponse à une question ouverte en profondeur.
 
-            # Validation basique
-            if not isinstance(analysis, dict) or "scores" not in analysis:
-                raise ValueError("Format d'analyse invalide")
+        Args:
+            question: La question posée
+            user_answer: La réponse de l'utilisateur
+            expected_answer: Réponse attendue/correction (optionnel)
+            timeout: Délai max de l'appel LLM (OPEN_QUESTION_TIMEOUT_SECONDS par défaut)
 
-            return analysis
+        Returns:
+            Dict avec scores détaillés et feedback (heuristique si le LLM échoue)
+        """
+        # Cas de réponse vide
+        if not user_answer or not str(user_answer).strip():
+            return _empty_answer_analysis()
 
+        try:
+            return await asyncio.wait_for(
+                self._llm_analysis(question, user_answer, expected_answer),
+                timeout=timeout or Config.OPEN_QUESTION_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Open question analysis timed out, heuristic fallback")
+            return heuristic_analysis(user_answer, "timeout")
         except Exception as e:
-            print(f"❌ Erreur analyse question ouverte: {e}")
-            # Fallback en cas d'erreur
-            return {
-                "scores": {
-                    "comprehension": 5,
-                    "profondeur": 5,
-                    "exemples": 5,
-                    "clarte": 5
-                },
-                "score_global": 5.0,
-                "niveau_reel_estime": 5,
-                "niveau_label": "Intermédiaire",
-                "feedback": "Analyse automatique indisponible. Réponse enregistrée.",
-                "points_forts": [],
-                "points_amelioration": [],
-                "suggestions": [],
-                "error": str(e)
-            }
+            logger.warning(f"Open question analysis failed, heuristic fallback: {e}")
+            return heuristic_analysis(user_answer, str(e))
+
+    async def _analyze_concurrently(self, questions_and_answers: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """Un appel LLM par réponse, au plus OPEN_QUESTION_CONCURRENCY en parallèle."""
+        semaphore = asyncio.Semaphore(Config.OPEN_QUESTION_CONCURRENCY)
+
+        async def analyze(qa: Dict[str, str]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.analyze_open_question(
+                    question=qa.get("question", ""),
+                    user_answer=qa.get("user_answer", ""),
+                    expected_answer=qa.get("expected_answer")
+                )
+
+        return list(await asyncio.gather(*(analyze(qa) for qa in questions_and_answers)))
+
+    async def _analyze_in_batch(self, questions_and_answers: List[Dict[str, str]]) -> List[Dict[str, Any]]:
+        """
+        Un seul appel LLM pour toutes les réponses non vides. Les entrées
+        absentes ou invalides du résultat retombent sur l'heuristique.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(questions_and_answers)
+        to_analyze = []
+        for i, qa in enumerate(questions_and_answers):
+            if not qa.get("user_answer") or not str(qa.get("user_answer")).strip():
+                results[i] = _empty_answer_analysis()
+            else:
+                to_analyze.append(i)
+
+        if to_analyze:
+            blocks = []
+            for index, i in enumerate(to_analyze, start=1):
+                qa = questions_and_answers[i]
+                block = f"### RÉPONSE {index}\nQUESTION :\n{qa.get('question', '')}\n\nRÉPONSE DE L'UTILISATEUR :\n{qa.get('user_answer', '')}"
+                if qa.get("expected_answer"):
+                    block += f"\n\nRÉPONSE ATTENDUE (pour référence) :\n{qa['expected_answer']}"
+                blocks.append(block)
+
+            messages = [
+                SystemMessage(content=OPEN_QUESTION_ANALYSIS_PROMPT + OPEN_QUESTION_BATCH_INSTRUCTIONS),
+                HumanMessage(content="Analyse ces réponses à des questions ouvertes d'évaluation en IA.\n\n" + "\n\n".join(blocks))
+            ]
+
+            by_index: Dict[int, Dict[str, Any]] = {}
+            error = "missing from batch response"
+            try:
+                response = await asyncio.wait_for(
+                    self.llm.ainvoke(messages),
+                    timeout=Config.OPEN_QUESTION_BATCH_TIMEOUT_SECONDS
+                )
+                parsed = parse_llm_output(
+                    response.content, self.llm.agent, self.llm.model_name, schema="OpenQuestionAnalyzer:batch"
+                )
+                for position, entry in enumerate(parsed["analyses"], start=1):
+                    index = int(entry.pop("index", position))
+                    try:
+                        by_index[index] = _complete_analysis(entry)
+                    except ValueError:
+                        continue  # entrée inexploitable : heuristique ci-dessous
+            except asyncio.TimeoutError:
+                error = "timeout"
+                logger.warning("Batch open question analysis timed out, heuristic fallback")
+            except Exception as e:
+                error = str(e)
+                logger.warning(f"Batch open question analysis failed, heuristic fallback: {e}")
+
+            for index, i in enumerate(to_analyze, start=1):
+                results[i] = by_index.get(index) or heuristic_analysis(
+                    questions_and_answers[i].get("user_answer"), error
+                )
+
+        return results
 
     async def analyze_multiple_open_questions(
         self,
-        questions_and_answers: List[Dict[str, str]]
+        questions_and_answers: List[Dict[str, str]],
+        batch: Optional[bool] = None
     ) -> Dict[str, Any]:
         """
-        Analyse plusieurs questions ouvertes en batch.
+        Analyse plusieurs questions ouvertes : en parallèle (un appel par
+        réponse, concurrence bornée) ou, en mode batch, en un seul appel.
 
         Args:
             questions_and_answers: Liste de {question, user_answer, expected_answer}
+            batch: Un seul prompt pour toutes les réponses (OPEN_QUESTION_BATCH_MODE par défaut)
 
         Returns:
             Dict avec analyses individuelles et synthèse globale
         """
-        analyses = []
+        if batch is None:
+            batch = Config.OPEN_QUESTION_BATCH_MODE
 
-        for qa in questions_and_answers:
-            analysis = await self.analyze_open_question(
-                question=qa.get("question", ""),
-                user_answer=qa.get("user_answer", ""),
-                expected_answer=qa.get("expected_answer")
-            )
+        if batch:
+            analyses = await self._analyze_in_batch(questions_and_answers)
+        else:
+            analyses = await self._analyze_concurrently(questions_and_answers)
 
+        for analysis, qa in zip(analyses, questions_and_answers):
             # Ajouter la question au résultat
             analysis["question"] = qa.get("question", "")
             analysis["user_answer"] = qa.get("user_answer", "")
 
-            analyses.append(analysis)
+        return self._summarize(analyses)
 
+    @staticmethod
+    def _summarize(analyses: List[Dict[str, Any]]) -> Dict[str, Any]:
         # Calculer la moyenne globale
         if analyses:
             avg_score = sum(a["score_global"] for a in analyses) / len(analyses)
-
             # Estimer le niveau global
-            if avg_score <= 2.5:
-                niveau_global = 2
-                niveau_label_global = "Débutant"
-            elif avg_score <= 4:
-                niveau_global = 3
-                niveau_label_global = "Débutant+"
-            elif avg_score <= 5.5:
-                niveau_global = 5
-                niveau_label_global = "Intermédiaire bas"
-            elif avg_score <= 7:
-                niveau_global = 6
-                niveau_label_global = "Intermédiaire"
-            elif avg_score <= 8:
-                niveau_global = 7
-                niveau_label_global = "Intermédiaire avancé"
-            elif avg_score <= 9:
-                niveau_global = 8
-                niveau_label_global = "Avancé"
-            else:
-                niveau_global = 10
-                niveau_label_global = "Expert"
+            niveau_global, niveau_label_global = _niveau_from_score(avg_score)
         else:
             avg_score = 0
             niveau_global = 1
@@ -282,6 +427,7 @@ Retourne un JSON avec les scores, le niveau estimé et un feedback constructif.
                 "niveau_estime": niveau_global,
                 "niveau_label": niveau_label_global,
                 "nombre_questions": len(analyses),
+                "nombre_replis_heuristiques": sum(1 for a in analyses if a.get("fallback")),
                 "points_forts_globaux": all_strengths[:5],  # Top 5
                 "points_amelioration_globaux": all_improvements[:5],
                 "suggestions_globales": all_suggestions[:5]
@@ -291,4 +437,3 @@ Retourne un JSON avec les scores, le niveau estimé et un feedback constructif.
 
 # Instance globale
 open_question_analyzer = OpenQuestionAnalyzer()
-
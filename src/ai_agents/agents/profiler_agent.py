@@ -3,11 +3,11 @@ Agent de profilage - Analyse le profil utilisateur et adapte l'expérience.
 Utilise LangGraph pour orchestration et contexte partagé.
 """
 from typing import Dict, Any
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import parse_llm_output
 from langchain_core.messages import HumanMessage, SystemMessage
 import json
 
-from src.config import Config
 from src.ai_agents.agent_state import AgentState
 from src.ai_agents.shared_context import shared_context_service
 
@@ -51,11 +51,7 @@ class ProfilerAgent:
     """
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.3  # Faible température pour analyse objective
-        )
+        self.llm = get_chat_model("gpt-4o-mini", temperature=0.3, agent="ProfilerAgent")  # Faible température pour analyse objective
         self.name = "ProfilerAgent"
 
     async def analyze(self, state: AgentState) -> Dict[str, Any]:
@@ -89,16 +85,7 @@ Donne ton analyse en JSON.
 
         try:
             response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            # Parser la réponse JSON
-            # Nettoyer les markdown code blocks si présents
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            analysis = json.loads(response_text)
+            analysis = parse_llm_output(response.content, self.llm.agent, self.llm.model_name)
 
             # Enregistrer dans le contexte partagé
             await shared_context_service.add_message(
@@ -2,11 +2,11 @@
 Agent générateur de questions - Génère des questions adaptées au profil.
 """
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import astream_llm_json
 from langchain_core.messages import HumanMessage, SystemMessage
 import json
 
-from src.config import Config
 from src.ai_agents.agent_state import AgentState
 from src.ai_agents.shared_context import shared_context_service
 
@@ -30,11 +30,7 @@ class QuestionGeneratorAgent:
     """
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.7  # Créativité modérée pour variété
-        )
+        self.llm = get_chat_model("gpt-4o-mini", temperature=0.7, agent="QuestionGeneratorAgent")  # Créativité modérée pour variété
         self.name = "QuestionGeneratorAgent"
 
     async def generate_questions(
@@ -98,20 +94,8 @@ Génère maintenant les questions en JSON uniquement (pas de texte avant/après)
         ]
 
         try:
-            response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            # Nettoyer et parser JSON
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            questions = json.loads(response_text)
-
-            # Validation basique
-            if not isinstance(questions, list) or len(questions) == 0:
-                raise ValueError("Format de questions invalide")
+            # En streaming : une réponse coupée garde ses questions complètes
+            questions = await astream_llm_json(self.llm, messages)
 
             # Supprimer/convertir toute question VraiOuFaux résiduelle
             cleaned_questions = []
@@ -2,11 +2,10 @@
 Agent de tutorat personnalisé - Accompagne l'utilisateur dans son apprentissage.
 """
 from typing import Dict, Any, List
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
+from src.ai_agents.llm_json import parse_llm_output
 from langchain_core.messages import HumanMessage, SystemMessage
-import json
 
-from src.config import Config
 from src.ai_agents.agent_state import AgentState
 from src.ai_agents.shared_context import shared_context_service
 
@@ -79,11 +78,7 @@ class TutoringAgent:
     """Agent de tutorat personnalisé."""
 
     def __init__(self):
-        self.llm = ChatOpenAI(
-            model="gpt-4o",
-            api_key=Config.OPENAI_API_KEY,
-            temperature=0.7  # Créativité pour explications variées
-        )
+        self.llm = get_chat_model("gpt-4o", temperature=0.7, agent="TutoringAgent")  # Créativité pour explications variées
         self.name = "TutoringAgent"
 
     async def explain_concept(
@@ -151,15 +146,9 @@ Retourne un JSON avec :
 
         try:
             response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            # Parser JSON
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            explanation = json.loads(response_text)
+            explanation = parse_llm_output(
+                response.content, self.llm.agent, self.llm.model_name, schema="TutoringAgent:explain"
+            )
 
             return {
                 "status": "success",
@@ -234,14 +223,9 @@ Retourne un JSON :
 
         try:
             response = await self.llm.ainvoke(messages)
-            response_text = response.content
-
-            if "```json" in response_text:
-                response_text = response_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in response_text:
-                response_text = response_text.split("```")[1].split("```")[0].strip()
-
-            result = json.loads(response_text)
+            result = parse_llm_output(
+                response.content, self.llm.agent, self.llm.model_name, schema="TutoringAgent:exercises"
+            )
             return result.get("exercices", [])
 
         except Exception as e:
@@ -274,7 +258,9 @@ Retourne un JSON :
                 "message": "Pas assez de données pour détecter des difficultés"
             }
 
-        conversation_history = context.get("conversation_history", [])
+        conversation_history = await shared_context_service.get_recent_messages(
+            user_id, session_id, limit=20
+        )
 
         # Analyser l'historique
         repeated_topics = []
@@ -282,8 +268,8 @@ Retourne un JSON :
 
         # Détecter les sujets qui reviennent (difficultés potentielles)
         topic_counts = {}
-        for msg in conversation_history[-20:]:  # 20 derniers messages
-            content = msg.get("content", "").lower()
+        for msg in conversation_history:  # 20 derniers messages
+            content = msg.get("message", "").lower()
 
             # Mots-clés de confusion
             if any(word in content for word in ["je ne comprends pas", "confus", "difficile", "compliqué"]):
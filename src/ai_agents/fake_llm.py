@@ -0,0 +1,491 @@
+"""
+Faux backend LLM, sélectionné par LLM_BACKEND=fake.
+
+Sert aux tests de charge des chemins IA sans appel à OpenAI : llm_provider
+retourne un FakeChatModel à la place de ChatOpenAI (même interface
+ainvoke/invoke/astream/stream, AIMessage avec usage_metadata) et un
+FakeOpenAIClient à la place du client OpenAI brut (streaming du chatbot).
+
+- Latence : premier token tiré d'une loi log-normale (médiane
+  LLM_FAKE_LATENCY_MEDIAN_MS, dispersion LLM_FAKE_LATENCY_SIGMA), puis la
+  réponse est générée à LLM_FAKE_TOKENS_PER_SECOND ; en streaming, les
+  morceaux arrivent à ce rythme.
+- Réponses : une réponse par agent (libellé passé à get_chat_model), au
+  format que son parseur attend ; LLM_FAKE_RESPONSES_FILE permet de les
+  remplacer. Pour un agent inconnu, l'exemple JSON du prompt est renvoyé,
+  à défaut un texte.
+- Déterminisme : tirages seedés par LLM_FAKE_SEED, le prompt et le rang de
+  l'appel pour ce prompt ; deux runs identiques produisent les mêmes
+  latences et les mêmes réponses.
+- LLM_FAKE_ERROR_RATE : proportion d'appels qui échouent (chemins de repli).
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from src.config import Config
+from src.ai_agents.prompt_builder import count_tokens
+
+logger = logging.getLogger("fake_llm")
+logger.setLevel(logging.INFO)
+
+CHUNK_CHARS = 16  # ~4 tokens par morceau en streaming
+
+Messages = List[Tuple[str, str]]
+
+
+class FakeLLMError(RuntimeError):
+    """Échec simulé (LLM_FAKE_ERROR_RATE)."""
+
+
+def _as_messages(input: Any) -> Messages:
+    """(rôle, contenu) depuis une chaîne, des messages langchain ou des dicts OpenAI."""
+    if isinstance(input, str):
+        return [("user", input)]
+    if hasattr(input, "to_messages"):
+        input = input.to_messages()
+    messages = []
+    for m in input or []:
+        if isinstance(m, dict):
+            messages.append((m.get("role", "user"), str(m.get("content") or "")))
+        elif isinstance(m, (tuple, list)):
+            messages.append((str(m[0]), str(m[1])))
+        else:
+            messages.append((getattr(m, "type", "user"), str(getattr(m, "content", ""))))
+    return messages
+
+
+def _last(messages: Messages) -> str:
+    return messages[-1][1] if messages else ""
+
+
+# --- Réponses par agent ---
+TOPICS = [
+    "la rétropropagation", "le surapprentissage", "les réseaux convolutifs", "l'attention dans les Transformers",
+    "la régularisation", "la descente de gradient", "les embeddings", "la validation croisée",
+    "les arbres de décision", "le clustering", "les fonctions d'activation", "le fine-tuning",
+]
+SENTENCES = [
+    "Bonne question, reprenons le principe étape par étape.",
+    "L'idée clé est d'ajuster les paramètres du modèle pour réduire l'erreur sur les données d'entraînement.",
+    "Un exemple concret aide souvent : imagine un modèle qui apprend à reconnaître des chiffres manuscrits.",
+    "Attention à ne pas confondre performance sur l'entraînement et capacité de généralisation.",
+    "Tu peux vérifier ta compréhension en implémentant une version simple avec NumPy.",
+    "Les bibliothèques comme scikit-learn ou PyTorch encapsulent ces étapes, mais les comprendre reste essentiel.",
+    "Dans la pratique, on surveille une métrique sur un jeu de validation séparé.",
+    "N'hésite pas à me demander un exercice pour t'entraîner sur ce point.",
+]
+QUESTION_TYPES = ["ChoixMultiple"] * 4 + ["QuestionOuverte"] * 3 + ["ListeOuverte"] * 3
+
+
+def _text(rng: random.Random, words: Optional[int] = None) -> str:
+    words = words or Config.LLM_FAKE_RESPONSE_WORDS
+    parts: List[str] = []
+    while sum(len(p.split()) for p in parts) < words:
+        parts.append(rng.choice(SENTENCES))
+    return " ".join(parts)
+
+
+def _requested_count(text: str, default: int) -> int:
+    match = re.search(r"(\d+)\s+questions", text)
+    return int(match.group(1)) if match else default
+
+
+def _questions(messages: Messages, rng: random.Random) -> List[Dict[str, Any]]:
+    count = _requested_count(" ".join(content for _, content in messages), 10)
+    questions = []
+    for i in range(1, count + 1):
+        q_type = QUESTION_TYPES[(i - 1) % len(QUESTION_TYPES)]
+        topic = rng.choice(TOPICS)
+        ref = rng.randrange(16 ** 6)
+        if q_type == "ChoixMultiple":
+            options = [f"Proposition {letter} sur {topic}" for letter in "ABCD"]
+            questions.append({
+                "numero": i, "type": q_type,
+                "question": f"Quelle affirmation décrit le mieux {topic} ? (réf. {ref:06x})",
+                "options": options, "correction": rng.choice(options),
+            })
+        elif q_type == "QuestionOuverte":
+            questions.append({
+                "numero": i, "type": q_type,
+                "question": f"Explique avec tes mots {topic} et donne un exemple d'usage. (réf. {ref:06x})",
+                "options": [], "correction": f"Définition de {topic}, intuition et exemple concret.",
+            })
+        else:
+            questions.append({
+                "numero": i, "type": q_type,
+                "question": f"Cite trois notions liées à {topic}. (réf. {ref:06x})",
+                "options": [], "correction": "Toute liste de trois notions pertinentes.",
+            })
+    return questions
+
+
+def _open_analysis(rng: random.Random) -> Dict[str, Any]:
+    scores = {k: rng.randint(3, 9) for k in ("comprehension", "profondeur", "exemples", "clarte")}
+    score = round(sum(scores.values()) / 4, 2)
+    return {
+        "scores": scores,
+        "score_global": score,
+        "niveau_reel_estime": max(1, min(10, round(score))),
+        "niveau_label": "Intermédiaire" if score >= 5 else "Débutant",
+        "feedback": rng.choice(SENTENCES),
+        "points_forts": ["Vocabulaire juste"],
+        "points_amelioration": ["Ajouter un exemple concret"],
+        "suggestions": ["Implémenter une version simple du concept"],
+    }
+
+
+def _open_questions(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    items = _last(messages).count("### RÉPONSE")
+    if not items:
+        return _open_analysis(rng)
+    return {"analyses": [{"index": i, **_open_analysis(rng)} for i in range(1, items + 1)]}
+
+
+def _profiler(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "estimated_level": rng.randint(2, 8),
+        "learning_style": rng.choice(["practical", "theoretical", "visual", "balanced"]),
+        "priority_domains": rng.sample(["machine_learning", "deep_learning", "nlp", "computer_vision"], 2),
+        "question_strategy": "mix_conceptual_practical",
+        "learning_pace": rng.choice(["slow", "moderate", "fast"]),
+        "profiling_notes": _text(rng, 25),
+        "recommended_first_topics": ["neural_networks", "backpropagation"],
+    }
+
+
+def _evaluator(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "forces_identifiees": rng.sample(["Bonne compréhension des CNN", "Maîtrise de la fonction de perte",
+                                          "Intuition correcte du surapprentissage"], 2),
+        "faiblesses_identifiees": rng.sample(["Confusion sur la rétropropagation", "Peu d'exemples concrets",
+                                              "Architecture Transformer méconnue"], 2),
+        "recommandations": ["Refaire la rétropropagation à la main sur un petit réseau",
+                            "Étudier le mécanisme d'attention"],
+    }
+
+
+def _tutoring(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    exercise = {
+        "titre": f"Exercice sur {rng.choice(TOPICS)}", "description": _text(rng, 20), "objectif": "Pratiquer",
+        "difficulte": "moyen", "temps_estime": "30 minutes", "indices": ["Commencer petit"],
+        "technologies": ["Python", "NumPy"],
+    }
+    if '"exercices"' in _last(messages):
+        return {"exercices": [exercise, {**exercise, "titre": f"Exercice sur {rng.choice(TOPICS)}"}]}
+    return {
+        "explication": _text(rng, 80),
+        "analogie": rng.choice(SENTENCES),
+        "exemple_code": "import numpy as np\nw = np.zeros(3)",
+        "points_cles": ["Point 1", "Point 2", "Point 3"],
+        "exercices_proposes": [{k: exercise[k] for k in ("titre", "description", "difficulte", "temps_estime")}],
+        "ressources_complementaires": [{"titre": "Vidéo recommandée", "url": "https://www.youtube.com/", "type": "video"}],
+        "prochaine_etape": "Passer aux réseaux convolutifs",
+        "encouragement": "Continue comme ça !",
+    }
+
+
+def _weeks(text: str, default: int) -> int:
+    match = re.search(r"(\d+)\s+(?:modules|semaines)", text)
+    return min(int(match.group(1)), 52) if match else default
+
+
+def _course_roadmap(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    weeks = _weeks(_last(messages), 6)
+    topic = rng.choice(TOPICS)
+    modules = [
+        {
+            "id": f"module_{m}", "ordre": m, "titre": f"Module {m} : {rng.choice(TOPICS)}",
+            "description": _text(rng, 20), "duree_estimee": "1 semaine (8-10h)",
+            "objectifs": ["Comprendre", "Pratiquer"],
+            "lecons": [
+                {"id": f"lesson_{m}_{l}", "ordre": l, "titre": f"Leçon {m}.{l}", "type": "theorie", "duree": "45 min"}
+                for l in range(1, 4)
+            ],
+        }
+        for m in range(1, weeks + 1)
+    ]
+    return {
+        "cours": {
+            "id": f"course_fake_{rng.randrange(16 ** 8):08x}", "titre": f"Maîtriser {topic}",
+            "description": _text(rng, 30), "niveau": "Intermédiaire", "duree_totale": f"{weeks} semaines",
+            "objectifs": ["Comprendre les bases", "Réaliser un projet"], "prerequis": ["Python de base"],
+            "tags": ["ia", "machine-learning"],
+        },
+        "roadmap": {"progression_type": "linéaire", "modules_count": weeks, "total_lessons": weeks * 3,
+                    "total_exercises": weeks * 2, "total_projects": weeks},
+        "modules": modules,
+    }
+
+
+def _learning_roadmap(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    weeks = _weeks(_last(messages), 12)
+    return {
+        "ressources_recommandees": [
+            {"titre": f"Cours sur {rng.choice(TOPICS)}", "url": "https://www.coursera.org/", "type": "cours",
+             "plateforme": "Coursera", "gratuit": True, "langue": "fr", "niveau_requis": "débutant",
+             "description": _text(rng, 15)}
+            for _ in range(3)
+        ],
+        "roadmap_suggeree": [
+            {"etape": e, "titre": f"Étape {e} : {rng.choice(TOPICS)}", "ressources": ["ressource_1"],
+             "duree_totale": "8h", "objectif": "Consolider les bases"}
+            for e in range(1, max(1, weeks // 2) + 1)
+        ],
+        "projets_pratiques": [
+            {"titre": "Mini-projet : classification d'images", "difficulte": "facile", "duree": "3h",
+             "lien_starter": "https://github.com/", "description": _text(rng, 15)}
+        ],
+    }
+
+
+def _profile_analysis(messages: Messages, rng: random.Random) -> Dict[str, Any]:
+    niveau = rng.randint(2, 8)
+    return {
+        "niveau": niveau,
+        "niveau_reel": ["novice", "débutant", "apprenti", "initié", "intermédiaire", "confirmé", "avancé", "expert"][niveau - 1],
+        "domaine_application": "Général",
+        "score_questions_ouvertes": round(rng.uniform(3, 9), 1),
+        "score_qcm": round(rng.uniform(4, 10), 1),
+        "comprehension_profonde": "moyenne",
+        "capacite_explication": "bonne",
+        "profil_utilisateur": "etudiant",
+        "competences": ["Python", "Machine Learning"],
+        "objectifs": "Consolider les fondamentaux puis se spécialiser",
+        "motivation": "Forte",
+        "energie": rng.randint(5, 9),
+        "preferences": {"domaine_application": "Général", "themes": ["ml"], "style_apprentissage": "mixte",
+                        "domaines_a_renforcer": ["mathématiques"], "points_forts": ["curiosité"]},
+        "recommandations": ["Pratiquer sur des jeux de données réels"] * 3,
+        "commentaires": _text(rng, 30),
+    }
+
+
+def _chat(messages: Messages, rng: random.Random) -> str:
+    return _text(rng)
+
+
+RESPONDERS: Dict[str, Callable[[Messages, random.Random], Any]] = {
+    "ProfilerAgent": _profiler,
+    "QuestionGeneratorAgent": _questions,
+    "generate_profile_question": _questions,
+    "EvaluatorAgent": _evaluator,
+    "OpenQuestionAnalyzer": _open_questions,
+    "TutoringAgent": _tutoring,
+    "CourseManagerAgent": _course_roadmap,
+    "CourseRecommendationAgent": _learning_roadmap,
+    "analyze_profile_with_llm": _profile_analysis,
+    "ChatbotAgent": _chat,
+    "chatbot_streaming_task": _chat,
+}
+
+
+def _prompt_example(messages: Messages) -> Any:
+    """Premier exemple JSON valide annoncé par « JSON » (dernier message, puis les précédents)."""
+    decoder = json.JSONDecoder()
+    for _, content in reversed(messages):
+        for mention in re.finditer("JSON", content):
+            for match in re.finditer(r"[\[{]", content[mention.end():]):
+                try:
+                    value, _ = decoder.raw_decode(content, mention.end() + match.start())
+                except ValueError:
+                    continue
+                if value:
+                    return value
+    return None
+
+
+_overrides: Optional[Dict[str, Any]] = None
+
+
+def _file_overrides() -> Dict[str, Any]:
+    global _overrides
+    if _overrides is None:
+        _overrides = {}
+        if Config.LLM_FAKE_RESPONSES_FILE:
+            try:
+                with open(Config.LLM_FAKE_RESPONSES_FILE, encoding="utf-8") as fh:
+                    _overrides = json.load(fh)
+            except Exception as e:
+                logger.warning(f"Fake LLM responses file unusable ({Config.LLM_FAKE_RESPONSES_FILE}): {e}")
+    return _overrides
+
+
+def fake_response(agent: str, messages: Messages, rng: random.Random) -> str:
+    """Contenu de la réponse simulée pour `agent`."""
+    if agent in _file_overrides():
+        value = _file_overrides()[agent]
+    elif agent in RESPONDERS:
+        value = RESPONDERS[agent](messages, rng)
+    else:
+        value = _prompt_example(messages)
+        if value is None:
+            value = _text(rng)
+    return value if isinstance(value, str) else json.dumps(value, ensure_ascii=False)
+
+
+# --- Latence et tirages ---
+_call_counts: Dict[str, int] = defaultdict(int)
+_counts_lock = threading.Lock()
+
+
+def _rng_for(messages: Messages) -> random.Random:
+    digest = hashlib.sha1(json.dumps(messages, ensure_ascii=False).encode("utf-8")).hexdigest()
+    with _counts_lock:
+        rank = _call_counts[digest]
+        _call_counts[digest] += 1
+    return random.Random(f"{Config.LLM_FAKE_SEED}:{digest}:{rank}")
+
+
+@dataclass
+class FakeReply:
+    content: str
+    prompt_tokens: int
+    completion_tokens: int
+    first_token_s: float
+
+    @property
+    def generation_s(self) -> float:
+        return self.completion_tokens / max(Config.LLM_FAKE_TOKENS_PER_SECOND, 1e-6)
+
+    @property
+    def duration_s(self) -> float:
+        return self.first_token_s + self.generation_s
+
+    def chunks(self) -> List[str]:
+        return [self.content[i:i + CHUNK_CHARS] for i in range(0, len(self.content), CHUNK_CHARS)]
+
+    def chunk_delay_s(self) -> float:
+        return self.generation_s / max(1, len(self.chunks()))
+
+    def usage_metadata(self) -> Dict[str, int]:
+        return {
+            "input_tokens": self.prompt_tokens,
+            "output_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+        }
+
+
+def fake_reply(agent: str, input: Any) -> FakeReply:
+    """Tire la réponse, sa taille et son délai ; lève FakeLLMError selon LLM_FAKE_ERROR_RATE."""
+    messages = _as_messages(input)
+    rng = _rng_for(messages)
+    first_token_s = rng.lognormvariate(math.log(Config.LLM_FAKE_LATENCY_MEDIAN_MS), Config.LLM_FAKE_LATENCY_SIGMA) / 1000
+    if Config.LLM_FAKE_ERROR_RATE and rng.random() < Config.LLM_FAKE_ERROR_RATE:
+        raise FakeLLMError(f"Simulated LLM failure ({agent})")
+    content = fake_response(agent, messages, rng)
+    prompt_tokens = sum(count_tokens(c) for _, c in messages)
+    return FakeReply(content, prompt_tokens, count_tokens(content), first_token_s)
+
+
+# --- Modèle de chat (interface ChatOpenAI) ---
+class FakeChatModel:
+    """Remplace ChatOpenAI : ainvoke/invoke/astream/stream avec latence simulée."""
+
+    def __init__(self, model: str, agent: str = "unknown"):
+        self.model_name = model
+        self.agent = agent
+
+    def _message(self, reply: FakeReply) -> AIMessage:
+        return AIMessage(
+            content=reply.content,
+            usage_metadata=reply.usage_metadata(),
+            response_metadata={"model_name": self.model_name, "finish_reason": "stop", "fake": True},
+        )
+
+    async def ainvoke(self, input: Any, config: Any = None, **kwargs: Any) -> AIMessage:
+        reply = fake_reply(self.agent, input)
+        await asyncio.sleep(reply.duration_s)
+        return self._message(reply)
+
+    def invoke(self, input: Any, config: Any = None, **kwargs: Any) -> AIMessage:
+        reply = fake_reply(self.agent, input)
+        time.sleep(reply.duration_s)
+        return self._message(reply)
+
+    async def astream(self, input: Any, config: Any = None, **kwargs: Any):
+        reply = fake_reply(self.agent, input)
+        await asyncio.sleep(reply.first_token_s)
+        delay = reply.chunk_delay_s()
+        for piece in reply.chunks():
+            yield AIMessageChunk(content=piece)
+            await asyncio.sleep(delay)
+        yield AIMessageChunk(content="", usage_metadata=reply.usage_metadata())
+
+    def stream(self, input: Any, config: Any = None, **kwargs: Any) -> Iterator[AIMessageChunk]:
+        reply = fake_reply(self.agent, input)
+        time.sleep(reply.first_token_s)
+        delay = reply.chunk_delay_s()
+        for piece in reply.chunks():
+            yield AIMessageChunk(content=piece)
+            time.sleep(delay)
+        yield AIMessageChunk(content="", usage_metadata=reply.usage_metadata())
+
+
+# --- Client OpenAI brut (chat.completions.create) ---
+def _usage(reply: FakeReply) -> SimpleNamespace:
+    return SimpleNamespace(
+        prompt_tokens=reply.prompt_tokens,
+        completion_tokens=reply.completion_tokens,
+        total_tokens=reply.prompt_tokens + reply.completion_tokens,
+        prompt_tokens_details=None,
+    )
+
+
+class _FakeCompletions:
+    def __init__(self, agent: str):
+        self.agent = agent
+
+    def create(self, model: str, messages: List[Dict[str, Any]], stream: bool = False,
+               stream_options: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Any:
+        reply = fake_reply(self.agent, messages)
+        if stream:
+            return self._stream(model, reply, bool((stream_options or {}).get("include_usage")))
+        time.sleep(reply.duration_s)
+        message = SimpleNamespace(role="assistant", content=reply.content)
+        return SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+                               usage=_usage(reply))
+
+    @staticmethod
+    def _stream(model: str, reply: FakeReply, include_usage: bool) -> Iterator[SimpleNamespace]:
+        time.sleep(reply.first_token_s)
+        delay = reply.chunk_delay_s()
+        for piece in reply.chunks():
+            delta = SimpleNamespace(role="assistant", content=piece)
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)],
+                                  usage=None)
+            time.sleep(delay)
+        if include_usage:
+            # Comme l'API : dernier chunk sans choices, avec l'usage
+            yield SimpleNamespace(model=model, choices=[], usage=_usage(reply))
+
+
+class FakeOpenAIClient:
+    """Remplace openai.OpenAI pour chat.completions.create (streaming inclus)."""
+
+    def __init__(self, agent: str = "chatbot_streaming_task"):
+        self.chat = SimpleNamespace(completions=_FakeCompletions(agent))
+
+
+def fake_backend_enabled() -> bool:
+    return Config.LLM_BACKEND == "fake"
+
+
+def reset_fake_llm() -> None:
+    """Remet à zéro les rangs d'appel (runs de benchmark reproductibles dans un même process)."""
+    global _overrides
+    with _counts_lock:
+        _call_counts.clear()
+    _overrides = None
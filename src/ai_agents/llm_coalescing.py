@@ -0,0 +1,298 @@
+"""
+Coalescence des appels LLM identiques (single-flight).
+
+Quand une promotion démarre en même temps, les mêmes prompts partent en
+parallèle (explication d'un même concept au même niveau, questions d'un
+même profil type...). Ici, les appels ainvoke/invoke de llm_provider sont
+indexés par une empreinte du prompt normalisé (espaces compactés) et des
+paramètres du modèle :
+
+- dans le process, les appels identiques simultanés attendent le premier
+  (leader) et reçoivent sa réponse ;
+- entre workers, le leader pose un verrou Redis (SET NX, expirant après le
+  timeout du modèle) puis publie sa réponse sous une clé de résultat à TTL
+  court (LLM_COALESCE_RESULT_TTL_SECONDS) ; les autres workers lisent ce
+  résultat, ou interrogent la clé tant que le verrou existe. Si le leader
+  échoue sans résultat, ils appellent eux-mêmes le modèle.
+
+Redis est interrogé avec le client synchrone (dans un thread côté async) :
+pas de dépendance à la boucle asyncio (workers Celery). Redis indisponible :
+seule la coalescence dans le process s'applique. Les streams ne sont pas
+coalescés.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from langchain_core.messages import AIMessage
+
+from src.config import Config
+from src.ai_agents.llm_telemetry import record_coalesced
+
+logger = logging.getLogger("llm_coalescing")
+logger.setLevel(logging.INFO)
+
+RESULT_PREFIX = "llm:coalesce:result:"
+LOCK_PREFIX = "llm:coalesce:lock:"
+
+# Suppression du verrou seulement par son détenteur
+_RELEASE_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+
+def _normalize_messages(input: Any) -> list:
+    if isinstance(input, str):
+        input = [("user", input)]
+    elif hasattr(input, "to_messages"):
+        input = input.to_messages()
+    normalized = []
+    for m in input or []:
+        if isinstance(m, dict):
+            role, content = m.get("role", "user"), m.get("content")
+        elif isinstance(m, (tuple, list)):
+            role, content = m[0], m[1]
+        else:
+            role, content = getattr(m, "type", "user"), getattr(m, "content", "")
+        if isinstance(content, str):
+            content = " ".join(content.split())
+        normalized.append([str(role), content])
+    return normalized
+
+
+def prompt_key(model: str, temperature: float, options: Dict[str, Any], input: Any) -> str:
+    """Empreinte d'un appel : modèle, température, options et prompt normalisé."""
+    payload = json.dumps(
+        [model, temperature, sorted(options.items()), _normalize_messages(input)],
+        ensure_ascii=False, default=str, separators=(",", ":"),
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# --- Redis (client synchrone) ---
+def _redis():
+    from src.db.redis import r_sync
+    return r_sync
+
+
+def _remote_claim(key: str, lock_seconds: float) -> Tuple[str, Optional[str], Optional[str]]:
+    """
+    ("hit", contenu, None) si un résultat est publié, ("leader", None, jeton)
+    si le verrou est obtenu, ("wait", None, None) s'il est détenu ailleurs,
+    ("off", None, None) si Redis est indisponible.
+    """
+    token = uuid.uuid4().hex
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.get(RESULT_PREFIX + key)
+        pipe.set(LOCK_PREFIX + key, token, nx=True, px=int(lock_seconds * 1000))
+        cached, locked = pipe.execute()
+        if cached is not None:
+            if locked:
+                _remote_release(key, token)
+            return "hit", json.loads(cached)["content"], None
+        return ("leader", None, token) if locked else ("wait", None, None)
+    except Exception as e:
+        logger.warning(f"LLM coalescing: Redis unavailable ({e})")
+        return "off", None, None
+
+
+def _remote_publish(key: str, token: str, content: str) -> None:
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.set(RESULT_PREFIX + key, json.dumps({"content": content}, ensure_ascii=False),
+                 ex=Config.LLM_COALESCE_RESULT_TTL_SECONDS)
+        pipe.eval(_RELEASE_SCRIPT, 1, LOCK_PREFIX + key, token)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"LLM coalescing: result not published ({e})")
+
+
+def _remote_release(key: str, token: str) -> None:
+    try:
+        _redis().eval(_RELEASE_SCRIPT, 1, LOCK_PREFIX + key, token)
+    except Exception as e:
+        logger.warning(f"LLM coalescing: lock not released ({e})")
+
+
+def _remote_poll(key: str) -> Tuple[Optional[str], bool]:
+    """(contenu publié, verrou toujours présent)."""
+    try:
+        pipe = _redis().pipeline(transaction=False)
+        pipe.get(RESULT_PREFIX + key)
+        pipe.exists(LOCK_PREFIX + key)
+        cached, locked = pipe.execute()
+        return (json.loads(cached)["content"] if cached is not None else None), bool(locked)
+    except Exception:
+        return None, False
+
+
+def _coalesced_message(content: str, source: str) -> AIMessage:
+    return AIMessage(content=content, response_metadata={"coalesced": source})
+
+
+class _Flight:
+    """Appel sync en cours (threads d'un même process)."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class LLMCoalescer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._async: Dict[str, Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = {}
+        self._sync: Dict[str, _Flight] = {}
+        self._stats: Dict[str, int] = defaultdict(int)
+
+    def _count(self, source: str, agent: str, model: str) -> None:
+        self._stats[source] += 1
+        if source != "leader":
+            record_coalesced(agent, model)
+
+    # --- Async ---
+    async def arun(self, key: str, call: Callable[[], Awaitable[Any]], agent: str, model: str,
+                   lock_seconds: float) -> Any:
+        loop = asyncio.get_running_loop()
+        while True:
+            entry = self._async.get(key)
+            if entry is None or entry[0] is not loop or entry[1].done():
+                break
+            try:
+                result = await asyncio.shield(entry[1])
+                self._count("local", agent, model)
+                return result
+            except asyncio.CancelledError:
+                if not entry[1].cancelled():
+                    raise
+                # Leader annulé (timeout de son appelant) : reprendre la main
+
+        future = loop.create_future()
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())  # pas d'exception « jamais lue »
+        self._async[key] = (loop, future)
+        try:
+            result = await self._aresolve(key, call, agent, model, lock_seconds)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            if self._async.get(key, (None, None))[1] is future:
+                del self._async[key]
+
+    async def _aresolve(self, key: str, call: Callable[[], Awaitable[Any]], agent: str, model: str,
+                        lock_seconds: float) -> Any:
+        if not Config.LLM_COALESCE_REDIS_ENABLED:
+            self._count("leader", agent, model)
+            return await call()
+
+        deadline = time.monotonic() + lock_seconds
+        state, content, token = await asyncio.to_thread(_remote_claim, key, lock_seconds)
+        while state == "wait" and time.monotonic() < deadline:
+            await asyncio.sleep(Config.LLM_COALESCE_POLL_SECONDS)
+            content, locked = await asyncio.to_thread(_remote_poll, key)
+            if content is not None:
+                state = "hit"
+            elif not locked:
+                # Leader parti sans résultat : tenter de prendre le verrou
+                state, content, token = await asyncio.to_thread(_remote_claim, key, lock_seconds)
+        if state == "hit":
+            self._count("remote", agent, model)
+            return _coalesced_message(content, "remote")
+
+        self._count("leader", agent, model)
+        try:
+            result = await call()
+        except BaseException:
+            if token:
+                await asyncio.to_thread(_remote_release, key, token)
+            raise
+        if token:
+            if isinstance(getattr(result, "content", None), str):
+                await asyncio.to_thread(_remote_publish, key, token, result.content)
+            else:
+                await asyncio.to_thread(_remote_release, key, token)
+        return result
+
+    # --- Sync ---
+    def run(self, key: str, call: Callable[[], Any], agent: str, model: str, lock_seconds: float) -> Any:
+        with self._lock:
+            flight = self._sync.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._sync[key] = _Flight()
+        if not leader:
+            if flight.event.wait(lock_seconds) and flight.error is None:
+                self._count("local", agent, model)
+                return flight.result
+            if flight.error is not None:
+                raise flight.error
+            return self._resolve(key, call, agent, model, lock_seconds)
+
+        try:
+            flight.result = self._resolve(key, call, agent, model, lock_seconds)
+            return flight.result
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            flight.event.set()
+            with self._lock:
+                if self._sync.get(key) is flight:
+                    del self._sync[key]
+
+    def _resolve(self, key: str, call: Callable[[], Any], agent: str, model: str, lock_seconds: float) -> Any:
+        if not Config.LLM_COALESCE_REDIS_ENABLED:
+            self._count("leader", agent, model)
+            return call()
+
+        deadline = time.monotonic() + lock_seconds
+        state, content, token = _remote_claim(key, lock_seconds)
+        while state == "wait" and time.monotonic() < deadline:
+            time.sleep(Config.LLM_COALESCE_POLL_SECONDS)
+            content, locked = _remote_poll(key)
+            if content is not None:
+                state = "hit"
+            elif not locked:
+                state, content, token = _remote_claim(key, lock_seconds)
+        if state == "hit":
+            self._count("remote", agent, model)
+            return _coalesced_message(content, "remote")
+
+        self._count("leader", agent, model)
+        try:
+            result = call()
+        except BaseException:
+            if token:
+                _remote_release(key, token)
+            raise
+        if token:
+            if isinstance(getattr(result, "content", None), str):
+                _remote_publish(key, token, result.content)
+            else:
+                _remote_release(key, token)
+        return result
+
+    # --- Cycle de vie ---
+    def reset(self) -> None:
+        """Après un fork : oublier les appels en vol du parent."""
+        self._lock = threading.Lock()
+        self._async = {}
+        self._sync = {}
+        self._stats = defaultdict(int)
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self._stats, "in_flight": len(self._async) + len(self._sync)}
+
+
+coalescer = LLMCoalescer()
@@ -0,0 +1,375 @@
+"""
+Extraction et validation du JSON produit par les LLM.
+
+Chaque agent nettoyait sa réponse à sa façon (split sur ```json puis
+json.loads, _clean_json_like dans les tâches Celery) : une virgule en trop
+ou une réponse coupée par la limite de tokens faisait perdre toute la
+génération. Ici :
+
+- extract_json(text) : premier objet/tableau JSON du texte (fences Markdown
+  et texte autour ignorés) ; json.JSONDecoder.raw_decode d'abord, puis, en
+  cas d'échec, une passe de réparation qui retire les virgules finales et
+  referme une réponse tronquée après son dernier élément complet ;
+- parse_llm_output(text, agent, model) : extraction + validation contre le
+  schéma de sortie de l'agent (AGENT_SCHEMAS) ; les éléments de liste non
+  conformes sont écartés au lieu de faire échouer l'ensemble. Échecs et
+  réparations sont comptés dans la télémétrie (parse_failures,
+  parse_repairs) ;
+- JSONItemStream / astream_llm_json : parseur incrémental qui rend chaque
+  élément du tableau suivi (questions, modules...) dès qu'il est complet
+  pendant le streaming ; si la réponse finale est inexploitable, les
+  éléments déjà reçus sont conservés.
+"""
+import inspect
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from src.ai_agents.llm_telemetry import record_parse_failure, record_parse_repair
+
+logger = logging.getLogger("llm_json")
+logger.setLevel(logging.INFO)
+
+_decoder = json.JSONDecoder(strict=False)  # tolère les retours à la ligne bruts dans les chaînes
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+class LLMOutputError(ValueError):
+    """Réponse LLM sans JSON exploitable, ou non conforme au schéma attendu."""
+
+
+# --- Extraction tolérante ---
+def _candidates(text: str, expect: Optional[type]) -> List[int]:
+    """Positions de début possibles : d'abord dans un bloc ```json, puis dans tout le texte."""
+    openers = {dict: "{", list: "["}.get(expect, "{[")
+    fence = text.find("```")
+    starts = []
+    for origin in ((fence, 0) if fence != -1 else (0,)):
+        for i in range(origin, len(text)):
+            if text[i] in openers and i not in starts:
+                starts.append(i)
+                if len(starts) >= 8:
+                    return starts
+    return starts
+
+
+def _is_cut_point(stack: List[str]) -> bool:
+    """
+    Vrai si l'on peut couper ici sans laisser d'objet à moitié écrit : le
+    conteneur courant est un tableau et aucun objet n'est ouvert à
+    l'intérieur du premier tableau (seuls les objets englobants restent
+    ouverts, ex. {"questions": [...).
+    """
+    if not stack or stack[-1] != "[":
+        return False
+    return "{" not in stack[stack.index("["):]
+
+
+def _repair(text: str, start: int) -> Optional[str]:
+    """
+    Passe unique depuis `start` : retire les virgules avant } ou ], et si le
+    texte s'arrête avant la fin du JSON, le coupe après le dernier élément
+    complet d'un tableau puis referme les conteneurs ouverts. Un objet
+    tronqué hors de tout tableau n'est pas réparé.
+    """
+    out: List[str] = []
+    stack: List[str] = []
+    in_string = escape = False
+    safe: Optional[Tuple[int, Tuple[str, ...]]] = None
+
+    for c in text[start:]:
+        if in_string:
+            out.append(c)
+            if escape:
+                escape = False
+            elif c == "\\":
+                escape = True
+            elif c == '"':
+                in_string = False
+            continue
+        if c == '"':
+            in_string = True
+        elif c in _CLOSERS:
+            stack.append(c)
+        elif c in "}]":
+            if not stack or _CLOSERS[stack[-1]] != c:
+                return None
+            # Virgule finale : ",}" ou ", ]"
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+            stack.pop()
+            out.append(c)
+            if not stack:
+                return "".join(out)
+            if _is_cut_point(stack):
+                safe = (len(out), tuple(stack))
+            continue
+        elif c == "," and _is_cut_point(stack):
+            safe = (len(out), tuple(stack))
+        out.append(c)
+
+    if safe is None:
+        return None
+    length, open_stack = safe
+    return "".join(out[:length]) + "".join(_CLOSERS[o] for o in reversed(open_stack))
+
+
+def _extract(text: str, expect: Optional[type] = None) -> Tuple[Any, bool]:
+    """(valeur, réparée ?) ; LLMOutputError si aucun JSON du type attendu."""
+    if not isinstance(text, str) or not text.strip():
+        raise LLMOutputError("empty response")
+    for start in _candidates(text, expect):
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            repaired = False
+        except ValueError:
+            # Réparer à cette position avant d'essayer les suivantes (qui
+            # seraient des fragments intérieurs du même JSON)
+            fixed = _repair(text, start)
+            if fixed is None:
+                continue
+            try:
+                value, repaired = _decoder.decode(fixed), True
+            except ValueError:
+                continue
+        if expect is None or isinstance(value, expect):
+            return value, repaired
+    raise LLMOutputError(f"no JSON {expect.__name__ if expect else 'value'} found")
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Any:
+    """Premier objet (expect=dict) ou tableau (expect=list) JSON de `text`, réparé si besoin."""
+    return _extract(text, expect)[0]
+
+
+# --- Schémas de sortie ---
+@dataclass(frozen=True)
+class OutputSchema:
+    """
+    Forme attendue d'une sortie : objet (`kind=dict`) ou tableau. `items_key`
+    désigne la liste d'éléments de l'objet (un tableau nu est alors accepté
+    et placé sous cette clé) ; les éléments sans `item_required` sont écartés.
+    """
+    kind: type = dict
+    required: Tuple[str, ...] = ()
+    items_key: Optional[str] = None
+    item_required: Tuple[str, ...] = ()
+    min_items: int = 0
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+    def validate(self, value: Any) -> Tuple[Any, int]:
+        """(valeur normalisée, éléments écartés) ; LLMOutputError si non conforme."""
+        if self.items_key and isinstance(value, list):
+            value = {self.items_key: value}
+        if not isinstance(value, self.kind):
+            raise LLMOutputError(f"expected {self.kind.__name__}, got {type(value).__name__}")
+        if isinstance(value, dict):
+            missing = [key for key in self.required if key not in value]
+            if missing:
+                raise LLMOutputError(f"missing keys: {', '.join(missing)}")
+            for key, default in self.defaults.items():
+                value.setdefault(key, json.loads(json.dumps(default)))
+
+        items = value if isinstance(value, list) else value.get(self.items_key) if self.items_key else None
+        if items is None:
+            return value, 0
+        if not isinstance(items, list):
+            raise LLMOutputError(f"'{self.items_key}' is not a list")
+        kept = [item for item in items if self.valid_item(item)]
+        if len(kept) < self.min_items:
+            raise LLMOutputError(f"{len(kept)} valid items, {self.min_items} required")
+        if isinstance(value, list):
+            return kept, len(items) - len(kept)
+        value[self.items_key] = kept
+        return value, len(items) - len(kept)
+
+    def valid_item(self, item: Any) -> bool:
+        if not self.item_required:
+            return True
+        return isinstance(item, dict) and all(item.get(key) not in (None, "") for key in self.item_required)
+
+
+QUESTIONS_SCHEMA = OutputSchema(kind=list, item_required=("question", "type"), min_items=1)
+
+AGENT_SCHEMAS: Dict[str, OutputSchema] = {
+    "ProfilerAgent": OutputSchema(required=("estimated_level",)),
+    "QuestionGeneratorAgent": QUESTIONS_SCHEMA,
+    "generate_profile_question": QUESTIONS_SCHEMA,
+    "question_bank_refill": QUESTIONS_SCHEMA,
+    "EvaluatorAgent": OutputSchema(
+        defaults={"forces_identifiees": [], "faiblesses_identifiees": [], "recommandations": []},
+    ),
+    "OpenQuestionAnalyzer": OutputSchema(required=("scores",)),
+    "OpenQuestionAnalyzer:batch": OutputSchema(items_key="analyses", item_required=("scores",)),
+    "TutoringAgent:explain": OutputSchema(
+        required=("explication",),
+        defaults={"points_cles": [], "exercices_proposes": [], "ressources_complementaires": []},
+    ),
+    "TutoringAgent:exercises": OutputSchema(items_key="exercices", item_required=("titre",)),
+    "CourseManagerAgent": OutputSchema(required=("cours",), items_key="modules", item_required=("titre",), min_items=1),
+    "CourseRecommendationAgent": OutputSchema(defaults={"ressources_recommandees": [], "roadmap_suggeree": []}),
+    "analyze_profile_with_llm": OutputSchema(required=("niveau",)),
+}
+
+
+def _schema(agent: str, schema: Union[str, OutputSchema, None]) -> Optional[OutputSchema]:
+    if isinstance(schema, OutputSchema):
+        return schema
+    return AGENT_SCHEMAS.get(schema or agent)
+
+
+def _parse(text: str, schema: Optional[OutputSchema]) -> Tuple[Any, bool]:
+    expect = None
+    if schema is not None:
+        expect = None if schema.items_key else schema.kind
+    value, repaired = _extract(text, expect)
+    if schema is None:
+        return value, repaired
+    value, dropped = schema.validate(value)
+    return value, repaired or dropped > 0
+
+
+def parse_llm_output(text: str, agent: str, model: str = "unknown",
+                     schema: Union[str, OutputSchema, None] = None) -> Any:
+    """
+    JSON de la réponse de `agent`, validé contre `schema` (clé de
+    AGENT_SCHEMAS ou OutputSchema ; par défaut celui de l'agent).
+    Lève LLMOutputError (comptée en parse_failures) si inexploitable.
+    """
+    try:
+        value, repaired = _parse(text, _schema(agent, schema))
+    except LLMOutputError as e:
+        record_parse_failure(agent, model)
+        logger.warning(f"Unusable {agent} output ({e}): {str(text)[:200]!r}")
+        raise
+    if repaired:
+        record_parse_repair(agent, model)
+    return value
+
+
+# --- Streaming ---
+class JSONItemStream:
+    """
+    Parseur incrémental : feed(fragment) retourne les éléments (objets) du
+    tableau suivi terminés depuis le dernier appel. Le tableau suivi est la
+    racine, ou la clé `items_key` de l'objet racine.
+    """
+
+    def __init__(self, items_key: Optional[str] = None):
+        self.items_key = items_key
+        self.items: List[Any] = []
+        self._text = ""
+        self._pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string: Optional[str] = None
+        self._key: Optional[str] = None
+        self._array_depth: Optional[int] = None
+        self._closed = False
+        self._item_start: Optional[int] = None
+
+    def feed(self, fragment: str) -> List[Any]:
+        self._text += fragment or ""
+        text = self._text
+        new: List[Any] = []
+        for i in range(self._pos, len(text)):
+            c = text[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._in_string = False
+                    self._last_string = text[self._string_start + 1:i]
+                continue
+            if not self._stack and c not in _CLOSERS:
+                continue  # texte ou fence avant le JSON
+            if c == '"':
+                self._in_string = True
+                self._string_start = i
+            elif c == ":" and len(self._stack) == 1:
+                self._key = self._last_string
+            elif c in _CLOSERS:
+                self._stack.append(c)
+                depth = len(self._stack)
+                if self._array_depth is None and not self._closed and c == "[" and (
+                    depth == 1 or (depth == 2 and self.items_key is not None and self._key == self.items_key)
+                ):
+                    self._array_depth = depth
+                elif self._array_depth is not None and depth == self._array_depth + 1:
+                    self._item_start = i
+            elif c in "}]":
+                depth = len(self._stack)
+                if self._array_depth is not None and depth == self._array_depth + 1 and self._item_start is not None:
+                    self._emit(text[self._item_start:i + 1], new)
+                    self._item_start = None
+                elif self._array_depth is not None and depth == self._array_depth:
+                    self._array_depth = None
+                    self._closed = True
+                if self._stack:
+                    self._stack.pop()
+        self._pos = len(text)
+        return new
+
+    def _emit(self, fragment: str, new: List[Any]) -> None:
+        try:
+            item = extract_json(fragment)
+        except LLMOutputError:
+            return
+        self.items.append(item)
+        new.append(item)
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+
+async def astream_llm_json(
+    llm: Any,
+    messages: Any,
+    schema: Union[str, OutputSchema, None] = None,
+    on_item: Optional[Callable[[Any], Any]] = None,
+) -> Any:
+    """
+    Stream `messages` sur `llm` (PooledChatModel) et retourne la sortie
+    validée. `on_item(item)` (fonction ou coroutine) reçoit chaque élément
+    valide du tableau du schéma dès sa complétion. Si la réponse complète
+    est inexploitable, les éléments reçus sont repris s'ils suffisent au schéma.
+    """
+    agent, model = getattr(llm, "agent", "unknown"), getattr(llm, "model_name", "unknown")
+    output_schema = _schema(agent, schema)
+    stream = JSONItemStream(output_schema.items_key if output_schema else None)
+
+    async for chunk in llm.astream(messages):
+        content = chunk.content if isinstance(chunk.content, str) else ""
+        for item in stream.feed(content):
+            if on_item is not None and (output_schema is None or output_schema.valid_item(item)):
+                result = on_item(item)
+                if inspect.isawaitable(result):
+                    await result
+
+    try:
+        value, repaired = _parse(stream.text, output_schema)
+    except LLMOutputError as e:
+        salvaged = None
+        if stream.items and output_schema is not None:
+            try:
+                salvaged, _ = output_schema.validate(list(stream.items))
+            except LLMOutputError:
+                salvaged = None
+        if salvaged is None:
+            record_parse_failure(agent, model)
+            logger.warning(f"Unusable {agent} streamed output ({e}): {stream.text[:200]!r}")
+            raise
+        logger.warning(f"{agent}: kept {len(stream.items)} streamed items from unusable output ({e})")
+        value, repaired = salvaged, True
+    if repaired:
+        record_parse_repair(agent, model)
+    return value
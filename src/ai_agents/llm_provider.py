@@ -0,0 +1,383 @@
+"""
+Registre des clients LLM du process.
+
+Chaque agent construisait son propre ChatOpenAI (et les fonctions du
+profiler un nouveau à chaque appel, la tâche de streaming un client OpenAI
+par tâche) : autant de pools HTTP distincts, donc de connexions TLS ouvertes
+puis abandonnées. Ici, tous les clients partagent un transport httpx par
+process (un client sync, et un client async pour la boucle courante), avec
+keep-alive et limites de connexions issues de la config.
+
+- get_chat_model(model, temperature) retourne une poignée légère, à garder
+  dans l'agent : le ChatOpenAI sous-jacent est résolu à chaque appel (et mis
+  en cache par paramètres), ce qui permet de construire les agents à l'import
+  sans dépendre d'une boucle asyncio.
+- Chaque appel prend une place dans le sémaphore de son modèle
+  (LLM_MODEL_CONCURRENCY) : une rafale de requêtes gpt-4o ne monopolise pas
+  les connexions ni le quota du fournisseur.
+- Avant le sémaphore, l'appel est admis par l'ordonnanceur
+  (src.ai_agents.llm_scheduler : priorité interactive/fond, débit du tier
+  OpenAI) ; les appels de fond n'ont accès qu'à une part des places
+  (LLM_BACKGROUND_CONCURRENCY_SHARE).
+- Timeouts et retries par modèle (LLM_MODEL_TIMEOUTS, LLM_TIMEOUT_SECONDS).
+- reset_llm_clients() est appelé après le fork des workers Celery : les
+  sockets héritées du parent ne doivent pas être réutilisées.
+- Les appels ainvoke/invoke identiques simultanés sont coalescés
+  (src.ai_agents.llm_coalescing), sauf coalesce=False.
+- LLM_BACKEND=fake : modèles et client simulés (src.ai_agents.fake_llm),
+  sémaphores et télémétrie inchangés.
+"""
+import asyncio
+import logging
+import threading
+from contextlib import AsyncExitStack, ExitStack, asynccontextmanager, contextmanager
+from typing import Any, AsyncIterator, Dict, Iterator, Optional, Tuple
+
+import httpx
+from langchain_openai import ChatOpenAI
+from openai import OpenAI
+
+from src.config import Config
+from src.ai_agents.llm_coalescing import coalescer, prompt_key
+from src.ai_agents.llm_scheduler import BACKGROUND, Ticket, estimate_tokens, scheduler
+from src.ai_agents.fake_llm import FakeChatModel, FakeOpenAIClient, fake_backend_enabled
+from src.ai_agents.llm_telemetry import acount_http_request, count_http_request, track_llm_call
+
+logger = logging.getLogger("llm_provider")
+logger.setLevel(logging.INFO)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=Config.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=Config.LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY_SECONDS,
+    )
+
+
+def model_timeout(model: str) -> float:
+    return float(Config.LLM_MODEL_TIMEOUTS.get(model, Config.LLM_TIMEOUT_SECONDS))
+
+
+def model_concurrency(model: str) -> int:
+    return int(Config.LLM_MODEL_CONCURRENCY.get(model, Config.LLM_DEFAULT_CONCURRENCY))
+
+
+def background_concurrency(model: str) -> int:
+    return max(1, int(model_concurrency(model) * Config.LLM_BACKGROUND_CONCURRENCY_SHARE))
+
+
+def _model_key(model: str, temperature: float, kwargs: Dict[str, Any]) -> Tuple:
+    return model, temperature, tuple(sorted(kwargs.items()))
+
+
+class _LoopResources:
+    """Client httpx async, modèles et sémaphores liés à une boucle asyncio."""
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.http_client = httpx.AsyncClient(limits=_limits(), event_hooks={"request": [acount_http_request]})
+        self.models: Dict[Tuple, ChatOpenAI] = {}
+        self.semaphores: Dict[str, asyncio.Semaphore] = {}
+
+
+class _LLMProvider:
+    """
+    Transport HTTP partagé du process. Côté async, une seule boucle active à
+    la fois (boucle de l'API, boucle persistante du worker Celery) : sur une
+    autre boucle, les ressources sont recréées et les anciennes abandonnées.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sync_http: Optional[httpx.Client] = None
+        self._sync_models: Dict[Tuple, ChatOpenAI] = {}
+        self._sync_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._openai: Optional[OpenAI] = None
+        self._loop_resources: Optional[_LoopResources] = None
+        self._in_flight: Dict[str, int] = {}
+        self._stats = {"models_created": 0, "loop_switches": 0, "calls": 0}
+
+    # --- Transport ---
+    def _sync_http_client(self) -> httpx.Client:
+        if self._sync_http is None:
+            with self._lock:
+                if self._sync_http is None:
+                    self._sync_http = httpx.Client(limits=_limits(), event_hooks={"request": [count_http_request]})
+        return self._sync_http
+
+    def _for_loop(self) -> _LoopResources:
+        loop = asyncio.get_running_loop()
+        resources = self._loop_resources
+        if resources is None or resources.loop is not loop:
+            if resources is not None:
+                self._stats["loop_switches"] += 1
+                if not resources.loop.is_closed():
+                    resources.loop.call_soon_threadsafe(
+                        lambda client=resources.http_client: asyncio.ensure_future(client.aclose())
+                    )
+            resources = _LoopResources(loop)
+            self._loop_resources = resources
+        return resources
+
+    def _build(self, model: str, temperature: float, kwargs: Dict[str, Any],
+               http_async_client: Optional[httpx.AsyncClient]) -> ChatOpenAI:
+        self._stats["models_created"] += 1
+        return ChatOpenAI(
+            model=model,
+            temperature=temperature,
+            api_key=Config.OPENAI_API_KEY,
+            timeout=model_timeout(model),
+            max_retries=Config.LLM_MAX_RETRIES,
+            http_client=self._sync_http_client(),
+            http_async_client=http_async_client,
+            stream_usage=True,  # usage dans le dernier chunk (télémétrie)
+            **kwargs,
+        )
+
+    def async_model(self, model: str, temperature: float, kwargs: Dict[str, Any], agent: str = "unknown") -> ChatOpenAI:
+        if fake_backend_enabled():
+            return FakeChatModel(model, agent)
+        resources = self._for_loop()
+        key = _model_key(model, temperature, kwargs)
+        llm = resources.models.get(key)
+        if llm is None:
+            llm = self._build(model, temperature, kwargs, resources.http_client)
+            resources.models[key] = llm
+        return llm
+
+    def sync_model(self, model: str, temperature: float, kwargs: Dict[str, Any], agent: str = "unknown") -> ChatOpenAI:
+        if fake_backend_enabled():
+            return FakeChatModel(model, agent)
+        key = _model_key(model, temperature, kwargs)
+        llm = self._sync_models.get(key)
+        if llm is None:
+            with self._lock:
+                llm = self._sync_models.get(key)
+                if llm is None:
+                    llm = self._build(model, temperature, kwargs, None)
+                    self._sync_models[key] = llm
+        return llm
+
+    def openai_client(self) -> OpenAI:
+        """Client OpenAI brut (streaming côté Celery), sur le transport sync partagé."""
+        if fake_backend_enabled():
+            return FakeOpenAIClient()
+        if self._openai is None:
+            http_client = self._sync_http_client()
+            with self._lock:
+                if self._openai is None:
+                    self._openai = OpenAI(
+                        api_key=Config.OPENAI_API_KEY,
+                        timeout=Config.LLM_TIMEOUT_SECONDS,
+                        max_retries=Config.LLM_MAX_RETRIES,
+                        http_client=http_client,
+                    )
+        return self._openai
+
+    # --- Concurrence par modèle ---
+    def _async_semaphore(self, resources: _LoopResources, key: str, size: int) -> asyncio.Semaphore:
+        semaphore = resources.semaphores.get(key)
+        if semaphore is None:
+            semaphore = resources.semaphores[key] = asyncio.Semaphore(size)
+        return semaphore
+
+    def _sync_semaphore(self, key: str, size: int) -> threading.BoundedSemaphore:
+        semaphore = self._sync_semaphores.get(key)
+        if semaphore is None:
+            with self._lock:
+                semaphore = self._sync_semaphores.setdefault(key, threading.BoundedSemaphore(size))
+        return semaphore
+
+    @asynccontextmanager
+    async def async_slot(self, model: str, agent: str = "unknown", priority: Optional[str] = None,
+                         tokens: int = 0) -> AsyncIterator[Ticket]:
+        resources = self._for_loop()
+        ticket = scheduler.ticket(model, agent, priority, tokens)
+        async with AsyncExitStack() as stack:
+            if ticket.priority == BACKGROUND:
+                await stack.enter_async_context(
+                    self._async_semaphore(resources, f"{model}:{BACKGROUND}", background_concurrency(model))
+                )
+            await scheduler.aadmit(ticket)
+            await stack.enter_async_context(self._async_semaphore(resources, model, model_concurrency(model)))
+            scheduler.started(ticket)
+            self._enter(model)
+            try:
+                yield ticket
+            finally:
+                self._exit(model)
+
+    @contextmanager
+    def sync_slot(self, model: str, agent: str = "unknown", priority: Optional[str] = None,
+                  tokens: int = 0) -> Iterator[Ticket]:
+        ticket = scheduler.ticket(model, agent, priority, tokens)
+        with ExitStack() as stack:
+            if ticket.priority == BACKGROUND:
+                stack.enter_context(self._sync_semaphore(f"{model}:{BACKGROUND}", background_concurrency(model)))
+            scheduler.admit(ticket)
+            stack.enter_context(self._sync_semaphore(model, model_concurrency(model)))
+            scheduler.started(ticket)
+            self._enter(model)
+            try:
+                yield ticket
+            finally:
+                self._exit(model)
+
+    def _enter(self, model: str) -> None:
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        self._stats["calls"] += 1
+
+    def _exit(self, model: str) -> None:
+        self._in_flight[model] -= 1
+
+    # --- Cycle de vie ---
+    def reset(self) -> None:
+        """Après un fork : oublier les clients hérités du parent sans fermer leurs sockets."""
+        self._lock = threading.Lock()
+        self._sync_http = None
+        self._sync_models = {}
+        self._sync_semaphores = {}
+        self._openai = None
+        self._loop_resources = None
+        self._in_flight = {}
+
+    async def aclose(self) -> None:
+        resources, self._loop_resources = self._loop_resources, None
+        if resources is not None and resources.loop is asyncio.get_running_loop():
+            await resources.http_client.aclose()
+        sync_http, self._sync_http = self._sync_http, None
+        self._sync_models = {}
+        self._openai = None
+        if sync_http is not None:
+            sync_http.close()
+
+    def stats(self) -> dict:
+        return {
+            **self._stats,
+            "in_flight": dict(self._in_flight),
+            "sync_models": len(self._sync_models),
+            "async_models": len(self._loop_resources.models) if self._loop_resources else 0,
+        }
+
+
+_provider = _LLMProvider()
+
+
+class PooledChatModel:
+    """
+    Poignée vers un ChatOpenAI partagé : même interface d'appel
+    (ainvoke/invoke/astream/stream), avec le sémaphore du modèle et la
+    télémétrie de l'appel (libellée par `agent`). `coalesce=False` pour les
+    appels dont chaque réponse doit être distincte (génération de variété) ;
+    `priority` force la classe de l'ordonnanceur (sinon llm_priority() ou
+    LLM_AGENT_PRIORITIES).
+    """
+
+    def __init__(self, model: str, temperature: float = 0.7, agent: str = "unknown",
+                 coalesce: Optional[bool] = None, priority: Optional[str] = None, **kwargs: Any):
+        self.model_name = model
+        self.temperature = temperature
+        self.agent = agent
+        self.coalesce = Config.LLM_COALESCE_ENABLED if coalesce is None else coalesce
+        self.priority = priority
+        self._kwargs = kwargs
+
+    def _slot_args(self, input: Any) -> Dict[str, Any]:
+        return {
+            "agent": self.agent,
+            "priority": self.priority,
+            "tokens": estimate_tokens(input, self._kwargs.get("max_tokens")),
+        }
+
+    def _coalesce_key(self, input: Any, kwargs: Dict[str, Any]) -> Optional[str]:
+        # Options propres à l'appel (outils, stop...) : pas de partage
+        if not self.coalesce or kwargs:
+            return None
+        return prompt_key(self.model_name, self.temperature, self._kwargs, input)
+
+    async def ainvoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        key = self._coalesce_key(input, kwargs)
+        if key is None:
+            return await self._ainvoke(input, config, **kwargs)
+        return await coalescer.arun(
+            key, lambda: self._ainvoke(input, config), self.agent, self.model_name, model_timeout(self.model_name)
+        )
+
+    def invoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        key = self._coalesce_key(input, kwargs)
+        if key is None:
+            return self._invoke(input, config, **kwargs)
+        return coalescer.run(
+            key, lambda: self._invoke(input, config), self.agent, self.model_name, model_timeout(self.model_name)
+        )
+
+    async def _ainvoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        async with _provider.async_slot(self.model_name, **self._slot_args(input)) as ticket:
+            llm = _provider.async_model(self.model_name, self.temperature, self._kwargs, self.agent)
+            with track_llm_call(self.agent, self.model_name) as call:
+                result = await llm.ainvoke(input, config, **kwargs)
+                call.set_usage_from_message(result)
+                scheduler.observe(ticket, call)
+            return result
+
+    def _invoke(self, input: Any, config: Any = None, **kwargs: Any) -> Any:
+        with _provider.sync_slot(self.model_name, **self._slot_args(input)) as ticket:
+            llm = _provider.sync_model(self.model_name, self.temperature, self._kwargs, self.agent)
+            with track_llm_call(self.agent, self.model_name) as call:
+                result = llm.invoke(input, config, **kwargs)
+                call.set_usage_from_message(result)
+                scheduler.observe(ticket, call)
+            return result
+
+    async def astream(self, input: Any, config: Any = None, **kwargs: Any) -> AsyncIterator[Any]:
+        async with _provider.async_slot(self.model_name, **self._slot_args(input)) as ticket:
+            llm = _provider.async_model(self.model_name, self.temperature, self._kwargs, self.agent)
+            with track_llm_call(self.agent, self.model_name) as call:
+                async for chunk in llm.astream(input, config, **kwargs):
+                    call.first_token()
+                    call.set_usage_from_message(chunk)
+                    yield chunk
+                scheduler.observe(ticket, call)
+
+    def stream(self, input: Any, config: Any = None, **kwargs: Any) -> Iterator[Any]:
+        with _provider.sync_slot(self.model_name, **self._slot_args(input)) as ticket:
+            llm = _provider.sync_model(self.model_name, self.temperature, self._kwargs, self.agent)
+            with track_llm_call(self.agent, self.model_name) as call:
+                for chunk in llm.stream(input, config, **kwargs):
+                    call.first_token()
+                    call.set_usage_from_message(chunk)
+                    yield chunk
+                scheduler.observe(ticket, call)
+
+
+def get_chat_model(model: str, temperature: float = 0.7, agent: str = "unknown",
+                   coalesce: Optional[bool] = None, priority: Optional[str] = None, **kwargs: Any) -> PooledChatModel:
+    """Modèle de chat sur le transport partagé (à garder dans l'agent ou à rappeler à chaque appel)."""
+    return PooledChatModel(model, temperature, agent=agent, coalesce=coalesce, priority=priority, **kwargs)
+
+
+def get_openai_client() -> OpenAI:
+    return _provider.openai_client()
+
+
+def llm_slot(model: str, agent: str = "unknown", priority: Optional[str] = None, tokens: int = 0):
+    """
+    Admission et place dans le sémaphore sync du modèle (appels directs au
+    client OpenAI) ; le ticket retourné attend scheduler.observe(ticket, call).
+    """
+    return _provider.sync_slot(model, agent, priority, tokens)
+
+
+def reset_llm_clients() -> None:
+    _provider.reset()
+    coalescer.reset()
+    scheduler.reset()
+
+
+async def close_llm_clients() -> None:
+    await _provider.aclose()
+
+
+def llm_provider_stats() -> dict:
+    return {**_provider.stats(), "coalescing": coalescer.stats(), "scheduler": scheduler.stats()}
@@ -0,0 +1,372 @@
+"""
+Ordonnancement des appels LLM : classes de priorité, débit par modèle et
+report du travail de fond.
+
+Le chat (/chat, streaming WebSocket, /tutoring/explain) et les tâches
+lourdes (roadmaps, analyse de profil, remplissage de la banque de
+questions) consomment le même quota OpenAI. Chaque appel passé par
+llm_provider est admis ici avant de prendre sa place dans le sémaphore de
+son modèle :
+
+- classe "interactive" ou "background" : llm_priority() ou
+  @background_llm_calls (tâches Celery), sinon LLM_AGENT_PRIORITIES
+  (libellé de l'agent), sinon LLM_DEFAULT_PRIORITY ;
+- seaux à jetons par modèle, requêtes et tokens par minute du tier OpenAI
+  (LLM_RATE_LIMITS, divisés entre les LLM_RATE_LIMIT_PROCESSES process) ;
+  le coût d'un appel est estimé avant l'envoi puis corrigé avec l'usage
+  réel ;
+- un appel de fond cède son tour tant que des appels interactifs du même
+  modèle sont en file, et laisse toujours LLM_BACKGROUND_TOKEN_RESERVE des
+  seaux libres ;
+- report préventif : quand le p95 interactif (attente + premier token pour
+  les streams, attente seule pour ainvoke/invoke) dépasse
+  LLM_INTERACTIVE_LATENCY_TARGET_MS, le fond attend. Le chat tourne dans
+  l'API et les roadmaps dans Celery : ce signal est partagé par Redis (clé
+  à TTL court, mise à jour par un thread toutes les
+  LLM_SCHEDULER_SIGNAL_SECONDS) ;
+- ces deux reports durent au plus LLM_BACKGROUND_MAX_DEFER_SECONDS par
+  appel : au-delà, le fond ne passe plus après le chat ;
+- temps d'attente et reports publiés dans la télémétrie (queue_ms_sum,
+  deferred, p95_queue_ms) et dans stats().
+"""
+import asyncio
+import functools
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from src.config import Config
+from src.ai_agents.llm_telemetry import record_queue_wait
+
+logger = logging.getLogger("llm_scheduler")
+logger.setLevel(logging.INFO)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+PRIORITIES = (INTERACTIVE, BACKGROUND)
+
+PRESSURE_PREFIX = "llm:scheduler:pressure:"
+SAMPLES = 512
+MIN_LATENCY_SAMPLES = 5
+MAX_SLEEP_SECONDS = 1.0
+
+_priority: ContextVar[Optional[str]] = ContextVar("llm_priority", default=None)
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """Classe de priorité des appels LLM du bloc (tâches Celery de fond)."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown LLM priority: {priority}")
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def background_llm_calls(func):
+    """Décorateur (tâches Celery) : appels LLM de la fonction en classe "background"."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with llm_priority(BACKGROUND):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def resolve_priority(agent: str, priority: Optional[str] = None) -> str:
+    priority = (
+        priority or _priority.get() or Config.LLM_AGENT_PRIORITIES.get(agent) or Config.LLM_DEFAULT_PRIORITY
+    )
+    return priority if priority in PRIORITIES else INTERACTIVE
+
+
+def estimate_tokens(input: Any, max_tokens: Optional[int] = None) -> int:
+    """Coût estimé d'un appel : ~4 caractères par token de prompt, plus la réponse attendue."""
+    if isinstance(input, str):
+        chars = len(input)
+    else:
+        if hasattr(input, "to_messages"):
+            input = input.to_messages()
+        chars = 0
+        for m in input or []:
+            if isinstance(m, dict):
+                content = m.get("content")
+            elif isinstance(m, (tuple, list)):
+                content = m[1]
+            else:
+                content = getattr(m, "content", "")
+            chars += len(content if isinstance(content, str) else str(content))
+    return chars // 4 + int(max_tokens or Config.LLM_COMPLETION_TOKENS_ESTIMATE)
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * pct / 100.0)))]
+
+
+def _redis():
+    from src.db.redis import r_sync
+    return r_sync
+
+
+class _TokenBucket:
+    """Seau plein au départ, rempli en continu à `per_minute` unités par minute."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = self.capacity / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_for(self, amount: float, reserve: float, now: float) -> float:
+        """Secondes avant de pouvoir prélever `amount` en laissant `reserve` (fraction) au seau."""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # Un appel plus gros que le seau passe quand le seau est plein
+        amount = min(amount, self.capacity * (1 - reserve))
+        missing = amount + self.capacity * reserve - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        """Correction après l'appel (négative si l'usage réel dépasse l'estimation)."""
+        self.level = min(self.capacity, self.level + amount)
+
+
+class _ModelState:
+    def __init__(self, model: str):
+        limits = Config.LLM_RATE_LIMITS.get(model) or {}
+        processes = max(1, Config.LLM_RATE_LIMIT_PROCESSES)
+        self.requests = _TokenBucket(limits["rpm"] / processes) if limits.get("rpm") else None
+        self.tokens = _TokenBucket(limits["tpm"] / processes) if limits.get("tpm") else None
+        self.waiting: Dict[str, int] = defaultdict(int)
+        self.admitted: Dict[str, int] = defaultdict(int)
+        self.deferred = 0
+        self.queue_waits: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=SAMPLES))
+        # (instant, attente [+ premier token si streaming] en ms) des appels interactifs
+        self.latencies: Deque[Tuple[float, float]] = deque(maxlen=SAMPLES)
+
+
+class Ticket:
+    """Demande d'admission d'un appel LLM (voir llm_provider.async_slot / sync_slot)."""
+
+    def __init__(self, model: str, agent: str, priority: str, tokens: int):
+        self.model = model
+        self.agent = agent
+        self.priority = priority
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.queued_ms = 0.0
+        self.deferred = False
+        self.admitted = False
+
+
+class LLMScheduler:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[str, _ModelState] = {}
+        self._remote_pressure: Dict[str, float] = {}  # modèle -> expiration (monotonic)
+        self._signal_pid: Optional[int] = None
+
+    def _state(self, model: str) -> _ModelState:
+        state = self._states.get(model)
+        if state is None:
+            state = self._states[model] = _ModelState(model)
+        return state
+
+    # --- Pression interactive ---
+    def _interactive_p95(self, state: _ModelState, now: float) -> Optional[float]:
+        window = Config.LLM_INTERACTIVE_LATENCY_WINDOW_SECONDS
+        while state.latencies and now - state.latencies[0][0] > window:
+            state.latencies.popleft()
+        if len(state.latencies) < MIN_LATENCY_SAMPLES:
+            return None
+        return _percentile([ms for _, ms in state.latencies], 95)
+
+    def _under_pressure(self, model: str, state: _ModelState, now: float) -> bool:
+        p95 = self._interactive_p95(state, now)
+        if p95 is not None and p95 > Config.LLM_INTERACTIVE_LATENCY_TARGET_MS:
+            return True
+        return self._remote_pressure.get(model, 0.0) > now
+
+    # --- Admission ---
+    def ticket(self, model: str, agent: str, priority: Optional[str] = None, tokens: int = 0) -> Ticket:
+        return Ticket(model, agent, resolve_priority(agent, priority), tokens)
+
+    def _try_admit(self, ticket: Ticket) -> float:
+        """0 si l'appel est admis (seaux débités), sinon secondes à attendre."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._state(ticket.model)
+            reserve = 0.0
+            if ticket.priority == BACKGROUND:
+                # Passé le délai maximal, le fond ne cède plus la place (réserve conservée)
+                overdue = now - ticket.enqueued > Config.LLM_BACKGROUND_MAX_DEFER_SECONDS
+                if not overdue:
+                    if state.waiting[INTERACTIVE]:
+                        return Config.LLM_SCHEDULER_POLL_SECONDS
+                    if self._under_pressure(ticket.model, state, now):
+                        ticket.deferred = True
+                        return Config.LLM_SCHEDULER_POLL_SECONDS
+                reserve = Config.LLM_BACKGROUND_TOKEN_RESERVE
+            wait = 0.0
+            for bucket, amount in ((state.requests, 1), (state.tokens, ticket.tokens)):
+                if bucket is not None:
+                    wait = max(wait, bucket.wait_for(amount, reserve, now))
+            if wait:
+                return wait
+            for bucket, amount in ((state.requests, 1), (state.tokens, ticket.tokens)):
+                if bucket is not None:
+                    bucket.take(amount)
+            return 0.0
+
+    def _set_waiting(self, ticket: Ticket, delta: int) -> None:
+        with self._lock:
+            self._state(ticket.model).waiting[ticket.priority] += delta
+
+    @staticmethod
+    def _sleep_for(wait: float) -> float:
+        return min(max(wait, Config.LLM_SCHEDULER_POLL_SECONDS), MAX_SLEEP_SECONDS)
+
+    async def aadmit(self, ticket: Ticket) -> None:
+        if not Config.LLM_SCHEDULER_ENABLED:
+            return
+        self._ensure_signal()
+        wait = self._try_admit(ticket)
+        if wait:
+            self._set_waiting(ticket, 1)
+            try:
+                while wait:
+                    await asyncio.sleep(self._sleep_for(wait))
+                    wait = self._try_admit(ticket)
+            finally:
+                self._set_waiting(ticket, -1)
+        ticket.admitted = True
+
+    def admit(self, ticket: Ticket) -> None:
+        if not Config.LLM_SCHEDULER_ENABLED:
+            return
+        self._ensure_signal()
+        wait = self._try_admit(ticket)
+        if wait:
+            self._set_waiting(ticket, 1)
+            try:
+                while wait:
+                    time.sleep(self._sleep_for(wait))
+                    wait = self._try_admit(ticket)
+            finally:
+                self._set_waiting(ticket, -1)
+        ticket.admitted = True
+
+    def started(self, ticket: Ticket) -> None:
+        """Place obtenue (seaux et sémaphores) : enregistre le temps passé en file."""
+        ticket.queued_ms = (time.monotonic() - ticket.enqueued) * 1000
+        with self._lock:
+            state = self._state(ticket.model)
+            state.admitted[ticket.priority] += 1
+            state.deferred += 1 if ticket.deferred else 0
+            state.queue_waits[ticket.priority].append(ticket.queued_ms)
+        record_queue_wait(ticket.agent, ticket.model, ticket.queued_ms, ticket.deferred)
+
+    def observe(self, ticket: Ticket, call: Any) -> None:
+        """
+        Après l'appel (LLMCall) : usage réel reporté sur le seau, latence
+        interactive (attente + premier token ; attente seule sans streaming,
+        la durée complète dépendant surtout de la longueur de la réponse).
+        """
+        actual = call.prompt_tokens + call.completion_tokens
+        response_ms = call.ttft_ms if call.ttft_ms is not None else 0.0
+        with self._lock:
+            state = self._state(ticket.model)
+            if ticket.admitted and actual and state.tokens is not None:
+                state.tokens.refund(ticket.tokens - actual)
+            if ticket.priority == INTERACTIVE:
+                state.latencies.append((time.monotonic(), ticket.queued_ms + response_ms))
+
+    # --- Signal partagé entre process ---
+    def sync_pressure(self) -> None:
+        """Publie dans Redis les modèles dont le p95 interactif local dépasse la cible, lit ceux des autres process."""
+        now = time.monotonic()
+        ttl_ms = int(Config.LLM_SCHEDULER_SIGNAL_SECONDS * 3000)
+        with self._lock:
+            models = list(self._states)
+            local = {model: self._interactive_p95(self._states[model], now) for model in models}
+        pressured = {
+            model: p95 for model, p95 in local.items()
+            if p95 is not None and p95 > Config.LLM_INTERACTIVE_LATENCY_TARGET_MS
+        }
+        if not models:
+            return
+        try:
+            pipe = _redis().pipeline(transaction=False)
+            for model, p95 in pressured.items():
+                pipe.set(PRESSURE_PREFIX + model, int(p95), px=ttl_ms)
+            for model in models:
+                pipe.pttl(PRESSURE_PREFIX + model)
+            ttls = pipe.execute()[len(pressured):]
+        except Exception as e:
+            logger.warning(f"LLM scheduler: pressure signal unavailable ({e})")
+            return
+        with self._lock:
+            self._remote_pressure = {
+                model: now + ttl / 1000 for model, ttl in zip(models, ttls) if ttl and ttl > 0
+            }
+
+    def _signal_loop(self) -> None:
+        while True:
+            time.sleep(Config.LLM_SCHEDULER_SIGNAL_SECONDS)
+            self.sync_pressure()
+
+    def _ensure_signal(self) -> None:
+        """Démarre le thread du signal partagé dans le process courant (à nouveau après un fork)."""
+        if not Config.LLM_SCHEDULER_SHARED_PRESSURE:
+            return
+        pid = os.getpid()
+        if self._signal_pid == pid:
+            return
+        with self._lock:
+            if self._signal_pid == pid:
+                return
+            self._signal_pid = pid
+        threading.Thread(target=self._signal_loop, name="llm-scheduler-signal", daemon=True).start()
+
+    # --- Cycle de vie ---
+    def reset(self) -> None:
+        """Après un fork : seaux et files propres au process."""
+        self._lock = threading.Lock()
+        self._states = {}
+        self._remote_pressure = {}
+        self._signal_pid = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        models: Dict[str, Any] = {}
+        with self._lock:
+            for model, state in self._states.items():
+                p95 = self._interactive_p95(state, now)
+                models[model] = {
+                    "available_requests": round(state.requests.level, 1) if state.requests else None,
+                    "available_tokens": round(state.tokens.level) if state.tokens else None,
+                    "waiting": dict(state.waiting),
+                    "admitted": dict(state.admitted),
+                    "deferred": state.deferred,
+                    "p95_queue_ms": {
+                        priority: round(_percentile(samples, 95), 1) for priority, samples in state.queue_waits.items()
+                    },
+                    "interactive_p95_ms": round(p95, 1) if p95 is not None else None,
+                    "under_pressure": self._under_pressure(model, state, now),
+                }
+        return {"enabled": Config.LLM_SCHEDULER_ENABLED, "models": models}
+
+
+scheduler = LLMScheduler()
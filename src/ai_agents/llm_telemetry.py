@@ -0,0 +1,328 @@
+"""
+Télémétrie des appels LLM, par agent et par modèle.
+
+Chaque appel passé par llm_provider (ou instrumenté avec track_llm_call)
+enregistre : latence totale, délai du premier token (streaming), tokens
+prompt/complétion (dont tokens de prompt servis par le cache OpenAI), coût
+estimé (LLM_PRICING_PER_1M_TOKENS), nouvelles tentatives HTTP, erreurs ;
+llm_json signale les réponses inexploitables (record_parse_failure) et
+celles récupérées au prix d'une réparation (record_parse_repair) ;
+llm_coalescing compte les appels servis par un appel identique (coalesced) ;
+llm_scheduler enregistre le temps passé en file et les reports du travail
+de fond (record_queue_wait).
+
+- llm_metrics() : compteurs et percentiles du process (endpoint /llm/metrics) ;
+- agrégat journalier dans Redis (hash llm:stats:<jour>, champs
+  agent|modèle|métrique), alimenté par un thread qui pousse les deltas toutes
+  les LLM_STATS_FLUSH_SECONDS avec le client synchrone : aucun aller-retour
+  Redis sur le chemin de l'appel, et pas de dépendance à une boucle asyncio
+  (workers Celery).
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+
+from src.config import Config
+
+logger = logging.getLogger("llm_telemetry")
+logger.setLevel(logging.INFO)
+
+STATS_PREFIX = "llm:stats:"
+LATENCY_SAMPLES = 512
+
+COUNTERS = (
+    "calls", "errors", "retries", "parse_failures", "parse_repairs", "coalesced",
+    "prompt_tokens", "completion_tokens", "cached_prompt_tokens",
+    "latency_ms_sum", "ttft_ms_sum", "ttft_count", "cost_usd",
+    "queue_ms_sum", "deferred",
+)
+FLOAT_COUNTERS = {"latency_ms_sum", "ttft_ms_sum", "cost_usd", "queue_ms_sum"}
+
+Key = Tuple[str, str]
+
+_lock = threading.Lock()
+_totals: Dict[Key, Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+_pending: Dict[Tuple[str, str, str], Dict[str, float]] = defaultdict(lambda: defaultdict(float))
+_latencies: Dict[Key, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+_ttfts: Dict[Key, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+_queue_waits: Dict[Key, Deque[float]] = defaultdict(lambda: deque(maxlen=LATENCY_SAMPLES))
+_flusher_pid: Optional[int] = None
+
+# Requêtes HTTP émises pendant l'appel en cours (hooks httpx de llm_provider)
+_http_requests: ContextVar[Optional[list]] = ContextVar("llm_http_requests", default=None)
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_prompt_tokens: int = 0) -> float:
+    """Coût estimé en USD (tokens de prompt en cache au tarif réduit s'il est configuré)."""
+    pricing = Config.LLM_PRICING_PER_1M_TOKENS.get(model)
+    if not pricing:
+        return 0.0
+    cached = min(cached_prompt_tokens, prompt_tokens)
+    cached_price = pricing.get("cached_input", pricing.get("input", 0.0))
+    return (
+        (prompt_tokens - cached) * pricing.get("input", 0.0)
+        + cached * cached_price
+        + completion_tokens * pricing.get("output", 0.0)
+    ) / 1_000_000
+
+
+def count_http_request(_request: Any = None) -> None:
+    """Hook de requête httpx (sync) : compte les tentatives de l'appel en cours."""
+    counter = _http_requests.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+async def acount_http_request(request: Any = None) -> None:
+    count_http_request(request)
+
+
+def _record(agent: str, model: str, values: Dict[str, float], latency_ms: Optional[float] = None,
+            ttft_ms: Optional[float] = None, queue_ms: Optional[float] = None) -> None:
+    key = (agent, model)
+    day = date.today().isoformat()
+    with _lock:
+        totals = _totals[key]
+        pending = _pending[(day, agent, model)]
+        for name, value in values.items():
+            if value:
+                totals[name] += value
+                pending[name] += value
+        if latency_ms is not None:
+            _latencies[key].append(latency_ms)
+        if ttft_ms is not None:
+            _ttfts[key].append(ttft_ms)
+        if queue_ms is not None:
+            _queue_waits[key].append(queue_ms)
+    _ensure_flusher()
+
+
+class LLMCall:
+    """Mesures d'un appel en cours (voir track_llm_call)."""
+
+    def __init__(self, agent: str, model: str):
+        self.agent = agent
+        self.model = model
+        self.started = time.perf_counter()
+        self.ttft_ms: Optional[float] = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.http_requests = [0]
+
+    def first_token(self) -> None:
+        if self.ttft_ms is None:
+            self.ttft_ms = (time.perf_counter() - self.started) * 1000
+
+    def set_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0, cached_prompt_tokens: int = 0) -> None:
+        self.prompt_tokens = int(prompt_tokens or 0)
+        self.completion_tokens = int(completion_tokens or 0)
+        self.cached_prompt_tokens = int(cached_prompt_tokens or 0)
+
+    def set_usage_from_message(self, message: Any) -> None:
+        """Usage d'un AIMessage langchain (usage_metadata), s'il est renseigné."""
+        usage = getattr(message, "usage_metadata", None)
+        if usage:
+            details = usage.get("input_token_details") or {}
+            self.set_usage(usage.get("input_tokens"), usage.get("output_tokens"), details.get("cache_read"))
+
+
+@contextmanager
+def track_llm_call(agent: str, model: str) -> Iterator[LLMCall]:
+    """Mesure un appel LLM ; une exception est comptée comme erreur puis propagée."""
+    call = LLMCall(agent, model)
+    _http_requests.set(call.http_requests)
+    error = False
+    try:
+        yield call
+    except BaseException:
+        error = True
+        raise
+    finally:
+        _http_requests.set(None)
+        latency_ms = (time.perf_counter() - call.started) * 1000
+        values = {
+            "calls": 1,
+            "errors": 1 if error else 0,
+            "retries": max(0, call.http_requests[0] - 1),
+            "prompt_tokens": call.prompt_tokens,
+            "completion_tokens": call.completion_tokens,
+            "cached_prompt_tokens": call.cached_prompt_tokens,
+            "latency_ms_sum": latency_ms,
+            "ttft_ms_sum": call.ttft_ms or 0.0,
+            "ttft_count": 1 if call.ttft_ms is not None else 0,
+            "cost_usd": estimate_cost(model, call.prompt_tokens, call.completion_tokens, call.cached_prompt_tokens),
+        }
+        _record(agent, model, values, latency_ms, call.ttft_ms)
+
+
+def record_parse_failure(agent: str, model: str = "unknown") -> None:
+    """Réponse LLM reçue mais inexploitable (JSON invalide, format inattendu)."""
+    _record(agent, model, {"parse_failures": 1})
+
+
+def record_parse_repair(agent: str, model: str = "unknown") -> None:
+    """Réponse LLM exploitée après réparation (JSON tronqué, virgules, éléments écartés)."""
+    _record(agent, model, {"parse_repairs": 1})
+
+
+def record_coalesced(agent: str, model: str = "unknown") -> None:
+    """Appel servi par un appel identique en cours ou récent (aucun token consommé)."""
+    _record(agent, model, {"coalesced": 1})
+
+
+def record_queue_wait(agent: str, model: str, queue_ms: float, deferred: bool = False) -> None:
+    """Attente avant l'envoi (seaux de débit, priorité, sémaphore) ; `deferred` : fond reporté."""
+    _record(agent, model, {"queue_ms_sum": queue_ms, "deferred": 1 if deferred else 0}, queue_ms=queue_ms)
+
+
+def _percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round((len(ordered) - 1) * pct / 100.0)))]
+
+
+def _summary(values: Dict[str, float]) -> Dict[str, Any]:
+    calls = values.get("calls", 0)
+    ttft_count = values.get("ttft_count", 0)
+    summary = {name: (round(values.get(name, 0.0), 6) if name in FLOAT_COUNTERS else int(values.get(name, 0)))
+               for name in COUNTERS}
+    summary["avg_latency_ms"] = round(values.get("latency_ms_sum", 0.0) / calls, 1) if calls else 0.0
+    summary["avg_ttft_ms"] = round(values.get("ttft_ms_sum", 0.0) / ttft_count, 1) if ttft_count else None
+    summary["avg_queue_ms"] = round(values.get("queue_ms_sum", 0.0) / calls, 1) if calls else 0.0
+    return summary
+
+
+def llm_metrics() -> Dict[str, Any]:
+    """Compteurs du process depuis son démarrage, par agent puis par modèle."""
+    with _lock:
+        snapshot = {key: dict(values) for key, values in _totals.items()}
+        latencies = {key: list(samples) for key, samples in _latencies.items()}
+        ttfts = {key: list(samples) for key, samples in _ttfts.items()}
+        queue_waits = {key: list(samples) for key, samples in _queue_waits.items()}
+
+    metrics: Dict[str, Dict[str, Any]] = defaultdict(dict)
+    for (agent, model), values in sorted(snapshot.items()):
+        summary = _summary(values)
+        summary["p50_latency_ms"] = round(_percentile(latencies.get((agent, model)), 50), 1)
+        summary["p95_latency_ms"] = round(_percentile(latencies.get((agent, model)), 95), 1)
+        if ttfts.get((agent, model)):
+            summary["p95_ttft_ms"] = round(_percentile(ttfts[(agent, model)], 95), 1)
+        if queue_waits.get((agent, model)):
+            summary["p95_queue_ms"] = round(_percentile(queue_waits[(agent, model)], 95), 1)
+        metrics[agent][model] = summary
+    return {"pid": os.getpid(), "agents": dict(metrics)}
+
+
+# --- Agrégat journalier Redis ---
+def flush_llm_stats() -> int:
+    """Pousse les deltas en attente dans Redis ; retourne le nombre de champs mis à jour."""
+    with _lock:
+        pending = {key: dict(values) for key, values in _pending.items()}
+        _pending.clear()
+    if not pending:
+        return 0
+
+    updated = 0
+    try:
+        from src.db.redis import r_sync
+
+        pipe = r_sync.pipeline(transaction=False)
+        days = set()
+        for (day, agent, model), values in pending.items():
+            days.add(day)
+            for name, value in values.items():
+                field = f"{agent}|{model}|{name}"
+                if name in FLOAT_COUNTERS:
+                    pipe.hincrbyfloat(STATS_PREFIX + day, field, value)
+                else:
+                    pipe.hincrby(STATS_PREFIX + day, field, int(value))
+                updated += 1
+        for day in days:
+            pipe.expire(STATS_PREFIX + day, Config.LLM_STATS_RETENTION_DAYS * 86400)
+        pipe.execute()
+    except Exception as e:
+        # Remettre les deltas pour la prochaine tentative
+        logger.warning(f"LLM stats flush failed: {e}")
+        with _lock:
+            for key, values in pending.items():
+                for name, value in values.items():
+                    _pending[key][name] += value
+        return 0
+    return updated
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(Config.LLM_STATS_FLUSH_SECONDS)
+        flush_llm_stats()
+
+
+def _ensure_flusher() -> None:
+    """Démarre le thread de flush du process courant (à nouveau après un fork)."""
+    global _flusher_pid
+    pid = os.getpid()
+    if _flusher_pid == pid:
+        return
+    with _lock:
+        if _flusher_pid == pid:
+            return
+        _flusher_pid = pid
+    threading.Thread(target=_flush_loop, name="llm-stats-flush", daemon=True).start()
+
+
+def reset_llm_telemetry() -> None:
+    """Après un fork : repartir de compteurs vides (ceux du parent sont à lui)."""
+    global _lock, _flusher_pid
+    _lock = threading.Lock()
+    _totals.clear()
+    _pending.clear()
+    _latencies.clear()
+    _ttfts.clear()
+    _queue_waits.clear()
+    _flusher_pid = None
+
+
+async def get_daily_report(r, day: Optional[str] = None) -> Dict[str, Any]:
+    """Rapport d'une journée (tous process confondus) depuis Redis (`r` : client async)."""
+    day = day or date.today().isoformat()
+    return _build_report(day, await r.hgetall(STATS_PREFIX + day))
+
+
+def _build_report(day: str, raw: Dict[str, str]) -> Dict[str, Any]:
+    grouped: Dict[Key, Dict[str, float]] = defaultdict(dict)
+    for field, value in raw.items():
+        agent, model, name = field.rsplit("|", 2)
+        grouped[(agent, model)][name] = float(value)
+
+    agents: Dict[str, Dict[str, Any]] = defaultdict(dict)
+    totals: Dict[str, float] = defaultdict(float)
+    for (agent, model), values in sorted(grouped.items()):
+        agents[agent][model] = _summary(values)
+        for name in ("calls", "errors", "prompt_tokens", "completion_tokens", "cost_usd", "latency_ms_sum"):
+            totals[name] += values.get(name, 0.0)
+
+    return {
+        "day": day,
+        "generated_at": datetime.now().isoformat(),
+        "agents": dict(agents),
+        "totals": {
+            "calls": int(totals["calls"]),
+            "errors": int(totals["errors"]),
+            "prompt_tokens": int(totals["prompt_tokens"]),
+            "completion_tokens": int(totals["completion_tokens"]),
+            "cost_usd": round(totals["cost_usd"], 4),
+            "latency_s": round(totals["latency_ms_sum"] / 1000, 1),
+        },
+    }
+
+
+atexit.register(flush_llm_stats)
@@ -2,12 +2,12 @@
 Modèles de base de données pour les agents IA.
 Ces modèles sont automatiquement pris en compte par Alembic.
 """
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 from datetime import datetime
 from uuid import UUID, uuid4
 
 from sqlmodel import SQLModel, Field, Column
-from sqlalchemy import JSON, Text
+from sqlalchemy import JSON, Text, ForeignKey, Index, text
 import sqlalchemy.dialects.postgresql as pg
 
 
@@ -67,19 +67,22 @@ class AgentContext(SQLModel, table=True):
         default_factory=dict
     )
 
-    conversation_history: List[Dict[str, Any]] = Field(
+    # Métriques et suivi (l'historique est dans agent_context_messages)
+    total_interactions: int = Field(
         sa_column=Column(
-            JSON,
-            default=list
+            pg.INTEGER,
+            default=0
         ),
-        default_factory=list
+        default=0
     )
 
-    # Métriques et suivi
-    total_interactions: int = Field(
+    # Numéro du dernier message ajouté (source de AgentContextMessage.seq)
+    message_count: int = Field(
         sa_column=Column(
             pg.INTEGER,
-            default=0
+            nullable=False,
+            default=0,
+            server_default="0"
         ),
         default=0
     )
@@ -114,3 +117,83 @@ class AgentContext(SQLModel, table=True):
     class Config:
         arbitrary_types_allowed = True
 
+
+
+class AgentContextMessage(SQLModel, table=True):
+    """
+    Historique append-only des messages d'un contexte agent.
+    Une ligne par message : l'ajout ne réécrit jamais les messages précédents.
+    """
+    __tablename__ = "agent_context_messages"
+    __table_args__ = (
+        Index("ix_agent_context_messages_context_id_seq", "context_id", "seq", unique=True),
+    )
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column(
+            pg.BIGINT,
+            primary_key=True,
+            autoincrement=True
+        )
+    )
+
+    context_id: UUID = Field(
+        sa_column=Column(
+            pg.UUID,
+            ForeignKey("agent_contexts.id", ondelete="CASCADE"),
+            nullable=False
+        )
+    )
+
+    # Position du message dans la session (1, 2, 3, ...)
+    seq: int = Field(
+        sa_column=Column(
+            pg.INTEGER,
+            nullable=False
+        )
+    )
+
+    agent: str = Field(
+        sa_column=Column(
+            Text,
+            nullable=False
+        )
+    )
+
+    message_type: str = Field(
+        sa_column=Column(
+            Text,
+            nullable=False,
+            default="agent"
+        ),
+        default="agent"
+    )
+
+    message: str = Field(
+        sa_column=Column(
+            Text,
+            nullable=False
+        )
+    )
+
+    created_at: datetime = Field(
+        sa_column=Column(
+            pg.TIMESTAMP(timezone=True),
+            nullable=False,
+            server_default=text("NOW()")
+        )
+    )
+
+    def to_entry(self) -> Dict[str, Any]:
+        """Format historique exposé aux agents (identique à l'ancien JSON)"""
+        return {
+            "seq": self.seq,
+            "timestamp": self.created_at.isoformat() if self.created_at else None,
+            "agent": self.agent,
+            "type": self.message_type,
+            "message": self.message
+        }
+
+    def __repr__(self) -> str:
+        return f"AgentContextMessage(context_id={self.context_id}, seq={self.seq}, agent={self.agent})"
@@ -1,7 +1,6 @@
 from __future__ import annotations
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
 import langchain
-from src.config import Config
 
 langchain.verbose = False
 langchain.debug = False
@@ -249,11 +248,7 @@ def analyze_profile_with_llm(user_json: str, evaluation_json: str, domaine: str
     """
     from src.ai_agents.profiler.domain_context import get_domain_specific_prompt
 
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",
-        temperature=0.3,
-        api_key=Config.OPENAI_API_KEY
-    )
+    llm = get_chat_model("gpt-4o-mini", temperature=0.3, agent="analyze_profile_with_llm")
 
     # Obtenir le prompt contextualisé au domaine
     domain_context = get_domain_specific_prompt(domaine)
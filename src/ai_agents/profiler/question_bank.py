@@ -0,0 +1,326 @@
+"""
+Banque de questions de profilage pré-générées (collection MongoDB question_bank).
+
+Le prompt de generate_profile_question ne dépend que du statut, des
+compétences, des objectifs et du niveau : les quiz sont donc servis depuis
+une banque découpée en buckets (statut, tranche de niveau, famille de
+compétences) au lieu d'un appel gpt-4o-mini par apprenant.
+
+- serve_quiz() : tire un quiz dans le bucket de l'utilisateur (questions les
+  moins servies en priorité, composition fixe par type) et incrémente leur
+  compteur d'usage. Retourne None si le bucket est trop pauvre.
+- refill_question_bank() : job de fond (Celery beat) qui complète les
+  buckets sous QUESTION_BANK_MIN_AVAILABLE_PER_TYPE questions disponibles.
+  Les doublons sont écartés par un index unique (bucket, hash du texte).
+- Une question servie QUESTION_BANK_MAX_SERVES fois n'est plus tirée : la
+  banque se renouvelle au fil des recharges.
+"""
+import hashlib
+import logging
+import random
+import re
+import time
+import unicodedata
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from celery.exceptions import SoftTimeLimitExceeded
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError
+
+from src.config import Config
+from src.ai_agents.llm_json import LLMOutputError, parse_llm_output
+from src.db.mongo_db import get_sync_mongo_db
+
+logger = logging.getLogger("question_bank")
+logger.setLevel(logging.INFO)
+
+COLLECTION = "question_bank"
+REFILL_NUDGE_KEY = "question_bank:refill:"
+REFILL_NUDGE_TTL = 300  # secondes
+
+STATUSES = ["Etudiant", "Professeur"]
+
+# Tranches de niveau (niveau_technique 1-10)
+LEVEL_BANDS: List[Tuple[str, int, int]] = [
+    ("debutant", 1, 3),
+    ("intermediaire", 4, 6),
+    ("avance", 7, 10),
+]
+
+# Familles de compétences : mots-clés reconnus dans les compétences déclarées
+COMPETENCE_CLUSTERS: Dict[str, List[str]] = {
+    "deep_learning": ["deep", "neurone", "neural", "tensorflow", "pytorch", "keras", "cnn", "rnn", "lstm", "transformer"],
+    "nlp": ["nlp", "langage", "language", "texte", "text", "chatbot", "llm", "gpt", "hugging"],
+    "vision": ["vision", "image", "opencv", "detection", "détection", "yolo"],
+    "machine_learning": ["machine learning", "ml", "scikit", "sklearn", "regression", "régression", "classification", "xgboost"],
+    "data": ["python", "data", "donnée", "pandas", "numpy", "sql", "statistique"],
+}
+DEFAULT_CLUSTER = "general"
+
+# Composition d'un quiz servi depuis la banque (ordre de présentation)
+QUIZ_COMPOSITION: List[Tuple[str, int]] = [
+    ("ChoixMultiple", 4),
+    ("QuestionOuverte", 3),
+    ("ListeOuverte", 3),
+]
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"[^a-z0-9]+", " ", text).strip()
+
+
+def question_hash(text: str) -> str:
+    """Empreinte du texte normalisé (casse, accents, ponctuation ignorés)."""
+    return hashlib.sha1(_normalize(text).encode("utf-8")).hexdigest()
+
+
+def level_band(niveau: Optional[int]) -> str:
+    niveau = int(niveau or 5)
+    for name, low, high in LEVEL_BANDS:
+        if low <= niveau <= high:
+            return name
+    return LEVEL_BANDS[-1][0] if niveau > 10 else LEVEL_BANDS[0][0]
+
+
+def competence_cluster(competences: Iterable[str]) -> str:
+    """Famille majoritaire parmi les compétences déclarées (general si aucune)."""
+    text = " ".join(_normalize(str(c)) for c in competences or [])
+    if not text:
+        return DEFAULT_CLUSTER
+    best, best_hits = DEFAULT_CLUSTER, 0
+    for cluster, keywords in COMPETENCE_CLUSTERS.items():
+        hits = sum(1 for k in keywords if re.search(rf"\b{re.escape(_normalize(k))}\b", text))
+        if hits > best_hits:
+            best, best_hits = cluster, hits
+    return best
+
+
+def bucket_for_user(user_data: Dict[str, Any]) -> Dict[str, str]:
+    status = user_data.get("status") or STATUSES[0]
+    status = str(getattr(status, "value", status))
+    competences = user_data.get("competences") or user_data.get("specialites") or []
+    band = level_band(user_data.get("niveau_technique"))
+    cluster = competence_cluster(competences)
+    return {"status": status, "level_band": band, "cluster": cluster, "key": f"{status}:{band}:{cluster}"}
+
+
+def all_buckets() -> List[Dict[str, str]]:
+    return [
+        {"status": status, "level_band": band, "cluster": cluster, "key": f"{status}:{band}:{cluster}"}
+        for status in STATUSES
+        for band, _, _ in LEVEL_BANDS
+        for cluster in [*COMPETENCE_CLUSTERS, DEFAULT_CLUSTER]
+    ]
+
+
+def _available_filter(bucket_key: str, q_type: str) -> Dict[str, Any]:
+    return {
+        "bucket": bucket_key,
+        "type": q_type,
+        "served_count": {"$lt": Config.QUESTION_BANK_MAX_SERVES},
+    }
+
+
+def serve_quiz(user_data: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+    """
+    Quiz tiré de la banque pour ce profil, ou None si le bucket ne couvre pas
+    la composition demandée (l'appelant génère alors avec le LLM).
+    """
+    collection = get_sync_mongo_db()[COLLECTION]
+    bucket = bucket_for_user(user_data)
+    picked: List[Dict[str, Any]] = []
+
+    for q_type, count in QUIZ_COMPOSITION:
+        # Les moins servies d'abord, tirage aléatoire parmi elles pour varier
+        pool = list(
+            collection.find(
+                _available_filter(bucket["key"], q_type),
+                {"question": 1, "type": 1, "options": 1, "correction": 1},
+            )
+            .sort("served_count", ASCENDING)
+            .limit(count * Config.QUESTION_BANK_SAMPLE_FACTOR)
+        )
+        if len(pool) < count:
+            return None
+        picked.extend(random.sample(pool, count))
+
+    collection.update_many(
+        {"_id": {"$in": [q["_id"] for q in picked]}},
+        {"$inc": {"served_count": 1}, "$set": {"last_served_at": datetime.now()}},
+    )
+
+    return [
+        {
+            "numero": i,
+            "question": q["question"],
+            "type": q["type"],
+            "options": q.get("options") or [],
+            "correction": q.get("correction", ""),
+        }
+        for i, q in enumerate(picked, start=1)
+    ]
+
+
+def _valid_question(q: Any) -> bool:
+    from src.ai_agents.profiler.question_generator import ALLOWED_TYPES
+
+    if not isinstance(q, dict) or not str(q.get("question") or "").strip():
+        return False
+    if q.get("type") not in ALLOWED_TYPES:
+        return False
+    if q["type"] == "ChoixMultiple" and len(q.get("options") or []) != 4:
+        return False
+    return True
+
+
+def store_questions(bucket: Dict[str, str], questions: Iterable[Dict[str, Any]], source: str = "llm") -> int:
+    """Ajoute des questions valides au bucket ; retourne le nombre de nouvelles (doublons ignorés)."""
+    now = datetime.now()
+    docs = [
+        {
+            "bucket": bucket["key"],
+            "status": bucket["status"],
+            "level_band": bucket["level_band"],
+            "cluster": bucket["cluster"],
+            "type": q["type"],
+            "question": str(q["question"]).strip(),
+            "options": q.get("options") or [],
+            "correction": q.get("correction", ""),
+            "hash": question_hash(str(q["question"])),
+            "source": source,
+            "served_count": 0,
+            "created_at": now,
+            "last_served_at": None,
+        }
+        for q in questions
+        if _valid_question(q)
+    ]
+    if not docs:
+        return 0
+    try:
+        result = get_sync_mongo_db()[COLLECTION].insert_many(docs, ordered=False)
+        return len(result.inserted_ids)
+    except BulkWriteError as e:
+        # 11000 = doublon (bucket, hash) : attendu, les autres erreurs remontent
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        return e.details.get("nInserted", 0)
+
+
+def bucket_shortfall(bucket_key: str) -> Dict[str, int]:
+    """Questions manquantes par type pour atteindre le seuil de disponibilité."""
+    collection = get_sync_mongo_db()[COLLECTION]
+    shortfall = {}
+    for q_type, _ in QUIZ_COMPOSITION:
+        available = collection.count_documents(
+            _available_filter(bucket_key, q_type),
+            limit=Config.QUESTION_BANK_MIN_AVAILABLE_PER_TYPE,
+        )
+        if available < Config.QUESTION_BANK_MIN_AVAILABLE_PER_TYPE:
+            shortfall[q_type] = Config.QUESTION_BANK_MIN_AVAILABLE_PER_TYPE - available
+    return shortfall
+
+
+def _representative_user(bucket: Dict[str, str]):
+    """Profil type d'un bucket, pour le prompt de generate_profile_question."""
+    from types import SimpleNamespace
+
+    low, high = next((low, high) for name, low, high in LEVEL_BANDS if name == bucket["level_band"])
+    keywords = COMPETENCE_CLUSTERS.get(bucket["cluster"], [])
+    return SimpleNamespace(
+        status=bucket["status"],
+        competences=keywords[:4] or ["Aucune"],
+        objectifs_apprentissage="Progresser en Intelligence Artificielle",
+        niveau_technique=random.randint(low, high),
+    )
+
+
+def generate_into_bucket(bucket: Dict[str, str]) -> int:
+    """Un appel LLM pour le bucket ; retourne le nombre de questions ajoutées."""
+    from src.ai_agents.profiler.question_generator import generate_profile_question
+
+    # Pas de coalescence : chaque remplissage doit produire de nouvelles questions
+    raw = generate_profile_question(_representative_user(bucket), coalesce=False)
+    try:
+        parsed = parse_llm_output(raw, "question_bank_refill", "gpt-4o-mini")
+    except LLMOutputError:
+        logger.warning(f"Question bank refill for {bucket['key']}: unparsable LLM output")
+        return 0
+    return store_questions(bucket, parsed)
+
+
+def refill_question_bank(
+    buckets: Optional[List[Dict[str, str]]] = None,
+    max_llm_calls: Optional[int] = None,
+    time_budget: Optional[float] = None,
+) -> Dict[str, Any]:
+    """
+    Complète les buckets sous le seuil, au plus `max_llm_calls` appels LLM par
+    exécution (les buckets les plus pauvres d'abord). Aucun nouvel appel n'est
+    lancé une fois `time_budget` secondes écoulées : le reste attend la
+    prochaine exécution.
+    """
+    max_llm_calls = max_llm_calls or Config.QUESTION_BANK_REFILL_MAX_CALLS
+    time_budget = time_budget or Config.QUESTION_BANK_REFILL_TIME_BUDGET_SECONDS
+    deadline = time.monotonic() + time_budget
+    needs = []
+    for bucket in buckets or all_buckets():
+        shortfall = bucket_shortfall(bucket["key"])
+        if shortfall:
+            needs.append((sum(shortfall.values()), bucket))
+    needs.sort(key=lambda item: item[0], reverse=True)
+
+    report = {"buckets_below_threshold": len(needs), "llm_calls": 0, "inserted": 0, "errors": 0, "out_of_time": False}
+    for _, bucket in needs:
+        # Un bucket peut demander plusieurs appels (10 questions par appel)
+        while report["llm_calls"] < max_llm_calls and bucket_shortfall(bucket["key"]):
+            if time.monotonic() >= deadline:
+                report["out_of_time"] = True
+                break
+            report["llm_calls"] += 1
+            try:
+                inserted = generate_into_bucket(bucket)
+            except SoftTimeLimitExceeded:
+                raise
+            except Exception as e:
+                report["errors"] += 1
+                logger.warning(f"Question bank refill for {bucket['key']} failed: {e}")
+                break
+            report["inserted"] += inserted
+            if inserted == 0:
+                break
+        if report["llm_calls"] >= max_llm_calls or report["out_of_time"]:
+            break
+    return report
+
+
+def request_bucket_refill(bucket: Dict[str, str]) -> None:
+    """Demande une recharge ciblée du bucket (au plus une toutes les REFILL_NUDGE_TTL secondes)."""
+    try:
+        from src.db.redis import r_sync
+        if r_sync.set(REFILL_NUDGE_KEY + bucket["key"], "1", nx=True, ex=REFILL_NUDGE_TTL):
+            from src.celery_tasks import refill_question_bank_task
+            refill_question_bank_task.delay([bucket])
+    except Exception as e:
+        logger.warning(f"Question bank refill request failed: {e}")
+
+
+def question_bank_stats() -> List[Dict[str, Any]]:
+    """Questions disponibles et servies par bucket et par type."""
+    pipeline = [
+        {"$group": {
+            "_id": {"bucket": "$bucket", "type": "$type"},
+            "total": {"$sum": 1},
+            "available": {"$sum": {"$cond": [{"$lt": ["$served_count", Config.QUESTION_BANK_MAX_SERVES]}, 1, 0]}},
+            "served": {"$sum": "$served_count"},
+        }},
+        {"$sort": {"_id.bucket": 1, "_id.type": 1}},
+    ]
+    return [
+        {"bucket": row["_id"]["bucket"], "type": row["_id"]["type"], **{k: row[k] for k in ("total", "available", "served")}}
+        for row in get_sync_mongo_db()[COLLECTION].aggregate(pipeline)
+    ]
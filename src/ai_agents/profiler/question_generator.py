@@ -1,6 +1,6 @@
 from langchain_ollama import ChatOllama
 import langchain
-from langchain_openai import ChatOpenAI
+from src.ai_agents.llm_provider import get_chat_model
 
 from src.config import Config
 
@@ -69,8 +69,8 @@ EXEMPLES INVALIDES :
 GÉNÈRE MAINTENANT 10 QUESTIONS IA (JSON uniquement) :
 """
 
-def generate_profile_question(user: UtilisateurRead) -> str:
-    """Génère 10 questions personnalisées rapidement."""
+def generate_profile_question(user: UtilisateurRead, coalesce: bool = True) -> str:
+    """Génère 10 questions personnalisées rapidement (coalesce=False : toujours un nouvel appel)."""
     prompt = BASE_PROMPT.format(
         status=user.status,
         competences=", ".join(user.competences or ["Aucune"]),
@@ -79,11 +79,8 @@ def generate_profile_question(user: UtilisateurRead) -> str:
     )
 
     # Configuration LLM optimisée pour la vitesse
-    llm = ChatOpenAI(
-        model="gpt-4o-mini",  # Corrigé : gpt-5-mini n'existe pas
-        api_key=Config.OPENAI_API_KEY,
-        temperature=0.7
-    )
+    llm = get_chat_model("gpt-4o-mini", temperature=0.7, agent="generate_profile_question",
+                         coalesce=coalesce)  # Corrigé : gpt-5-mini n'existe pas
     question = llm.invoke(prompt)
     return question.content
 
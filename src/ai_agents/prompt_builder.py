@@ -0,0 +1,233 @@
+"""
+Assemblage des prompts du chatbot sous budget de tokens.
+
+ChatbotAgent.chat et chatbot_streaming_task construisent le même prompt :
+prompt système, contexte utilisateur (profil + progression), historique
+récent, message courant. Sans borne, sa taille (donc la latence et le coût
+de chaque tour) suit celle du profil et de la conversation. Ici :
+
+- le contexte est sérialisé en JSON compact (sans indentation) ;
+- la progression est résumée (listes tronquées, profondeur bornée) au-delà
+  de CHAT_PROGRESSION_MAX_TOKENS ;
+- l'historique est pris du plus récent au plus ancien tant que le budget
+  CHAT_PROMPT_TOKEN_BUDGET le permet ; les échanges écartés sont résumés en
+  une ligne ;
+- le nombre de tokens de chaque partie est retourné avec le prompt.
+
+Le comptage utilise tiktoken (dépendance de langchain-openai) ; à défaut,
+une estimation à 4 caractères par token.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from src.config import Config
+
+logger = logging.getLogger("prompt_builder")
+logger.setLevel(logging.INFO)
+
+MESSAGE_OVERHEAD_TOKENS = 4  # rôle + séparateurs, par message (format chat OpenAI)
+TRUNCATION_MARK = " […]"
+
+_encoding = None
+_encoding_failed = False
+
+
+def _get_encoding():
+    global _encoding, _encoding_failed
+    if _encoding is None and not _encoding_failed:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding(Config.CHAT_TOKENIZER_ENCODING)
+        except Exception as e:
+            # Paquet absent ou fichier BPE non téléchargeable : estimation
+            _encoding_failed = True
+            logger.warning(f"tiktoken unavailable, estimating token counts: {e}")
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return len(text) // 4 + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Coupe `text` à `max_tokens` tokens (marque de troncature incluse)."""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    encoding = _get_encoding()
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return encoding.decode(tokens[:max(0, max_tokens - 2)]) + TRUNCATION_MARK
+    return text[:max(0, max_tokens - 2) * 4] + TRUNCATION_MARK
+
+
+def compact_json(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def summarize_structure(value: Any, max_items: int = 5, max_depth: int = 3, max_str: int = 200) -> Any:
+    """
+    Version réduite d'une structure JSON : listes limitées à `max_items`
+    éléments (avec le nombre total), profondeur et chaînes bornées.
+    """
+    if isinstance(value, str):
+        return value if len(value) <= max_str else value[:max_str] + "…"
+    if max_depth <= 0:
+        if isinstance(value, dict):
+            return f"{{{len(value)} champs}}"
+        if isinstance(value, list):
+            return f"[{len(value)} éléments]"
+        return value
+    if isinstance(value, dict):
+        return {k: summarize_structure(v, max_items, max_depth - 1, max_str) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [summarize_structure(v, max_items, max_depth - 1, max_str) for v in value[-max_items:]]
+        if len(value) > max_items:
+            items.insert(0, f"{len(value) - max_items} éléments plus anciens omis")
+        return items
+    return value
+
+
+def _fit_progression(progression: Any, max_tokens: int) -> str:
+    text = compact_json(progression)
+    if count_tokens(text) <= max_tokens:
+        return text
+    for max_items, max_depth in ((5, 3), (3, 2), (1, 1)):
+        text = compact_json(summarize_structure(progression, max_items, max_depth))
+        if count_tokens(text) <= max_tokens:
+            return text
+    return truncate_to_tokens(text, max_tokens)
+
+
+def _join(values: Optional[Iterable[Any]], limit: int, default: str) -> str:
+    values = [str(v) for v in values or [] if v]
+    if not values:
+        return default
+    if len(values) > limit:
+        return ", ".join(values[:limit]) + f" (+{len(values) - limit})"
+    return ", ".join(values)
+
+
+def build_user_context(user_context: Dict[str, Any]) -> str:
+    """Bloc « PROFIL APPRENANT » (+ progression) à partir du contexte utilisateur."""
+    lines = [f"- Niveau : {user_context.get('niveau_technique', 5)}/10"]
+    if "competences" in user_context:
+        lines.append(f"- Compétences : {_join(user_context.get('competences'), 10, 'Non identifiées')}")
+    if "objectifs" in user_context:
+        lines.append(f"- Objectifs : {user_context.get('objectifs') or 'Non définis'}")
+    if "xp" in user_context:
+        lines.append(f"- XP : {user_context.get('xp') or 0}")
+    if "strengths" in user_context or "weaknesses" in user_context:
+        lines.append(f"- Forces : {_join(user_context.get('strengths'), 5, 'Non identifiées')}")
+        lines.append(f"- Faiblesses : {_join(user_context.get('weaknesses'), 5, 'Non identifiées')}")
+    if "current_courses" in user_context:
+        lines.append(f"- Cours actifs : {len(user_context.get('current_courses') or [])} cours en cours")
+    if "learning_path" in user_context:
+        lines.append(f"- Parcours : {(user_context.get('learning_path') or {}).get('titre', 'Non défini')}")
+
+    context = "PROFIL APPRENANT :\n" + "\n".join(lines)
+    progression = user_context.get("progression")
+    if progression:
+        context += "\n\nPROGRESSION ACTUELLE :\n" + _fit_progression(progression, Config.CHAT_PROGRESSION_MAX_TOKENS)
+    return context
+
+
+def _history_entry(entry: Dict[str, Any]) -> Tuple[str, str]:
+    """(rôle, contenu) pour les deux formats d'historique (shared_context / chat_conversations)."""
+    role = entry.get("role") or entry.get("agent")
+    content = entry.get("content") if entry.get("content") is not None else entry.get("message", "")
+    return ("user" if role == "user" else "assistant"), str(content or "")
+
+
+def _summarize_dropped(dropped: List[Tuple[str, str]]) -> str:
+    topics = [" ".join(content.split()[:12]) for role, content in dropped if role == "user" and content.strip()]
+    summary = f"Échanges précédents non repris : {len(dropped)} messages."
+    if topics:
+        summary += " Sujets abordés : " + " | ".join(topics[-5:])
+    return summary
+
+
+@dataclass
+class ChatPrompt:
+    """Prompt assemblé : messages (rôle, contenu) et comptage de tokens par partie."""
+    messages: List[Tuple[str, str]]
+    token_counts: Dict[str, int] = field(default_factory=dict)
+    history_kept: int = 0
+    history_dropped: int = 0
+
+    def as_openai(self) -> List[Dict[str, str]]:
+        return [{"role": role, "content": content} for role, content in self.messages]
+
+    def as_langchain(self) -> list:
+        from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+        classes = {"system": SystemMessage, "user": HumanMessage, "assistant": AIMessage}
+        return [classes[role](content=content) for role, content in self.messages]
+
+    def stats(self) -> Dict[str, int]:
+        return {**self.token_counts, "history_kept": self.history_kept, "history_dropped": self.history_dropped}
+
+
+def build_chat_prompt(
+    system_prompt: str,
+    user_context: Dict[str, Any],
+    history: Iterable[Dict[str, Any]],
+    message: str,
+    token_budget: Optional[int] = None,
+) -> ChatPrompt:
+    """
+    Assemble le prompt du chatbot dans `token_budget` tokens (hors réponse).
+    Le prompt système, le contexte et le message courant sont toujours
+    présents ; l'historique occupe le reste, des plus récents aux plus anciens.
+    """
+    budget = token_budget or Config.CHAT_PROMPT_TOKEN_BUDGET
+
+    message = truncate_to_tokens(message, Config.CHAT_MESSAGE_MAX_TOKENS)
+    context_text = f"CONTEXTE UTILISATEUR:\n{build_user_context(user_context or {})}"
+
+    counts = {
+        "system": count_tokens(system_prompt) + MESSAGE_OVERHEAD_TOKENS,
+        "context": count_tokens(context_text) + MESSAGE_OVERHEAD_TOKENS,
+        "message": count_tokens(message) + MESSAGE_OVERHEAD_TOKENS,
+        "history": 0,
+    }
+    remaining = budget - sum(counts.values())
+
+    entries = [_history_entry(h) for h in history or []]
+    kept: List[Tuple[str, str]] = []
+    dropped_count = 0
+    # Réserver la place de la ligne de résumé des échanges écartés
+    summary_reserve = 60 + MESSAGE_OVERHEAD_TOKENS
+    for index in range(len(entries) - 1, -1, -1):
+        role, content = entries[index]
+        content = truncate_to_tokens(content, Config.CHAT_HISTORY_MESSAGE_MAX_TOKENS)
+        cost = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        reserve = summary_reserve if index > 0 else 0
+        if cost + reserve > remaining:
+            dropped_count = index + 1
+            break
+        kept.append((role, content))
+        remaining -= cost
+        counts["history"] += cost
+    kept.reverse()
+
+    messages: List[Tuple[str, str]] = [("system", system_prompt), ("system", context_text)]
+    if dropped_count:
+        summary = truncate_to_tokens(_summarize_dropped(entries[:dropped_count]), 60)
+        messages.append(("system", summary))
+        counts["history"] += count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+    messages.extend(kept)
+    messages.append(("user", message))
+
+    counts["total"] = counts["system"] + counts["context"] + counts["history"] + counts["message"]
+    if counts["total"] > budget:
+        logger.warning(f"Chat prompt over budget: {counts['total']} > {budget} tokens")
+    return ChatPrompt(messages=messages, token_counts=counts, history_kept=len(kept), history_dropped=dropped_count)
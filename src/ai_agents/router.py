@@ -1,13 +1,17 @@
 """
 Routes API pour les agents IA (chatbot, cours, progression, etc.)
 """
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from typing import List, Dict, Any, Optional
 from pydantic import BaseModel, Field
-from datetime import datetime, UTC
-
-from src.users.dependencies import get_current_user
-from src.users.models import Utilisateur as User
+from datetime import date, datetime, UTC
+
+from src.users.dependencies import get_current_user, RoleChecker
+from src.users.models import Utilisateur as User, StatutUtilisateur
+from src.users.schema import UtilisateurRead
+from src.db.redis import r as redis_client
+from src.ai_agents.llm_provider import llm_provider_stats
+from src.ai_agents.llm_telemetry import get_daily_report, llm_metrics
 from src.ai_agents.agents.chatbot_agent import chatbot_agent
 from src.ai_agents.agents.course_manager_agent import course_manager_agent
 from src.ai_agents.agents.tutoring_agent import tutoring_agent
@@ -1177,3 +1181,34 @@ J'ai généré un parcours de {duration_weeks} semaines adapté à ton niveau ({
             detail=f"Erreur génération roadmap: {str(e)}"
         )
 
+
+
+# ==================== TÉLÉMÉTRIE LLM ====================
+
+@ai_router.get("/llm/metrics")
+async def get_llm_metrics(
+    _admin: UtilisateurRead = Depends(RoleChecker([StatutUtilisateur.Administrateur.value]))
+):
+    """
+    Métriques LLM de ce process (latence, TTFT, tokens, coût, retries,
+    erreurs de parsing) par agent et par modèle, et état du transport partagé.
+    """
+    return {
+        "process": llm_metrics(),
+        "provider": llm_provider_stats()
+    }
+
+
+@ai_router.get("/llm/metrics/daily")
+async def get_llm_daily_report(
+    day: Optional[date] = Query(None, description="Jour (AAAA-MM-JJ), aujourd'hui par défaut"),
+    _admin: UtilisateurRead = Depends(RoleChecker([StatutUtilisateur.Administrateur.value]))
+):
+    """Rapport journalier agrégé dans Redis (tous les process API et workers Celery)."""
+    try:
+        return await get_daily_report(redis_client, day.isoformat() if day else None)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Rapport indisponible: {str(e)}"
+        )
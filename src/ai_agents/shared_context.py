@@ -1,37 +1,92 @@
 """
 Contexte partagé entre tous les agents multi-agents.
 Stocké dans PostgreSQL pour persistence et dans Redis pour performance.
+Toutes les opérations passent par l'engine async (asyncpg) de src.db.main
+pour ne jamais bloquer la boucle d'événements.
+
+L'historique de conversation est stocké ligne par ligne dans
+agent_context_messages : un ajout coûte un UPDATE de compteur + un INSERT,
+quelle que soit la taille de la session.
 """
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 from datetime import datetime, timezone
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, Session
 import json as json_lib
 
-from src.config import Config
+from sqlalchemy import func, update
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.db.main import async_session
 from src.db.redis import r as redis_client
-from src.ai_agents.models import AgentContext
+from src.db.cache_namespaces import cache_set, cache_delete
+from src.ai_agents.models import AgentContext, AgentContextMessage
+
+
+CONTEXT_CACHE_TTL = 3600  # 1h
 
 
 class SharedContextService:
     """Service pour gérer le contexte partagé entre agents"""
 
     def __init__(self):
-        # Utiliser une URL synchrone pour SQLAlchemy classique
-        sync_database_url = Config.DATABASE_URL.replace("+asyncpg", "").replace("postgresql+asyncpg", "postgresql+psycopg2")
-        self.engine = create_engine(sync_database_url)
-        self.SessionLocal = sessionmaker(bind=self.engine)
         self.redis_client = redis_client
 
-    def get_session(self) -> Session:
-        """Obtenir une session SQLAlchemy"""
-        return self.SessionLocal()
+    def get_session(self) -> AsyncSession:
+        """Obtenir une session SQLAlchemy async"""
+        return async_session()
+
+    @staticmethod
+    def _cache_key(user_id: str, session_id: str) -> str:
+        return f"agent_context:{user_id}:{session_id}"
+
+    @staticmethod
+    def _to_dict(context: AgentContext) -> Dict[str, Any]:
+        """Sérialiser un AgentContext au format exposé aux agents"""
+        return {
+            "id": context.id,
+            "user_id": context.user_id,
+            "session_id": context.session_id,
+            "current_state": context.current_state,
+            "current_agent": context.current_agent,
+            "context_data": context.context_data,
+            "total_interactions": context.total_interactions,
+            "message_count": context.message_count,
+            "created_at": context.created_at.isoformat(),
+            "updated_at": context.updated_at.isoformat(),
+            "meta_data": context.meta_data
+        }
+
+    async def _cache_context(self, user_id: str, session_id: str, context_dict: Dict[str, Any]) -> None:
+        try:
+            await cache_set(
+                "agent_context",
+                self._cache_key(user_id, session_id),
+                json_lib.dumps(context_dict, default=str),
+                expire=CONTEXT_CACHE_TTL,
+                client=self.redis_client
+            )
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+
+    @staticmethod
+    async def _fetch(session: AsyncSession, user_id: str, session_id: str) -> Optional[AgentContext]:
+        stmt = select(AgentContext).where(
+            AgentContext.user_id == user_id,
+            AgentContext.session_id == session_id
+        )
+        result = await session.execute(stmt)
+        return result.scalars().first()
 
-    def list_contexts(self, user_id: str) -> list:
+    async def list_contexts(self, user_id: str) -> list:
         """Lister les contextes (sessions) pour un utilisateur."""
-        session = self.get_session()
-        try:
-            rows = session.query(AgentContext).filter(AgentContext.user_id == user_id).order_by(AgentContext.created_at.desc()).all()
+        async with self.get_session() as session:
+            stmt = (
+                select(AgentContext)
+                .where(AgentContext.user_id == user_id)
+                .order_by(AgentContext.created_at.desc())
+            )
+            result = await session.execute(stmt)
+            rows = result.scalars().all()
             out = []
             for r in rows:
                 out.append({
@@ -40,92 +95,51 @@ class SharedContextService:
                     "current_state": r.current_state,
                     "current_agent": r.current_agent,
                     "total_interactions": r.total_interactions,
+                    "message_count": r.message_count,
                     "created_at": r.created_at.isoformat(),
                     "updated_at": r.updated_at.isoformat()
                 })
             return out
-        finally:
-            session.close()
 
-    def delete_context(self, user_id: str, session_id: str) -> bool:
+    async def delete_context(self, user_id: str, session_id: str) -> bool:
         """Supprimer un contexte (session) spécifique."""
-        session = self.get_session()
-        try:
-            ctx = session.query(AgentContext).filter(AgentContext.user_id == user_id, AgentContext.session_id == session_id).first()
+        async with self.get_session() as session:
+            ctx = await self._fetch(session, user_id, session_id)
             if not ctx:
                 return False
-            session.delete(ctx)
-            session.commit()
-            # Purger le cache Redis
-            cache_key = f"agent_context:{user_id}:{session_id}"
-            try:
-                import asyncio
-                # Redis client est async; appel via boucle si nécessaire
-                loop = asyncio.get_event_loop()
-                if loop.is_running():
-                    loop.create_task(self.redis_client.delete(cache_key))
-                else:
-                    loop.run_until_complete(self.redis_client.delete(cache_key))
-            except Exception:
-                pass
-            return True
-        finally:
-            session.close()
+            await session.delete(ctx)
+            await session.commit()
 
+        # Purger le cache Redis
+        try:
+            await cache_delete("agent_context", [self._cache_key(user_id, session_id)], client=self.redis_client)
+        except Exception:
+            pass
+        return True
 
     async def get_context(self, user_id: str, session_id: str) -> Optional[Dict[str, Any]]:
         """
         Récupérer le contexte pour un utilisateur et une session.
         Vérifie d'abord Redis, puis PostgreSQL.
         """
-        cache_key = f"agent_context:{user_id}:{session_id}"
-
         # 1. Vérifier Redis
         try:
-            cached = await self.redis_client.get(cache_key)
+            cached = await self.redis_client.get(self._cache_key(user_id, session_id))
             if cached:
                 return json_lib.loads(cached)
         except Exception as e:
             print(f"Redis error: {e}")
 
         # 2. Vérifier PostgreSQL
-        session = self.get_session()
-        try:
-            context = session.query(AgentContext).filter(
-                AgentContext.user_id == user_id,
-                AgentContext.session_id == session_id
-            ).first()
-
-            if context:
-                context_dict = {
-                    "id": context.id,
-                    "user_id": context.user_id,
-                    "session_id": context.session_id,
-                    "current_state": context.current_state,
-                    "current_agent": context.current_agent,
-                    "context_data": context.context_data,
-                    "conversation_history": context.conversation_history,
-                    "total_interactions": context.total_interactions,
-                    "created_at": context.created_at.isoformat(),
-                    "updated_at": context.updated_at.isoformat(),
-                    "meta_data": context.meta_data
-                }
-
-                # Mettre en cache dans Redis (expire après 1h)
-                try:
-                    await self.redis_client.setex(
-                        cache_key,
-                        3600,
-                        json_lib.dumps(context_dict)
-                    )
-                except Exception as e:
-                    print(f"Redis cache error: {e}")
-
-                return context_dict
-
-            return None
-        finally:
-            session.close()
+        async with self.get_session() as session:
+            context = await self._fetch(session, user_id, session_id)
+            if not context:
+                return None
+            context_dict = self._to_dict(context)
+
+        # Mettre en cache dans Redis (expire après 1h)
+        await self._cache_context(user_id, session_id, context_dict)
+        return context_dict
 
     async def create_context(
         self,
@@ -134,48 +148,23 @@ class SharedContextService:
         initial_data: Optional[Dict[str, Any]] = None
     ) -> Dict[str, Any]:
         """Créer un nouveau contexte"""
-        session = self.get_session()
-        try:
+        async with self.get_session() as session:
             context = AgentContext(
                 user_id=user_id,
                 session_id=session_id,
                 current_state="idle",
                 context_data=initial_data or {},
-                conversation_history=[],
-                total_interactions=0
+                total_interactions=0,
+                message_count=0
             )
             session.add(context)
-            session.commit()
-            session.refresh(context)
-
-            context_dict = {
-                "id": context.id,
-                "user_id": context.user_id,
-                "session_id": context.session_id,
-                "current_state": context.current_state,
-                "current_agent": context.current_agent,
-                "context_data": context.context_data,
-                "conversation_history": context.conversation_history,
-                "total_interactions": context.total_interactions,
-                "created_at": context.created_at.isoformat(),
-                "updated_at": context.updated_at.isoformat(),
-                "meta_data": context.meta_data
-            }
-
-            # Mettre en cache
-            cache_key = f"agent_context:{user_id}:{session_id}"
-            try:
-                await self.redis_client.setex(
-                    cache_key,
-                    3600,
-                    json_lib.dumps(context_dict)
-                )
-            except Exception as e:
-                print(f"Redis cache error: {e}")
+            await session.commit()
+            await session.refresh(context)
+            context_dict = self._to_dict(context)
 
-            return context_dict
-        finally:
-            session.close()
+        # Mettre en cache
+        await self._cache_context(user_id, session_id, context_dict)
+        return context_dict
 
     async def update_context(
         self,
@@ -184,13 +173,8 @@ class SharedContextService:
         updates: Dict[str, Any]
     ) -> Optional[Dict[str, Any]]:
         """Mettre à jour le contexte"""
-        session = self.get_session()
-        try:
-            context = session.query(AgentContext).filter(
-                AgentContext.user_id == user_id,
-                AgentContext.session_id == session_id
-            ).first()
-
+        async with self.get_session() as session:
+            context = await self._fetch(session, user_id, session_id)
             if not context:
                 return None
 
@@ -200,38 +184,13 @@ class SharedContextService:
                     setattr(context, key, value)
 
             context.updated_at = datetime.now(timezone.utc)
-            session.commit()
-            session.refresh(context)
-
-            context_dict = {
-                "id": context.id,
-                "user_id": context.user_id,
-                "session_id": context.session_id,
-                "current_state": context.current_state,
-                "current_agent": context.current_agent,
-                "context_data": context.context_data,
-                "conversation_history": context.conversation_history,
-                "total_interactions": context.total_interactions,
-                "created_at": context.created_at.isoformat(),
-                "updated_at": context.updated_at.isoformat(),
-                "meta_data": context.meta_data
-            }
-
-            # Invalider le cache Redis
-            cache_key = f"agent_context:{user_id}:{session_id}"
-            try:
-                await self.redis_client.delete(cache_key)
-                await self.redis_client.setex(
-                    cache_key,
-                    3600,
-                    json_lib.dumps(context_dict)
-                )
-            except Exception as e:
-                print(f"Redis cache error: {e}")
+            await session.commit()
+            await session.refresh(context)
+            context_dict = self._to_dict(context)
 
-            return context_dict
-        finally:
-            session.close()
+        # Rafraîchir le cache Redis
+        await self._cache_context(user_id, session_id, context_dict)
+        return context_dict
 
     async def add_message(
         self,
@@ -241,27 +200,76 @@ class SharedContextService:
         message: str,
         message_type: str = "agent"  # agent, user, system
     ) -> Optional[Dict[str, Any]]:
-        """Ajouter un message à l'historique de conversation"""
-        context = await self.get_context(user_id, session_id)
-        if not context:
-            return None
-
-        conversation_history = context.get("conversation_history", [])
-        conversation_history.append({
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-            "agent": agent,
-            "type": message_type,
-            "message": message
-        })
-
-        return await self.update_context(
-            user_id,
-            session_id,
-            {
-                "conversation_history": conversation_history,
-                "total_interactions": context.get("total_interactions", 0) + 1
-            }
-        )
+        """
+        Ajouter un message à l'historique de conversation (append-only).
+        Le verrou de ligne pris par l'UPDATE du compteur sérialise les ajouts
+        concurrents d'une même session et garantit un seq unique.
+        """
+        now = datetime.now(timezone.utc)
+        async with self.get_session() as session:
+            stmt = (
+                update(AgentContext)
+                .where(
+                    AgentContext.user_id == user_id,
+                    AgentContext.session_id == session_id
+                )
+                .values(
+                    message_count=AgentContext.message_count + 1,
+                    total_interactions=func.coalesce(AgentContext.total_interactions, 0) + 1,
+                    updated_at=now
+                )
+                .returning(AgentContext.id, AgentContext.message_count)
+                .execution_options(synchronize_session=False)
+            )
+            row = (await session.execute(stmt)).first()
+            if row is None:
+                return None
+
+            entry = AgentContextMessage(
+                context_id=row.id,
+                seq=row.message_count,
+                agent=agent,
+                message_type=message_type,
+                message=message,
+                created_at=now
+            )
+            session.add(entry)
+            await session.commit()
+            result = entry.to_entry()
+
+        # Les compteurs du contexte ont changé : invalider le cache
+        try:
+            await cache_delete("agent_context", [self._cache_key(user_id, session_id)], client=self.redis_client)
+        except Exception as e:
+            print(f"Redis cache error: {e}")
+        return result
+
+    async def get_recent_messages(
+        self,
+        user_id: str,
+        session_id: str,
+        limit: int = 20,
+        message_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Récupérer les `limit` derniers messages d'une session, du plus ancien
+        au plus récent. Lecture bornée via l'index (context_id, seq).
+        """
+        async with self.get_session() as session:
+            stmt = (
+                select(AgentContextMessage)
+                .join(AgentContext, AgentContext.id == AgentContextMessage.context_id)
+                .where(
+                    AgentContext.user_id == user_id,
+                    AgentContext.session_id == session_id
+                )
+            )
+            if message_type:
+                stmt = stmt.where(AgentContextMessage.message_type == message_type)
+            stmt = stmt.order_by(AgentContextMessage.seq.desc()).limit(limit)
+            result = await session.execute(stmt)
+            rows = result.scalars().all()
+            return [m.to_entry() for m in reversed(rows)]
 
     async def get_or_create_context(
         self,
@@ -1,13 +1,15 @@
 import asyncio
 from celery import Celery
+from celery.signals import worker_process_init
 import logging
 from asgiref.sync import async_to_sync
 
 from src.mail import create_message, mail
 from src.config import Config
+from src.ai_agents.llm_json import LLMOutputError, parse_llm_output
+from src.ai_agents.llm_scheduler import background_llm_calls
 from types import SimpleNamespace
 import json
-import re
 
 # Configuration Celery
 app = Celery(
@@ -27,11 +29,46 @@ app.conf.update(
     task_time_limit=180,  # 180 secondes hard limit
     worker_prefetch_multiplier=1,
     worker_max_tasks_per_child=1000,
+    # Tâches périodiques : celery -A src.celery_tasks beat
+    beat_schedule={
+        "cleanup-verification-tokens": {
+            "task": "cleanup_verification_tokens_task",
+            "schedule": Config.TOKEN_CLEANUP_INTERVAL_SECONDS,
+        },
+        "drain-email-outbox": {
+            "task": "drain_email_outbox_task",
+            "schedule": Config.OUTBOX_POLL_INTERVAL_SECONDS,
+        },
+        "purge-email-outbox": {
+            "task": "purge_email_outbox_task",
+            "schedule": 24 * 3600,
+        },
+        "refill-question-bank": {
+            "task": "refill_question_bank_task",
+            "schedule": Config.QUESTION_BANK_REFILL_INTERVAL_SECONDS,
+        },
+    },
 )
 
 # Logger
 logger = logging.getLogger(__name__)
 
+
+@worker_process_init.connect
+def _reset_process_resources(**kwargs):
+    """Recrée les ressources partagées dans chaque process enfant après le fork."""
+    from src.db.main import reset_engine
+    from src.db.mongo_db import reset_mongo_clients
+    from src.mail_outbox import smtp_connection
+    from src.ai_agents.llm_provider import reset_llm_clients
+    from src.ai_agents.llm_telemetry import reset_llm_telemetry
+
+    reset_engine(pool_disabled=Config.DB_WORKER_POOL_DISABLED)
+    reset_mongo_clients()
+    smtp_connection.reset()
+    reset_llm_clients()
+    reset_llm_telemetry()
+
 # Loop utilitaire partagé par le worker Celery
 _worker_loop = None
 
@@ -72,6 +109,8 @@ def send_email(self, recipients, subject, body):
     """
     Tâche d'envoi d'email asynchrone avec retry.
     Utilise une approche entièrement asynchrone pour éviter les blocages.
+    Conservée pour les messages déjà en file : les routes passent désormais
+    par l'outbox (src.mail_outbox, drain_email_outbox_task).
     """
     try:
         import asyncio
@@ -141,58 +180,6 @@ def _fallback_question(user: dict) -> str:
 
 
 
-def _clean_json_like(text: str):
-    """Nettoie une sortie type Markdown ```json ... ``` et tente de parser en JSON."""
-    if not isinstance(text, str):
-        return None, None
-
-    # 1. Enlever les fences ```json ... ``` ou ```...```
-    cleaned = re.sub(r"^```(?:json)?\s*\n?|\n?```\s*$", "", text.strip())
-
-    # 2. Enlever les espaces en début de lignes (indentation)
-    lines = cleaned.split('\n')
-    cleaned = '\n'.join(line.strip() for line in lines)
-
-    # 3. Tenter de charger directement en JSON
-    try:
-        parsed = json.loads(cleaned)
-        return cleaned, parsed
-    except Exception:
-        pass
-
-    # 4. Tenter de trouver un objet JSON ou array dans le texte
-    try:
-        start_brace = cleaned.find('{')
-        start_bracket = cleaned.find('[')
-
-        if start_brace != -1 and (start_bracket == -1 or start_brace < start_bracket):
-            depth = 0
-            for i in range(start_brace, len(cleaned)):
-                if cleaned[i] == '{':
-                    depth += 1
-                elif cleaned[i] == '}':
-                    depth -= 1
-                    if depth == 0:
-                        json_str = cleaned[start_brace:i+1]
-                        parsed = json.loads(json_str)
-                        return json_str, parsed
-        elif start_bracket != -1:
-            depth = 0
-            for i in range(start_bracket, len(cleaned)):
-                if cleaned[i] == '[':
-                    depth += 1
-                elif cleaned[i] == ']':
-                    depth -= 1
-                    if depth == 0:
-                        json_str = cleaned[start_bracket:i+1]
-                        parsed = json.loads(json_str)
-                        return json_str, parsed
-    except Exception:
-        pass
-
-    return cleaned, None
-
-
 @app.task(name="chatbot_task", bind=True)
 def chatbot_task(self, user_id: str, session_id: str, message: str, user_context: dict = None):
     """Tâche async pour le chatbot IA - avec event loop propre"""
@@ -319,12 +306,75 @@ def module_completion_task(self, user_id: str, course_id: str, module_id: str, s
         }
 
 
+@app.task(name="drain_email_outbox_task")
+def drain_email_outbox_task():
+    """
+    Envoie les emails en attente de l'outbox. Boucle persistante du worker :
+    la connexion SMTP reste ouverte d'une exécution à l'autre.
+    """
+    from src.mail_outbox import drain_outbox
+
+    result = _get_worker_loop().run_until_complete(drain_outbox())
+    if result["sent"] or result["retried"] or result["failed"]:
+        logger.info(
+            f"Email outbox: {result['sent']} sent, {result['retried']} retried, "
+            f"{result['failed']} failed, {result['duration_s']}s"
+        )
+    return result
+
+
+@app.task(name="purge_email_outbox_task")
+def purge_email_outbox_task():
+    """Supprime les emails envoyés au-delà de OUTBOX_RETENTION_DAYS."""
+    from src.mail_outbox import purge_sent_emails
+
+    removed = _get_worker_loop().run_until_complete(purge_sent_emails())
+    logger.info(f"Email outbox purge: {removed} rows removed")
+    return {"removed": removed}
+
+
+@app.task(name="cleanup_verification_tokens_task")
+def cleanup_verification_tokens_task():
+    """Purge par lots des tokens de vérification expirés ou utilisés."""
+    from src.db.main import async_session
+    from src.users.tokens import TokenService
+
+    async def _cleanup():
+        async with async_session() as session:
+            return await TokenService.cleanup_expired_tokens(
+                session,
+                batch_size=Config.TOKEN_CLEANUP_BATCH_SIZE,
+                used_retention_hours=Config.TOKEN_USED_RETENTION_HOURS
+            )
+
+    result = async_to_sync(_cleanup)()
+    logger.info(
+        f"Verification tokens cleanup: {result['expired_deleted']} expired, "
+        f"{result['used_deleted']} used, {result['duration_s']}s"
+    )
+    return result
+
+
 @app.task(name="generate_profile_question_task")
 def generate_profile_question_task(user_data: dict):
-    """Génère une question personnalisée (LLM si dispo), sinon fallback.
+    """Sert un quiz depuis la banque de questions, sinon LLM, sinon fallback.
     Retourne un objet avec question brute et JSON parsé si applicable.
     """
     try:
+        bucket = None
+        if Config.QUESTION_BANK_ENABLED:
+            try:
+                from src.ai_agents.profiler.question_bank import bucket_for_user, request_bucket_refill, serve_quiz
+
+                quiz = serve_quiz(user_data)
+                if quiz:
+                    return {"ok": True, "source": "bank", "question": json.dumps(quiz, ensure_ascii=False), "json": quiz}
+                # Bucket trop pauvre : génération directe et recharge en tâche de fond
+                bucket = bucket_for_user(user_data)
+                request_bucket_refill(bucket)
+            except Exception as e:
+                logger.warning(f"Question bank lookup failed: {e}")
+
         try:
             from src.ai_agents.profiler.question_generator import generate_profile_question as llm_generate
         except Exception:
@@ -335,9 +385,19 @@ def generate_profile_question_task(user_data: dict):
                 # Utiliser un objet simple avec attributs pour satisfaire la signature attendue
                 user_obj = SimpleNamespace(**user_data)
                 question = llm_generate(user_obj)
-                cleaned, parsed = _clean_json_like(question)
-                if parsed and isinstance(parsed, list) and len(parsed) > 0:
-                    return {"ok": True, "source": "llm", "question": cleaned or question, "json": parsed}
+                try:
+                    parsed = parse_llm_output(question, "generate_profile_question", "gpt-4o-mini")
+                except LLMOutputError:
+                    parsed = None
+                if parsed:
+                    if bucket is not None:
+                        # Les questions générées alimentent aussi la banque
+                        try:
+                            from src.ai_agents.profiler.question_bank import store_questions
+                            store_questions(bucket, parsed)
+                        except Exception as e:
+                            logger.warning(f"Question bank store failed: {e}")
+                    return {"ok": True, "source": "llm", "question": json.dumps(parsed, ensure_ascii=False), "json": parsed}
                 else:
                     # Si le parsing échoue, utiliser le fallback
                     print(f"LLM parsing failed, using fallback. Raw: {question[:200] if question else 'None'}")
@@ -353,7 +413,31 @@ def generate_profile_question_task(user_data: dict):
         return {"ok": False, "error": str(e)}
 
 
+# Budget de la recharge + un appel gpt-4o-mini complet (45 s x 3 tentatives, 15 s de report)
+QUESTION_BANK_REFILL_SOFT_TIME_LIMIT = Config.QUESTION_BANK_REFILL_TIME_BUDGET_SECONDS + 180
+
+
+@app.task(
+    name="refill_question_bank_task",
+    soft_time_limit=QUESTION_BANK_REFILL_SOFT_TIME_LIMIT,
+    time_limit=QUESTION_BANK_REFILL_SOFT_TIME_LIMIT + 60,
+)
+@background_llm_calls
+def refill_question_bank_task(buckets: list = None):
+    """Complète les buckets de la banque de questions sous le seuil (Celery beat ou recharge ciblée)."""
+    from src.ai_agents.profiler.question_bank import refill_question_bank
+
+    report = refill_question_bank(buckets)
+    logger.info(
+        f"Question bank refill: {report['buckets_below_threshold']} buckets below threshold, "
+        f"{report['llm_calls']} LLM calls, {report['inserted']} questions added"
+        + (" (time budget spent)" if report["out_of_time"] else "")
+    )
+    return report
+
+
 @app.task(name="profile_analysis_task")
+@background_llm_calls
 def profile_analysis_task(user_data: dict, evaluation: dict, is_initial: bool = False, domaine: str = "Général"):
     """
     Analyse les résultats du quiz avec gamification complète et met à jour le profil.
@@ -383,10 +467,10 @@ def profile_analysis_task(user_data: dict, evaluation: dict, is_initial: bool =
             print(f"[PROFILE_ANALYSIS] Calling LLM for deep analysis with domain context: {domaine}...")
             llm_text = analyze_profile_with_llm(user_json, evaluation_json, domaine)
 
-            cleaned, parsed = _clean_json_like(llm_text)
-            if isinstance(parsed, dict):
-                llm_analysis = parsed
-                print(f"[PROFILE_ANALYSIS] LLM analysis completed successfully")
+            llm_analysis = parse_llm_output(llm_text, "analyze_profile_with_llm", "gpt-4o-mini")
+            print(f"[PROFILE_ANALYSIS] LLM analysis completed successfully")
+        except LLMOutputError:
+            print(f"[PROFILE_ANALYSIS] Unusable LLM analysis, continuing without it")
         except Exception as llm_error:
             print(f"[PROFILE_ANALYSIS] LLM analysis failed: {llm_error}, continuing without it")
 
@@ -454,6 +538,9 @@ def profile_analysis_task(user_data: dict, evaluation: dict, is_initial: bool =
                             {"$set": update_fields}
                         )
                         updated_profile = await profile_service.get_profile_by_user_id(user_uuid)
+                        if updated_profile:
+                            from src.profile.leaderboard import record_profile
+                            await record_profile(updated_profile)
 
                 print(f"[PROFILE_ANALYSIS] Initial questionnaire saved successfully")
 
@@ -527,11 +614,14 @@ def chatbot_streaming_task(self, user_id: str, session_id: str, message: str):
     Returns:
         Dict avec la réponse complète et les métadonnées
     """
-    from openai import OpenAI
+    from src.ai_agents.llm_provider import get_openai_client, llm_slot
+    from src.ai_agents.llm_scheduler import estimate_tokens, scheduler
+    from src.ai_agents.llm_telemetry import track_llm_call
+    from src.ai_agents.prompt_builder import build_chat_prompt
     from src.db.redis import r_sync as redis_client
     from src.profile.services import profile_service
     from src.profile.learning_services import chatbot_service
-    from src.ai_agents.agents.chatbot_agent import CHATBOT_SYSTEM_PROMPT
+    from src.ai_agents.agents.chatbot_agent import CHATBOT_SYSTEM_PROMPT, CHATBOT_MODEL
     from datetime import datetime, UTC
 
     task_id = self.request.id
@@ -553,62 +643,67 @@ def chatbot_streaming_task(self, user_id: str, session_id: str, message: str):
                 "badges": profil.badges
             }
 
-        # 2. Construire le contexte pour le prompt
-        context_str = f"""
-PROFIL APPRENANT :
-- Niveau : {user_context.get('niveau_technique', 5)}/10
-- Compétences : {', '.join(user_context.get('competences', [])) or 'Non identifiées'}
-- Objectifs : {user_context.get('objectifs', 'Non définis')}
-- XP : {user_context.get('xp', 0)}
-"""
-
-        # 3. Construire les messages pour OpenAI
-        messages = [
-            {"role": "system", "content": CHATBOT_SYSTEM_PROMPT},
-            {"role": "system", "content": f"CONTEXTE UTILISATEUR:\n{context_str}"},
-            {"role": "user", "content": message}
-        ]
-
-        # 4. Stream depuis OpenAI
-        client = OpenAI(api_key=Config.OPENAI_API_KEY)
-
-        stream = client.chat.completions.create(
-            model="gpt-4o",
-            messages=messages,
-            stream=True,
-            temperature=0.7
-        )
+        # 2. Historique récent de la session
+        try:
+            history = async_to_sync(chatbot_service.get_recent_messages)(
+                user_id, session_id, limit=Config.CHAT_HISTORY_MAX_MESSAGES
+            )
+        except Exception as history_error:
+            print(f"[CHATBOT_STREAMING] Warning: history unavailable: {history_error}")
+            history = []
+
+        # 3. Prompt sous budget de tokens (même assemblage que ChatbotAgent)
+        prompt = build_chat_prompt(CHATBOT_SYSTEM_PROMPT, user_context, history, message)
+        messages = prompt.as_openai()
 
+        # 4. Stream depuis OpenAI (client et pool HTTP partagés du worker)
+        client = get_openai_client()
         full_response = ""
         chunk_count = 0
 
-        # Publier le début du streaming
-        redis_client.publish(
-            channel,
-            json.dumps({
-                "type": "stream_started",
-                "task_id": task_id,
-                "timestamp": datetime.now(UTC).isoformat()
-            })
-        )
+        with llm_slot(CHATBOT_MODEL, "chatbot_streaming_task", tokens=estimate_tokens(messages)) as ticket, \
+                track_llm_call("chatbot_streaming_task", CHATBOT_MODEL) as llm_call:
+            stream = client.chat.completions.create(
+                model=CHATBOT_MODEL,
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+                temperature=0.7
+            )
 
-        # 5. Stream les chunks
-        for chunk in stream:
-            if chunk.choices[0].delta.content:
-                content = chunk.choices[0].delta.content
-                full_response += content
-                chunk_count += 1
-
-                # Publier le chunk sur Redis
-                redis_client.publish(
-                    channel,
-                    json.dumps({
-                        "type": "chunk",
-                        "content": content,
-                        "chunk_number": chunk_count,
-                        "timestamp": datetime.now(UTC).isoformat()
-                    })
-                )
+            # Publier le début du streaming
+            redis_client.publish(
+                channel,
+                json.dumps({
+                    "type": "stream_started",
+                    "task_id": task_id,
+                    "timestamp": datetime.now(UTC).isoformat()
+                })
+            )
+
+            # 5. Stream les chunks
+            for chunk in stream:
+                # Dernier chunk : usage seul, sans choices
+                if chunk.usage:
+                    cached = getattr(chunk.usage.prompt_tokens_details, "cached_tokens", 0) if chunk.usage.prompt_tokens_details else 0
+                    llm_call.set_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens, cached)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    llm_call.first_token()
+                    content = chunk.choices[0].delta.content
+                    full_response += content
+                    chunk_count += 1
+
+                    # Publier le chunk sur Redis
+                    redis_client.publish(
+                        channel,
+                        json.dumps({
+                            "type": "chunk",
+                            "content": content,
+                            "chunk_number": chunk_count,
+                            "timestamp": datetime.now(UTC).isoformat()
+                        })
+                    )
+            scheduler.observe(ticket, llm_call)
 
         print(f"[CHATBOT_STREAMING] Streamed {chunk_count} chunks, total length: {len(full_response)}")
 
@@ -671,7 +766,8 @@ PROFIL APPRENANT :
                 "stats": {
                     "chunks": chunk_count,
                     "length": len(full_response),
-                    "session_id": session_id
+                    "session_id": session_id,
+                    "prompt_tokens": prompt.stats()
                 }
             })
         )
@@ -703,6 +799,7 @@ PROFIL APPRENANT :
             "intention": intention,
             "suggestions": suggestions,
             "chunks_sent": chunk_count,
+            "prompt_tokens": prompt.stats(),
             "task_id": task_id
         }
 
@@ -735,6 +832,7 @@ PROFIL APPRENANT :
 # ==================== COURSE GENERATION (ASYNC) ====================
 
 @app.task(name="generate_course_roadmap_task")
+@background_llm_calls
 def generate_course_roadmap_task(user_id: str, course_topic: str, user_level: int, user_objectives: str, duration_weeks: int):
     """
     Tâche Celery pour générer une roadmap de cours personnalisée.
@@ -1,4 +1,5 @@
 import os
+from typing import Dict, Optional
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pathlib import Path
@@ -7,16 +8,51 @@ from pathlib import Path
 class Settings(BaseSettings):
     # PostgreSQL
     DATABASE_URL: str
+    DB_POOL_SIZE: int = 10
+    DB_MAX_OVERFLOW: int = 20
+    DB_POOL_RECYCLE: int = 1800  # secondes
+    DB_POOL_TIMEOUT: int = 30  # secondes
+    DB_POOL_DISABLED: bool = False  # NullPool (ex: derrière pgbouncer)
+    # Les tâches Celery tournent chacune sur une boucle différente : asyncpg lie
+    # ses connexions à la boucle qui les a créées, on désactive donc le pool par défaut.
+    DB_WORKER_POOL_DISABLED: bool = True
 
     # JWT
     JWT_SECRET: str
     JWT_ALGORITHM: str = "HS256"
 
+    # Hachage argon2 hors boucle (src.users.hashing)
+    PASSWORD_HASH_WORKERS: int = 0  # 0 = nombre de coeurs
+    PASSWORD_HASH_MAX_PENDING: int = 0  # 0 = 4 x workers ; au-delà : 429
+    PASSWORD_REHASH_ON_LOGIN: bool = True
+    # Paramètres argon2 (None = valeurs par défaut de passlib) ; les changer
+    # déclenche le re-hachage transparent au login suivant
+    ARGON2_TIME_COST: Optional[int] = None
+    ARGON2_MEMORY_COST: Optional[int] = None
+    ARGON2_PARALLELISM: Optional[int] = None
+
+    # Purge périodique des tokens de vérification (Celery beat)
+    TOKEN_CLEANUP_INTERVAL_SECONDS: int = 3600
+    TOKEN_CLEANUP_BATCH_SIZE: int = 1000
+    TOKEN_USED_RETENTION_HOURS: int = 24
+
     # Redis
     REDIS_HOST: str = 'localhost'
     REDIS_PORT: int = 6379
     REDIS_DB: int = 0
     REDIS_URL: str = 'redis://localhost:6379/0'
+    # Cache applicatif (src.db.cache) : orjson | msgpack | json
+    CACHE_SERIALIZER: str = "orjson"
+    CACHE_TTL_JITTER: float = 0.1
+    # Cache L1 en mémoire par worker API (invalidé par pub/sub Redis)
+    L1_CACHE_ENABLED: bool = True
+    L1_CACHE_MAX_ENTRIES: int = 10000
+    L1_CACHE_TTL: int = 30
+    L1_LEADERBOARD_TTL: int = 5
+    # Miroir local des JTI révoqués (src.db.token_blocklist)
+    TOKEN_BLOCKLIST_MIRROR_ENABLED: bool = True
+    # Utilisateur authentifié (get_current_user) mis en cache, versionné par utilisateur
+    PRINCIPAL_CACHE_TTL: int = 900
 
 
     # MongoDB
@@ -27,6 +63,14 @@ class Settings(BaseSettings):
     MONGO_DATABASE: str
     MONGO_HOST: str = "localhost"
     MONGO_PORT: int = 27017
+    # Pool de connexions par client (un client sync par process, un client Motor par boucle)
+    MONGO_MAX_POOL_SIZE: int = 50
+    MONGO_MIN_POOL_SIZE: int = 0
+    MONGO_MAX_IDLE_TIME_MS: int = 300000
+    MONGO_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    # Index Mongo créés au démarrage de l'API ; vérification explain() optionnelle
+    MONGO_ENSURE_INDEXES_ON_STARTUP: bool = True
+    MONGO_VERIFY_QUERY_SHAPES_ON_STARTUP: bool = False
     DOMAIN: str
 
     # Mail config - CORRIGÉ
@@ -40,8 +84,98 @@ class Settings(BaseSettings):
     MAIL_SSL_TLS: bool = False
     USE_CREDENTIALS: bool = True
     VALIDATE_CERTS: bool = True
+    SMTP_TIMEOUT_SECONDS: int = 30
+    SMTP_IDLE_TIMEOUT_SECONDS: int = 60  # au-delà, la connexion persistante est rouverte
+
+    # Outbox des emails (src.mail_outbox)
+    OUTBOX_BATCH_SIZE: int = 50
+    OUTBOX_MAX_BATCHES: int = 20
+    OUTBOX_MAX_ATTEMPTS: int = 5
+    OUTBOX_RETRY_BASE_SECONDS: int = 30
+    OUTBOX_POLL_INTERVAL_SECONDS: int = 10
+    OUTBOX_RETENTION_DAYS: int = 7
     OPENAI_API_KEY: str
 
+    # Clients LLM (src.ai_agents.llm_provider) : transport httpx partagé par process
+    LLM_MAX_CONNECTIONS: int = 50
+    LLM_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_KEEPALIVE_EXPIRY_SECONDS: float = 30.0
+    LLM_TIMEOUT_SECONDS: float = 60.0
+    LLM_MAX_RETRIES: int = 2
+    LLM_DEFAULT_CONCURRENCY: int = 8
+    # Appels simultanés par modèle et par process (JSON dans l'env)
+    LLM_MODEL_CONCURRENCY: Dict[str, int] = {"gpt-4o": 8, "gpt-4o-mini": 16}
+    LLM_MODEL_TIMEOUTS: Dict[str, float] = {"gpt-4o": 90.0, "gpt-4o-mini": 45.0}
+    # Télémétrie LLM (src.ai_agents.llm_telemetry) : tarifs USD par million de tokens
+    LLM_PRICING_PER_1M_TOKENS: Dict[str, Dict[str, float]] = {
+        "gpt-4o": {"input": 2.5, "cached_input": 1.25, "output": 10.0},
+        "gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.6},
+    }
+    LLM_STATS_FLUSH_SECONDS: int = 10
+    LLM_STATS_RETENTION_DAYS: int = 35
+    # Coalescence des appels LLM identiques (src.ai_agents.llm_coalescing)
+    LLM_COALESCE_ENABLED: bool = True
+    LLM_COALESCE_REDIS_ENABLED: bool = True  # entre workers : verrou + résultat partagés dans Redis
+    LLM_COALESCE_RESULT_TTL_SECONDS: int = 30
+    LLM_COALESCE_POLL_SECONDS: float = 0.1
+    # Ordonnancement des appels LLM (src.ai_agents.llm_scheduler)
+    LLM_SCHEDULER_ENABLED: bool = True
+    # Limites du tier OpenAI par modèle (requêtes et tokens par minute)
+    LLM_RATE_LIMITS: Dict[str, Dict[str, float]] = {
+        "gpt-4o": {"rpm": 500, "tpm": 30000},
+        "gpt-4o-mini": {"rpm": 500, "tpm": 200000},
+    }
+    LLM_RATE_LIMIT_PROCESSES: int = 1  # process se partageant le quota (workers API + process Celery)
+    LLM_COMPLETION_TOKENS_ESTIMATE: int = 800  # réponse attendue, avant correction par l'usage réel
+    LLM_DEFAULT_PRIORITY: str = "interactive"
+    LLM_AGENT_PRIORITIES: Dict[str, str] = {
+        "CourseManagerAgent": "background",
+        "CourseRecommendationAgent": "background",
+        "analyze_profile_with_llm": "background",
+    }
+    LLM_BACKGROUND_TOKEN_RESERVE: float = 0.2  # part des seaux laissée aux appels interactifs
+    LLM_BACKGROUND_CONCURRENCY_SHARE: float = 0.75  # part des places du modèle ouverte au fond
+    # p95 interactif (attente + premier token en streaming, attente seule sinon) ; au-delà, le fond est différé
+    LLM_INTERACTIVE_LATENCY_TARGET_MS: float = 4000.0
+    LLM_INTERACTIVE_LATENCY_WINDOW_SECONDS: int = 60
+    LLM_BACKGROUND_MAX_DEFER_SECONDS: float = 15.0
+    LLM_SCHEDULER_POLL_SECONDS: float = 0.05
+    LLM_SCHEDULER_SHARED_PRESSURE: bool = True  # signal de latence partagé entre process (Redis)
+    LLM_SCHEDULER_SIGNAL_SECONDS: float = 5.0
+    # Backend LLM : "openai" ou "fake" (src.ai_agents.fake_llm : réponses simulées, sans réseau)
+    LLM_BACKEND: str = "openai"
+    LLM_FAKE_SEED: int = 42
+    LLM_FAKE_LATENCY_MEDIAN_MS: float = 800.0  # délai du premier token (loi log-normale)
+    LLM_FAKE_LATENCY_SIGMA: float = 0.4
+    LLM_FAKE_TOKENS_PER_SECOND: float = 60.0  # débit de génération après le premier token
+    LLM_FAKE_ERROR_RATE: float = 0.0
+    LLM_FAKE_RESPONSE_WORDS: int = 120  # longueur des réponses texte (chatbot)
+    LLM_FAKE_RESPONSES_FILE: Optional[str] = None  # JSON {agent: réponse}, prioritaire sur les réponses intégrées
+
+    # Analyse des questions ouvertes (OpenQuestionAnalyzer)
+    OPEN_QUESTION_CONCURRENCY: int = 4
+    OPEN_QUESTION_TIMEOUT_SECONDS: float = 20.0
+    OPEN_QUESTION_BATCH_MODE: bool = False  # un seul prompt pour toutes les réponses
+    OPEN_QUESTION_BATCH_TIMEOUT_SECONDS: float = 40.0
+
+    # Prompts du chatbot (src.ai_agents.prompt_builder)
+    CHAT_PROMPT_TOKEN_BUDGET: int = 3000  # prompt complet, hors réponse
+    CHAT_PROGRESSION_MAX_TOKENS: int = 600
+    CHAT_HISTORY_MAX_MESSAGES: int = 20
+    CHAT_HISTORY_MESSAGE_MAX_TOKENS: int = 400
+    CHAT_MESSAGE_MAX_TOKENS: int = 1000
+    CHAT_TOKENIZER_ENCODING: str = "o200k_base"  # encodage des modèles gpt-4o
+
+    # Banque de questions de profilage (src.ai_agents.profiler.question_bank)
+    QUESTION_BANK_ENABLED: bool = True
+    QUESTION_BANK_MIN_AVAILABLE_PER_TYPE: int = 15
+    QUESTION_BANK_MAX_SERVES: int = 50  # au-delà, une question n'est plus tirée
+    QUESTION_BANK_SAMPLE_FACTOR: int = 3  # tirage parmi les N x moins servies
+    QUESTION_BANK_REFILL_INTERVAL_SECONDS: int = 900
+    QUESTION_BANK_REFILL_MAX_CALLS: int = 10
+    # Plus aucun appel lancé au-delà ; la tâche Celery garde une marge pour l'appel en cours
+    QUESTION_BANK_REFILL_TIME_BUDGET_SECONDS: int = 300
+
 
 
     @property
@@ -0,0 +1,369 @@
+"""
+Couche de cache Redis unifiée.
+
+    profile_cache = TypedCache("profile", ttl=3600, version_entity="user", model=ProfilResponse)
+
+    profil = await profile_cache.get_or_load(user_id, lambda: service.get(user_id))
+
+    @profile_cache.cached(key=lambda user_id: user_id)
+    async def load_profile(user_id): ...
+
+    await bump_version("user", user_id)   # invalide en O(1) tous les caches de l'utilisateur
+
+- Clés versionnées : "<prefix><id>:v<n>", la version vit dans cache:ver:<entité>:<id>.
+  Incrémenter la version rend toutes les anciennes entrées inaccessibles
+  (elles expirent seules), sans rien parcourir ni supprimer.
+- Single-flight : un seul chargement par clé et par process (les autres
+  requêtes attendent le même résultat), et un verrou Redis court pour que
+  les autres process attendent la valeur plutôt que de charger eux aussi.
+- Sérialisation configurable (CACHE_SERIALIZER = orjson | msgpack | json),
+  repli sur json si la bibliothèque n'est pas installée.
+- TTL avec jitter pour étaler les expirations ; compteurs hit/miss par namespace.
+- L1 optionnel en mémoire (local_ttl), invalidé par pub/sub entre workers.
+"""
+import asyncio
+import functools
+import json
+import logging
+import random
+from collections import defaultdict
+from datetime import date, datetime
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+from uuid import UUID
+
+import redis.asyncio as redis_async
+from pydantic import BaseModel
+
+from src.config import Config
+from src.db.cache_namespaces import NAMESPACES, cache_set, cache_delete
+from src.db.local_cache import MISSING, get_local_cache, publish_invalidation
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    msgpack = None
+
+logger = logging.getLogger("redis_cache")
+logger.setLevel(logging.INFO)
+
+VERSION_PREFIX = "cache:ver:"
+LOCK_PREFIX = "cache:lock:"
+LOCK_TTL_MS = 5000
+LOCK_WAIT_SECONDS = 2.0
+LOCK_POLL_SECONDS = 0.05
+
+# Client binaire dédié : msgpack n'est pas décodable en UTF-8
+_client = redis_async.from_url(Config.REDIS_URL, decode_responses=False)
+
+
+# --- Sérialisation ---
+def _default(obj: Any) -> Any:
+    if isinstance(obj, (UUID, datetime, date)):
+        return str(obj)
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, set):
+        return list(obj)
+    return str(obj)
+
+
+class JsonSerializer:
+    name = "json"
+
+    def dumps(self, value: Any) -> bytes:
+        return json.dumps(value, default=_default).encode("utf-8")
+
+    def loads(self, raw: bytes) -> Any:
+        return json.loads(raw)
+
+
+class OrjsonSerializer:
+    name = "orjson"
+
+    def dumps(self, value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(self, raw: bytes) -> Any:
+        return orjson.loads(raw)
+
+
+class MsgpackSerializer:
+    name = "msgpack"
+
+    def dumps(self, value: Any) -> bytes:
+        return msgpack.packb(value, default=_default, use_bin_type=True)
+
+    def loads(self, raw: bytes) -> Any:
+        return msgpack.unpackb(raw, raw=False)
+
+
+def get_serializer(name: Optional[str] = None):
+    """Retourne le sérialiseur demandé, ou json si la bibliothèque manque."""
+    name = (name or Config.CACHE_SERIALIZER).lower()
+    if name == "orjson" and orjson is not None:
+        return OrjsonSerializer()
+    if name == "msgpack" and msgpack is not None:
+        return MsgpackSerializer()
+    if name not in ("json", "orjson", "msgpack"):
+        logger.warning(f"Unknown cache serializer '{name}', falling back to json")
+    return JsonSerializer()
+
+
+# --- Métriques ---
+_metrics: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def cache_metrics() -> Dict[str, Dict[str, int]]:
+    """Compteurs du process par namespace : l1_hits, hits, misses, loads, coalesced, errors."""
+    return {namespace: dict(counters) for namespace, counters in _metrics.items()}
+
+
+# --- Versions ---
+def _version_key(entity: str, entity_id: Any) -> str:
+    return f"{VERSION_PREFIX}{entity}:{entity_id}"
+
+
+async def get_version(entity: str, entity_id: Any) -> int:
+    raw = await _client.get(_version_key(entity, entity_id))
+    return int(raw) if raw else 0
+
+
+async def bump_version(entity: str, entity_id: Any) -> Optional[int]:
+    """Invalide toutes les entrées versionnées d'une entité (un seul INCR)."""
+    try:
+        version = await _client.incr(_version_key(entity, entity_id))
+    except Exception as e:
+        logger.warning(f"Redis bump_version failed for {entity}:{entity_id}: {e}")
+        return None
+    # L1 de tous les workers : l'entrée de cette entité dans chaque cache du groupe
+    await publish_invalidation(group=entity, key=entity_id)
+    return version
+
+
+def _to_cacheable(value: Any) -> Any:
+    if isinstance(value, BaseModel):
+        return value.model_dump()
+    if isinstance(value, list):
+        return [_to_cacheable(v) for v in value]
+    return value
+
+
+class TypedCache:
+    """
+    Cache d'un namespace (voir NAMESPACES) avec chargement coalescé.
+    Avec `local_ttl`, un L1 en mémoire (src.db.local_cache) est consulté avant
+    Redis ; il conserve la valeur sérialisée pour que chaque lecture reçoive
+    sa propre copie.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int,
+        version_entity: Optional[str] = None,
+        model: Optional[Type[BaseModel]] = None,
+        serializer: Optional[str] = None,
+        jitter: Optional[float] = None,
+        name: Optional[str] = None,
+        local_ttl: Optional[float] = None,
+    ):
+        if namespace not in NAMESPACES:
+            raise ValueError(f"Unknown cache namespace: {namespace}")
+        self.namespace = namespace
+        self.name = name or namespace
+        self.prefix = NAMESPACES[namespace]
+        self.ttl = ttl
+        self.version_entity = version_entity
+        self.model = model
+        self.serializer = get_serializer(serializer)
+        self.jitter = Config.CACHE_TTL_JITTER if jitter is None else jitter
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._metrics = _metrics[namespace]
+        self._local = (
+            get_local_cache(self.name, ttl=local_ttl, group=version_entity)
+            if local_ttl else None
+        )
+
+    # --- Clés ---
+    async def key(self, entity_id: Any) -> str:
+        if not self.version_entity:
+            return f"{self.prefix}{entity_id}"
+        version = await get_version(self.version_entity, entity_id)
+        return f"{self.prefix}{entity_id}:v{version}"
+
+    def _ttl(self, ttl: Optional[int] = None) -> int:
+        ttl = self.ttl if ttl is None else ttl
+        if not self.jitter:
+            return ttl
+        return max(1, int(ttl * random.uniform(1 - self.jitter, 1 + self.jitter)))
+
+    def _decode(self, raw: bytes) -> Any:
+        data = self.serializer.loads(raw)
+        if self.model is not None:
+            if isinstance(data, list):
+                return [self.model.model_validate(item) for item in data]
+            return self.model.model_validate(data)
+        return data
+
+    async def _write(self, key: str, value: Any, ttl: Optional[int] = None) -> bytes:
+        raw = self.serializer.dumps(_to_cacheable(value))
+        await cache_set(
+            self.namespace,
+            key,
+            raw,
+            expire=self._ttl(ttl),
+            client=_client,
+        )
+        return raw
+
+    # --- L1 ---
+    def _local_get(self, entity_id: Any) -> Any:
+        if self._local is None:
+            return MISSING
+        raw = self._local.get(entity_id)
+        if raw is not MISSING:
+            self._metrics["l1_hits"] += 1
+        return raw
+
+    def _local_generation(self) -> Optional[int]:
+        return self._local.generation if self._local is not None else None
+
+    def _local_set(self, entity_id: Any, raw: bytes, generation: Optional[int]) -> None:
+        if self._local is not None:
+            self._local.set(entity_id, raw, generation=generation)
+
+    async def _local_invalidate(self, entity_id: Any) -> None:
+        if self._local is not None:
+            await publish_invalidation(cache=self.name, key=entity_id)
+
+    # --- API explicite ---
+    async def get(self, entity_id: Any) -> Optional[Any]:
+        raw = self._local_get(entity_id)
+        if raw is not MISSING:
+            return self._decode(raw)
+
+        generation = self._local_generation()
+        try:
+            raw = await _client.get(await self.key(entity_id))
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.warning(f"Redis cache get failed for {self.namespace}:{entity_id}: {e}")
+            return None
+        if raw is None:
+            self._metrics["misses"] += 1
+            return None
+        self._metrics["hits"] += 1
+        self._local_set(entity_id, raw, generation)
+        return self._decode(raw)
+
+    async def set(self, entity_id: Any, value: Any, ttl: Optional[int] = None) -> None:
+        """`ttl` : durée propre à cette écriture (sinon celle du cache)."""
+        try:
+            await self._write(await self.key(entity_id), value, ttl)
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.warning(f"Redis cache set failed for {self.namespace}:{entity_id}: {e}")
+        # Les autres workers relisent Redis à la prochaine lecture
+        await self._local_invalidate(entity_id)
+
+    async def delete(self, entity_id: Any) -> None:
+        try:
+            await cache_delete(self.namespace, [await self.key(entity_id)], client=_client)
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.warning(f"Redis cache delete failed for {self.namespace}:{entity_id}: {e}")
+        await self._local_invalidate(entity_id)
+
+    async def get_or_load(self, entity_id: Any, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Valeur en cache (L1 puis Redis), sinon un seul appel à `loader` par
+        clé (résultat partagé entre les requêtes concurrentes). None n'est
+        pas mis en cache.
+        """
+        raw = self._local_get(entity_id)
+        if raw is not MISSING:
+            return self._decode(raw)
+
+        generation = self._local_generation()
+        try:
+            key = await self.key(entity_id)
+            raw = await _client.get(key)
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.warning(f"Redis unavailable for {self.namespace}:{entity_id}: {e}")
+            return await loader()
+
+        if raw is not None:
+            self._metrics["hits"] += 1
+            self._local_set(entity_id, raw, generation)
+            return self._decode(raw)
+        self._metrics["misses"] += 1
+
+        task = self._inflight.get(key)
+        if task is not None and task.get_loop() is asyncio.get_running_loop():
+            self._metrics["coalesced"] += 1
+            return await asyncio.shield(task)
+
+        task = asyncio.ensure_future(self._load(key, loader, entity_id, generation))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(task)
+
+    async def _load(
+        self,
+        key: str,
+        loader: Callable[[], Awaitable[Any]],
+        entity_id: Any,
+        generation: Optional[int],
+    ) -> Any:
+        lock_key = f"{LOCK_PREFIX}{key}"
+        locked = False
+        try:
+            locked = bool(await _client.set(lock_key, b"1", nx=True, px=LOCK_TTL_MS))
+            if not locked:
+                # Un autre process charge déjà cette clé : attendre sa valeur
+                loop = asyncio.get_running_loop()
+                deadline = loop.time() + LOCK_WAIT_SECONDS
+                while loop.time() < deadline:
+                    await asyncio.sleep(LOCK_POLL_SECONDS)
+                    raw = await _client.get(key)
+                    if raw is not None:
+                        self._metrics["coalesced"] += 1
+                        self._local_set(entity_id, raw, generation)
+                        return self._decode(raw)
+        except Exception as e:
+            self._metrics["errors"] += 1
+            logger.warning(f"Redis cache lock failed for {key}: {e}")
+
+        try:
+            self._metrics["loads"] += 1
+            value = await loader()
+            if value is not None:
+                try:
+                    raw = await self._write(key, value)
+                    self._local_set(entity_id, raw, generation)
+                except Exception as e:
+                    self._metrics["errors"] += 1
+                    logger.warning(f"Redis cache set failed for {key}: {e}")
+            return value
+        finally:
+            if locked:
+                try:
+                    await _client.delete(lock_key)
+                except Exception:
+                    pass
+
+    # --- Décorateur ---
+    def cached(self, key: Callable[..., Any]):
+        """Met en cache le résultat d'une coroutine ; `key` reçoit ses arguments."""
+        def decorator(func: Callable[..., Awaitable[Any]]):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await self.get_or_load(key(*args, **kwargs), lambda: func(*args, **kwargs))
+            return wrapper
+        return decorator
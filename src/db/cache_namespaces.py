@@ -0,0 +1,176 @@
+"""
+Registre des espaces de noms du cache Redis.
+
+Chaque clé de cache écrite via cache_set() est indexée dans un ZSET par
+namespace (cache:index:<ns>, score = date d'expiration). Cela permet :
+
+- de compter les clés vivantes d'un namespace sans parcourir le keyspace
+  (ZCARD après purge des entrées expirées) ;
+- d'invalider un namespace par lots (ZRANGE + UNLINK), sans KEYS ;
+- d'estimer la mémoire par échantillonnage (ZRANDMEMBER + MEMORY USAGE).
+
+Les clés écrites avant l'index sont rattrapées par un SCAN incrémental
+lors de l'invalidation, jamais pour les statistiques.
+"""
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+import redis.asyncio as redis
+
+logger = logging.getLogger("redis_cache")
+logger.setLevel(logging.INFO)
+
+# namespace -> préfixe des clés
+NAMESPACES: Dict[str, str] = {
+    "profile": "profile:",
+    "stats": "profile:stats:",
+    "activities": "activities:",
+    "leaderboard": "leaderboard:",
+    "agent_context": "agent_context:",
+    "user": "user:",
+    "principal": "auth:principal:",
+}
+
+INDEX_PREFIX = "cache:index:"
+INVALIDATION_BATCH_SIZE = 500
+MEMORY_SAMPLE_SIZE = 5
+NO_EXPIRY_SCORE = float("inf")
+
+
+def _default_client() -> redis.Redis:
+    # Import différé : src.db.redis utilise ce module
+    from src.db.redis import r
+    return r
+
+
+def index_key(namespace: str) -> str:
+    if namespace not in NAMESPACES:
+        raise ValueError(f"Unknown cache namespace: {namespace}")
+    return f"{INDEX_PREFIX}{namespace}"
+
+
+def _expiry_score(expire: Optional[int]) -> float:
+    return time.time() + expire if expire else NO_EXPIRY_SCORE
+
+
+def _owned_by(namespace: str, key: str) -> bool:
+    """Vrai si la clé appartient à ce namespace et pas à un namespace plus spécifique."""
+    prefix = NAMESPACES[namespace]
+    if not key.startswith(prefix):
+        return False
+    return not any(
+        other != prefix and other.startswith(prefix) and key.startswith(other)
+        for other in NAMESPACES.values()
+    )
+
+
+async def cache_set(
+    namespace: str,
+    key: str,
+    value: str,
+    expire: Optional[int] = None,
+    client: Optional[redis.Redis] = None,
+) -> None:
+    """SET + indexation dans le namespace, en un seul aller-retour."""
+    client = client or _default_client()
+    idx = index_key(namespace)
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.set(key, value, ex=expire)
+        pipe.zadd(idx, {key: _expiry_score(expire)})
+        # Garder l'index borné : retirer les entrées déjà expirées
+        pipe.zremrangebyscore(idx, "-inf", time.time())
+        await pipe.execute()
+
+
+async def cache_delete(
+    namespace: str,
+    keys: Iterable[str],
+    client: Optional[redis.Redis] = None,
+) -> None:
+    """UNLINK (libération mémoire hors thread principal) + désindexation."""
+    client = client or _default_client()
+    keys = list(keys)
+    if not keys:
+        return
+    async with client.pipeline(transaction=False) as pipe:
+        pipe.unlink(*keys)
+        pipe.zrem(index_key(namespace), *keys)
+        await pipe.execute()
+
+
+async def invalidate_namespace(
+    namespace: str,
+    batch_size: int = INVALIDATION_BATCH_SIZE,
+    client: Optional[redis.Redis] = None,
+) -> int:
+    """
+    Supprime toutes les clés d'un namespace par lots de `batch_size`.
+    Chaque lot est un UNLINK borné : Redis n'est jamais bloqué longtemps.
+    """
+    client = client or _default_client()
+    idx = index_key(namespace)
+    removed = 0
+
+    # 1. Clés indexées
+    while True:
+        keys = await client.zrange(idx, 0, batch_size - 1)
+        if not keys:
+            break
+        await cache_delete(namespace, keys, client=client)
+        removed += len(keys)
+
+    # 2. Clés antérieures à l'index : SCAN incrémental
+    batch: List[str] = []
+    async for key in client.scan_iter(match=f"{NAMESPACES[namespace]}*", count=batch_size):
+        if not _owned_by(namespace, key):
+            continue
+        batch.append(key)
+        if len(batch) >= batch_size:
+            await client.unlink(*batch)
+            removed += len(batch)
+            batch = []
+    if batch:
+        await client.unlink(*batch)
+        removed += len(batch)
+
+    return removed
+
+
+async def get_namespace_info(client: Optional[redis.Redis] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Nombre de clés vivantes et mémoire estimée par namespace, sans SCAN :
+    purge des entrées expirées de l'index, ZCARD, puis MEMORY USAGE sur un échantillon.
+    """
+    client = client or _default_client()
+    now = time.time()
+    names = list(NAMESPACES)
+
+    async with client.pipeline(transaction=False) as pipe:
+        for namespace in names:
+            pipe.zremrangebyscore(index_key(namespace), "-inf", now)
+            pipe.zcard(index_key(namespace))
+            pipe.zrandmember(index_key(namespace), MEMORY_SAMPLE_SIZE)
+        results = await pipe.execute()
+
+    info: Dict[str, Dict[str, Any]] = {}
+    samples: Dict[str, List[str]] = {}
+    for i, namespace in enumerate(names):
+        _, count, sample = results[i * 3: i * 3 + 3]
+        info[namespace] = {"keys": count, "approx_memory_bytes": 0}
+        samples[namespace] = sample or []
+
+    async with client.pipeline(transaction=False) as pipe:
+        for namespace in names:
+            for key in samples[namespace]:
+                pipe.memory_usage(key)
+        usages = await pipe.execute()
+
+    pos = 0
+    for namespace in names:
+        sizes = [u for u in usages[pos: pos + len(samples[namespace])] if u]
+        pos += len(samples[namespace])
+        if sizes:
+            info[namespace]["approx_memory_bytes"] = int(sum(sizes) / len(sizes) * info[namespace]["keys"])
+
+    return info
@@ -0,0 +1,239 @@
+"""
+Cache L1 en mémoire (par process API), devant Redis.
+
+Chaque LocalCache est une LRU bornée avec TTL. La cohérence entre workers
+est assurée par le canal pub/sub Redis cache:l1:invalidate : toute écriture
+ou invalidation côté Redis publie un message, et chaque worker supprime
+l'entrée correspondante de son L1.
+
+Le L1 n'est actif que lorsque l'écoute du canal est établie
+(start_invalidation_listener, lancé par le lifespan de l'API) : un process
+sans écoute (worker Celery, script) lit toujours Redis. Si l'abonnement
+tombe, le L1 est vidé et désactivé jusqu'à la reconnexion. Le TTL local,
+court, borne la durée de vie d'une entrée si un message était perdu.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from uuid import uuid4
+
+from src.config import Config
+
+logger = logging.getLogger("redis_cache")
+logger.setLevel(logging.INFO)
+
+INVALIDATION_CHANNEL = "cache:l1:invalidate"
+# Identifiant du process : ignorer ses propres messages
+_INSTANCE_ID = uuid4().hex
+
+MISSING = object()
+
+_listener_active = False
+_listener_task: Optional[asyncio.Task] = None
+
+
+class LocalCache:
+    """LRU bornée avec TTL ; `group` regroupe les caches versionnés par la même entité."""
+
+    def __init__(self, name: str, max_entries: int, ttl: float, group: Optional[str] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.group = group
+        # Incrémenté à chaque invalidation : une lecture Redis commencée avant
+        # une invalidation ne doit pas repeupler le L1 avec une valeur périmée
+        self.generation = 0
+        self._data: "OrderedDict[str, Tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Any) -> Any:
+        if not l1_enabled():
+            return MISSING
+        key = str(key)
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return MISSING
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return MISSING
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Any, value: Any, generation: Optional[int] = None, ttl: Optional[float] = None) -> None:
+        if not l1_enabled():
+            return
+        if generation is not None and generation != self.generation:
+            return
+        key = str(key)
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: Any) -> None:
+        self.generation += 1
+        self._data.pop(str(key), None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._data.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+_caches: Dict[str, LocalCache] = {}
+
+
+def l1_enabled() -> bool:
+    return Config.L1_CACHE_ENABLED and _listener_active
+
+
+def get_local_cache(
+    name: str,
+    ttl: Optional[float] = None,
+    max_entries: Optional[int] = None,
+    group: Optional[str] = None,
+) -> LocalCache:
+    """Retourne (en le créant au besoin) le cache L1 nommé du process."""
+    cache = _caches.get(name)
+    if cache is None:
+        cache = LocalCache(
+            name,
+            max_entries=max_entries or Config.L1_CACHE_MAX_ENTRIES,
+            ttl=ttl or Config.L1_CACHE_TTL,
+            group=group,
+        )
+        _caches[name] = cache
+    return cache
+
+
+def local_cache_stats() -> Dict[str, Dict[str, Any]]:
+    return {name: cache.stats() for name, cache in _caches.items()}
+
+
+def clear_all() -> None:
+    for cache in _caches.values():
+        cache.clear()
+
+
+# --- Invalidation ---
+def _apply(message: Dict[str, Any]) -> None:
+    key = message.get("key")
+    if "group" in message:
+        targets = [c for c in _caches.values() if c.group == message["group"]]
+    else:
+        cache = _caches.get(message.get("cache"))
+        targets = [cache] if cache is not None else []
+
+    for cache in targets:
+        if key is None:
+            cache.clear()
+        else:
+            cache.delete(key)
+
+
+async def publish_invalidation(
+    cache: Optional[str] = None,
+    key: Any = None,
+    group: Optional[str] = None,
+) -> None:
+    """
+    Invalide localement puis diffuse aux autres workers.
+    `cache` + `key` : une entrée ; `cache` seul : tout le cache ; `group` + `key` :
+    l'entrée `key` de tous les caches du groupe.
+    """
+    message: Dict[str, Any] = {"origin": _INSTANCE_ID}
+    if group is not None:
+        message["group"] = group
+    else:
+        message["cache"] = cache
+    if key is not None:
+        message["key"] = str(key)
+
+    _apply(message)
+    if not Config.L1_CACHE_ENABLED:
+        return
+    try:
+        from src.db.redis import r
+        await r.publish(INVALIDATION_CHANNEL, json.dumps(message))
+    except Exception as e:
+        logger.warning(f"Redis L1 invalidation publish failed: {e}")
+
+
+async def _listen() -> None:
+    global _listener_active
+    from src.db.redis import r
+
+    backoff = 1
+    while True:
+        pubsub = r.pubsub()
+        try:
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Tout ce qui a pu changer pendant la déconnexion est inconnu : repartir à vide
+            clear_all()
+            _listener_active = True
+            backoff = 1
+            logger.info("L1 cache invalidation listener subscribed")
+
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                try:
+                    payload = json.loads(message["data"])
+                except (TypeError, ValueError):
+                    continue
+                if payload.get("origin") != _INSTANCE_ID:
+                    _apply(payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"L1 cache invalidation listener error: {e}")
+        finally:
+            _listener_active = False
+            clear_all()
+            try:
+                await pubsub.aclose()
+            except Exception:
+                pass
+
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+def start_invalidation_listener() -> Optional[asyncio.Task]:
+    """Démarre l'écoute du canal d'invalidation (une fois par process)."""
+    global _listener_task
+    if not Config.L1_CACHE_ENABLED:
+        return None
+    if _listener_task is None or _listener_task.done():
+        _listener_task = asyncio.create_task(_listen())
+    return _listener_task
+
+
+async def stop_invalidation_listener() -> None:
+    global _listener_task, _listener_active
+    task, _listener_task = _listener_task, None
+    _listener_active = False
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    clear_all()
@@ -1,27 +1,99 @@
-from typing import Any, AsyncGenerator, Union
+import os
+from typing import Any, AsyncGenerator, Optional, Union
 
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker
 from sqlalchemy.pool import NullPool
 from sqlmodel.ext.asyncio.session import AsyncSession
 from src.config import Config
 
-# Utiliser NullPool pour éviter les problèmes de session avec Celery
-# NullPool crée une nouvelle connexion pour chaque interaction et la ferme immédiatement
-engine = create_async_engine(
-    Config.DATABASE_URL,
-    poolclass=NullPool,  # Important pour Celery qui fork les processus
-    pool_pre_ping=True,
-    echo=False,
-)
-
-# Crée un sessionmaker asynchrone au module-level pour réutilisation
-async_session = async_sessionmaker(
-    bind=engine,
-    class_=AsyncSession,
-    expire_on_commit=False,
-    autoflush=False,
-    autocommit=False,
-)
+# Engine et sessionmaker créés à la demande, une fois par process.
+# Après un fork (worker Celery), le pool hérité du parent ne doit jamais être
+# réutilisé : get_engine() détecte le changement de PID et reconstruit le pool.
+_engine: Optional[AsyncEngine] = None
+_session_factory: Optional[async_sessionmaker] = None
+_engine_pid: Optional[int] = None
+_pool_disabled: bool = Config.DB_POOL_DISABLED
+
+
+def _build_engine(pool_disabled: bool) -> AsyncEngine:
+    """Construit l'engine asyncpg (pool configurable ou NullPool)."""
+    if pool_disabled:
+        return create_async_engine(
+            Config.DATABASE_URL,
+            poolclass=NullPool,
+            pool_pre_ping=True,
+            echo=False,
+        )
+
+    return create_async_engine(
+        Config.DATABASE_URL,
+        pool_size=Config.DB_POOL_SIZE,
+        max_overflow=Config.DB_MAX_OVERFLOW,
+        pool_recycle=Config.DB_POOL_RECYCLE,
+        pool_timeout=Config.DB_POOL_TIMEOUT,
+        pool_pre_ping=True,
+        pool_use_lifo=True,  # garde les connexions chaudes, laisse expirer le surplus
+        echo=False,
+    )
+
+
+def get_engine() -> AsyncEngine:
+    """Retourne l'engine du process courant (recréé après fork)."""
+    global _engine, _session_factory, _engine_pid
+
+    pid = os.getpid()
+    if _engine is None or _engine_pid != pid:
+        if _engine is not None:
+            # Process enfant : abandonner le pool du parent sans fermer ses sockets
+            _engine.sync_engine.dispose(close=False)
+        _engine = _build_engine(_pool_disabled)
+        _session_factory = async_sessionmaker(
+            bind=_engine,
+            class_=AsyncSession,
+            expire_on_commit=False,
+            autoflush=False,
+            autocommit=False,
+        )
+        _engine_pid = pid
+    return _engine
+
+
+def get_sessionmaker() -> async_sessionmaker:
+    """Retourne le sessionmaker lié à l'engine du process courant."""
+    get_engine()
+    return _session_factory
+
+
+def reset_engine(pool_disabled: Optional[bool] = None) -> None:
+    """
+    Oublie l'engine courant pour qu'il soit recréé au prochain accès.
+    Appelé depuis le signal Celery worker_process_init après le fork.
+    """
+    global _engine, _session_factory, _engine_pid, _pool_disabled
+
+    if _engine is not None:
+        _engine.sync_engine.dispose(close=False)
+    _engine = None
+    _session_factory = None
+    _engine_pid = None
+    if pool_disabled is not None:
+        _pool_disabled = pool_disabled
+
+
+async def dispose_engine() -> None:
+    """Ferme proprement toutes les connexions du pool (arrêt de l'application)."""
+    global _engine, _session_factory, _engine_pid
+
+    if _engine is not None and _engine_pid == os.getpid():
+        await _engine.dispose()
+    _engine = None
+    _session_factory = None
+    _engine_pid = None
+
+
+def async_session() -> AsyncSession:
+    """Ouvre une nouvelle session sur l'engine du process courant."""
+    return get_sessionmaker()()
 
 
 async def get_session() -> AsyncGenerator[Union[AsyncSession, Any], Any]:
@@ -1,7 +1,24 @@
+"""
+Registre des clients MongoDB du process.
+
+- un client synchrone (pymongo) partagé par process, recréé après un fork ;
+- un client Motor partagé par boucle d'événements : un client Motor est lié à
+  la boucle qui l'utilise en premier, le partager entre boucles (tâches Celery)
+  provoque des erreurs "attached to a different loop".
+
+Les services doivent résoudre leurs collections à l'usage (get_async_mongo_db())
+plutôt que de les capturer à l'import.
+"""
+import asyncio
+import os
+import threading
+import weakref
+from typing import Optional
+
 from pymongo import MongoClient
-from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.database import Database
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
 from src.config import Config
-import os
 
 # Détecter l'environnement
 DOCKER_ENV = os.getenv('DOCKER_ENV', 'false').lower() == 'true'
@@ -9,49 +26,126 @@ DOCKER_ENV = os.getenv('DOCKER_ENV', 'false').lower() == 'true'
 # Choisir le bon hôte selon l'environnement
 mongo_host = Config.MONGO_HOST if DOCKER_ENV else 'localhost'
 
-# Client synchrone (legacy, pour compatibilité)
-mongo_client = MongoClient(
-    host=mongo_host,
-    port=Config.MONGO_PORT,
-    username=Config.MONGO_APP_USERNAME,
-    password=Config.MONGO_APP_PASSWORD,
-    authSource=Config.MONGO_DATABASE,
-    serverSelectionTimeoutMS=5000
-)
-
-mongo_db = mongo_client[Config.MONGO_DATABASE]
-
-# Client asynchrone Motor (pour les opérations async/await)
-async_mongo_client = AsyncIOMotorClient(
-    host=mongo_host,
-    port=Config.MONGO_PORT,
-    username=Config.MONGO_APP_USERNAME,
-    password=Config.MONGO_APP_PASSWORD,
-    authSource=Config.MONGO_DATABASE,
-    serverSelectionTimeoutMS=5000
-)
-
-async_mongo_db = async_mongo_client[Config.MONGO_DATABASE]
-
-
-def get_mongo_client():
-    """Retourne un client MongoDB synchrone (legacy)"""
-    return MongoClient(
+_lock = threading.Lock()
+_registry_pid: Optional[int] = None
+_sync_client: Optional[MongoClient] = None
+# Boucle -> client Motor ; les boucles fermées sont purgées à chaque accès
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, AsyncIOMotorClient]" = weakref.WeakKeyDictionary()
+# Client Motor utilisé hors de toute boucle en cours (scripts, construction)
+_default_async_client: Optional[AsyncIOMotorClient] = None
+
+
+def _client_kwargs() -> dict:
+    """Paramètres communs aux clients sync et async (pool configurable)."""
+    return dict(
         host=mongo_host,
         port=Config.MONGO_PORT,
         username=Config.MONGO_APP_USERNAME,
         password=Config.MONGO_APP_PASSWORD,
         authSource=Config.MONGO_DATABASE,
-        serverSelectionTimeoutMS=5000,
+        serverSelectionTimeoutMS=Config.MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        maxPoolSize=Config.MONGO_MAX_POOL_SIZE,
+        minPoolSize=Config.MONGO_MIN_POOL_SIZE,
+        maxIdleTimeMS=Config.MONGO_MAX_IDLE_TIME_MS,
     )
 
 
-def get_mongo_db():
+def _check_pid() -> None:
+    """Après un fork, oublier les clients hérités du parent (sans les fermer)."""
+    global _registry_pid, _sync_client, _default_async_client, _async_clients
+
+    pid = os.getpid()
+    if _registry_pid != pid:
+        _sync_client = None
+        _default_async_client = None
+        _async_clients = weakref.WeakKeyDictionary()
+        _registry_pid = pid
+
+
+def get_mongo_client() -> MongoClient:
+    """Retourne le client MongoDB synchrone partagé du process"""
+    global _sync_client
+
+    with _lock:
+        _check_pid()
+        if _sync_client is None:
+            _sync_client = MongoClient(**_client_kwargs())
+        return _sync_client
+
+
+def get_sync_mongo_db() -> Database:
+    """Retourne la base MongoDB synchrone (pour tasks Celery)"""
+    return get_mongo_client()[Config.MONGO_DATABASE]
+
+
+def get_async_mongo_client() -> AsyncIOMotorClient:
+    """Retourne le client Motor associé à la boucle d'événements courante"""
+    global _default_async_client
+
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+
+    with _lock:
+        _check_pid()
+
+        if loop is None:
+            if _default_async_client is None:
+                _default_async_client = AsyncIOMotorClient(**_client_kwargs())
+            return _default_async_client
+
+        # Libérer les pools des boucles terminées (asyncio.run dans Celery)
+        for old_loop in [l for l in _async_clients.keys() if l.is_closed()]:
+            _async_clients.pop(old_loop).close()
+
+        client = _async_clients.get(loop)
+        if client is None:
+            client = AsyncIOMotorClient(**_client_kwargs(), io_loop=loop)
+            _async_clients[loop] = client
+        return client
+
+
+def get_async_mongo_db() -> AsyncIOMotorDatabase:
+    """Retourne la base MongoDB asynchrone (Motor) de la boucle courante"""
+    return get_async_mongo_client()[Config.MONGO_DATABASE]
+
+
+def get_mongo_db() -> AsyncIOMotorDatabase:
     """Retourne une base de données MongoDB asynchrone (Motor)"""
-    return async_mongo_db
+    return get_async_mongo_db()
+
+
+def reset_mongo_clients() -> None:
+    """
+    Oublie tous les clients du process pour qu'ils soient recréés au prochain accès.
+    Appelé depuis le signal Celery worker_process_init après le fork.
+    """
+    global _registry_pid
+
+    with _lock:
+        _registry_pid = None
+        _check_pid()
+
 
+def close_mongo_clients() -> None:
+    """Ferme tous les clients du process (arrêt de l'application)."""
+    global _sync_client, _default_async_client
 
-def get_sync_mongo_db():
-    """Retourne une base de données MongoDB synchrone (pour tasks Celery)"""
-    client = get_mongo_client()
-    return client[Config.MONGO_DATABASE]
+    with _lock:
+        if _registry_pid != os.getpid():
+            _check_pid()
+            return
+        clients = list(_async_clients.values())
+        if _default_async_client is not None:
+            clients.append(_default_async_client)
+        if _sync_client is not None:
+            clients.append(_sync_client)
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+        _async_clients.clear()
+        _default_async_client = None
+        _sync_client = None
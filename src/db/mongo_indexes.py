@@ -0,0 +1,188 @@
+"""
+Index MongoDB déclarés par l'application et registre des formes de requêtes.
+
+- MONGO_INDEXES : index requis par collection (création idempotente) ;
+- QUERY_SHAPES  : requêtes représentatives des services, vérifiées avec
+  explain() pour garantir qu'aucune ne finit en COLLSCAN.
+
+Exécuté au démarrage de l'API (MONGO_ENSURE_INDEXES_ON_STARTUP) ou en CLI :
+
+    python -m src.db.mongo_indexes ensure   # créer les index
+    python -m src.db.mongo_indexes verify   # vérifier les plans d'exécution
+    python -m src.db.mongo_indexes all      # les deux (défaut)
+"""
+import asyncio
+import logging
+import sys
+from typing import Any, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+from motor.motor_asyncio import AsyncIOMotorDatabase
+
+from src.db.mongo_db import get_async_mongo_db
+
+logger = logging.getLogger("mongo_indexes")
+logger.setLevel(logging.INFO)
+
+# Index requis par collection. Les noms sont fixés pour que la création
+# reste idempotente d'un déploiement à l'autre.
+MONGO_INDEXES: Dict[str, List[IndexModel]] = {
+    # ProfileService
+    "profils": [
+        IndexModel([("utilisateur_id", ASCENDING)], name="utilisateur_id_unique", unique=True),
+        IndexModel([("xp", DESCENDING)], name="xp_desc"),
+    ],
+    # CourseService, RoadmapService
+    "courses": [
+        IndexModel([("course_id", ASCENDING)], name="course_id"),
+        IndexModel([("niveau", ASCENDING), ("tags", ASCENDING)], name="niveau_tags"),
+        IndexModel([("tags", ASCENDING)], name="tags"),
+    ],
+    # ProgressionService, RoadmapService
+    "user_progressions": [
+        IndexModel([("utilisateur_id", ASCENDING), ("course_id", ASCENDING)], name="utilisateur_course"),
+        IndexModel([("utilisateur_id", ASCENDING), ("started_at", DESCENDING)], name="utilisateur_started_at"),
+    ],
+    # ChatbotService
+    "chat_conversations": [
+        IndexModel([("utilisateur_id", ASCENDING), ("session_id", ASCENDING)], name="utilisateur_session"),
+        IndexModel([("utilisateur_id", ASCENDING), ("last_message_at", DESCENDING)], name="utilisateur_last_message_at"),
+    ],
+    # LearningPathService
+    "learning_paths": [
+        IndexModel([("utilisateur_id", ASCENDING)], name="utilisateur_id"),
+    ],
+    # Banque de questions de profilage
+    "question_bank": [
+        IndexModel([("bucket", ASCENDING), ("hash", ASCENDING)], name="bucket_hash_unique", unique=True),
+        IndexModel([("bucket", ASCENDING), ("type", ASCENDING), ("served_count", ASCENDING)], name="bucket_type_served"),
+    ],
+}
+
+# Requêtes des services (valeurs d'exemple, seule la forme compte pour le plan)
+_SAMPLE_USER = "00000000-0000-0000-0000-000000000000"
+QUERY_SHAPES: List[Dict[str, Any]] = [
+    {"name": "profile_by_user", "collection": "profils",
+     "filter": {"utilisateur_id": _SAMPLE_USER}},
+    {"name": "leaderboard", "collection": "profils",
+     "filter": {}, "sort": [("xp", DESCENDING)], "limit": 10},
+    {"name": "course_by_id", "collection": "courses",
+     "filter": {"course_id": "sample"}},
+    {"name": "courses_by_level", "collection": "courses",
+     "filter": {"niveau": "debutant"}},
+    {"name": "courses_by_tags", "collection": "courses",
+     "filter": {"tags": {"$in": ["python"]}}},
+    {"name": "courses_by_level_and_tags", "collection": "courses",
+     "filter": {"tags": {"$in": ["python"]}, "niveau": "debutant"}},
+    {"name": "progression_by_user_course", "collection": "user_progressions",
+     "filter": {"utilisateur_id": _SAMPLE_USER, "course_id": "sample"}},
+    {"name": "progressions_by_user", "collection": "user_progressions",
+     "filter": {"utilisateur_id": _SAMPLE_USER}},
+    {"name": "active_roadmap", "collection": "user_progressions",
+     "filter": {"utilisateur_id": _SAMPLE_USER, "completion_percentage": {"$lt": 100.0}},
+     "sort": [("started_at", DESCENDING)], "limit": 1},
+    {"name": "conversation_by_session", "collection": "chat_conversations",
+     "filter": {"utilisateur_id": _SAMPLE_USER, "session_id": "sample"}},
+    {"name": "recent_conversations", "collection": "chat_conversations",
+     "filter": {"utilisateur_id": _SAMPLE_USER}, "sort": [("last_message_at", DESCENDING)], "limit": 10},
+    {"name": "learning_path_by_user", "collection": "learning_paths",
+     "filter": {"utilisateur_id": _SAMPLE_USER}},
+    {"name": "question_bank_draw", "collection": "question_bank",
+     "filter": {"bucket": "Etudiant:debutant:general", "type": "ChoixMultiple", "served_count": {"$lt": 50}},
+     "sort": [("served_count", ASCENDING)], "limit": 12},
+]
+
+
+async def ensure_indexes(db: Optional[AsyncIOMotorDatabase] = None) -> Dict[str, List[str]]:
+    """
+    Crée les index déclarés (no-op s'ils existent déjà).
+    Retourne les noms d'index présents par collection ; une collection en
+    échec (ex. doublons sur un index unique) est journalisée sans bloquer les autres.
+    """
+    db = db if db is not None else get_async_mongo_db()
+    created: Dict[str, List[str]] = {}
+
+    for collection_name, indexes in MONGO_INDEXES.items():
+        try:
+            created[collection_name] = await db[collection_name].create_indexes(indexes)
+        except OperationFailure as e:
+            hint = ""
+            if e.code == 11000 and collection_name == "profils":
+                hint = " (doublons : python src/ai_agents/profiler/diagnose_isolation.py fix)"
+            logger.warning(f"Mongo index creation failed for {collection_name}: {e}{hint}")
+            created[collection_name] = []
+
+    return created
+
+
+def _plan_stages(plan: Any) -> List[str]:
+    """Liste toutes les étapes d'un plan explain() (formats classique et SBE)."""
+    stages: List[str] = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for value in plan.values():
+            stages.extend(_plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(_plan_stages(item))
+    return stages
+
+
+async def verify_query_shapes(db: Optional[AsyncIOMotorDatabase] = None) -> List[Dict[str, Any]]:
+    """
+    Exécute explain() sur chaque requête du registre.
+    Une requête est valide si son plan gagnant n'a pas d'étape COLLSCAN
+    (EOF = collection inexistante, considéré comme valide).
+    """
+    db = db if db is not None else get_async_mongo_db()
+    results: List[Dict[str, Any]] = []
+
+    for shape in QUERY_SHAPES:
+        cursor = db[shape["collection"]].find(shape["filter"])
+        if shape.get("sort"):
+            cursor = cursor.sort(shape["sort"])
+        if shape.get("limit"):
+            cursor = cursor.limit(shape["limit"])
+
+        explain = await cursor.explain()
+        winning_plan = explain.get("queryPlanner", {}).get("winningPlan", {})
+        stages = _plan_stages(winning_plan)
+        results.append({
+            "name": shape["name"],
+            "collection": shape["collection"],
+            "stages": stages,
+            "ok": "COLLSCAN" not in stages,
+        })
+
+    return results
+
+
+async def _main(command: str) -> int:
+    db = get_async_mongo_db()
+    status = 0
+
+    if command in ("ensure", "all"):
+        created = await ensure_indexes(db)
+        for collection_name, names in created.items():
+            print(f"{collection_name:<22} {', '.join(names) if names else 'ÉCHEC'}")
+            if not names:
+                status = 1
+
+    if command in ("verify", "all"):
+        for result in await verify_query_shapes(db):
+            flag = "✅" if result["ok"] else "❌ COLLSCAN"
+            print(f"{flag} {result['name']:<30} {' > '.join(result['stages'])}")
+            if not result["ok"]:
+                status = 1
+
+    return status
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "all"
+    if cmd not in ("ensure", "verify", "all"):
+        print(__doc__)
+        sys.exit(2)
+    sys.exit(asyncio.run(_main(cmd)))
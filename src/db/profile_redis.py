@@ -1,10 +1,11 @@
-import json
 import logging
 from typing import List, Optional
 from uuid import UUID
-from datetime import datetime
 from src.config import Config
 import redis.asyncio as redis
+from src.db.cache_namespaces import invalidate_namespace, get_namespace_info
+from src.db.cache import TypedCache, bump_version, cache_metrics
+from src.db.local_cache import local_cache_stats
 
 logger = logging.getLogger("redis_profile")
 logger.setLevel(logging.INFO)
@@ -13,182 +14,99 @@ logger.setLevel(logging.INFO)
 r = redis.Redis(host=Config.REDIS_HOST, port=Config.REDIS_PORT, db=Config.REDIS_DB, decode_responses=True)
 
 
-def serialize(obj):
-    """Transforme UUID et datetime en string pour JSON."""
-    if isinstance(obj, (UUID, datetime)):
-        return str(obj)
-    raise TypeError(f"Type {type(obj)} not serializable")
-
-
 # TTL par défaut (en secondes)
 DEFAULT_PROFILE_TTL = 3600  # 1 heure
 DEFAULT_LEADERBOARD_TTL = 300  # 5 minutes
 DEFAULT_STATS_TTL = 1800  # 30 minutes
 
 
+# Caches typés (src.db.cache) : clés versionnées par utilisateur,
+# invalidées en bloc par invalidate_user_related_caches()
+profile_cache = TypedCache("profile", ttl=DEFAULT_PROFILE_TTL, version_entity="user", local_ttl=Config.L1_CACHE_TTL)
+profile_stats_cache = TypedCache("stats", ttl=DEFAULT_STATS_TTL, version_entity="user")
+activities_cache = TypedCache("activities", ttl=7200, version_entity="user")  # 2h
+leaderboard_cache = TypedCache("leaderboard", ttl=DEFAULT_LEADERBOARD_TTL)
+LEADERBOARD_CACHE_ID = "xp"
+
+
 # --- Single profile ---
 async def get_profile_cache(user_id: UUID) -> Optional[dict]:
     """Récupère un profil depuis le cache Redis"""
-    try:
-        data = await r.get(f"profile:{user_id}")
-        if data:
-            logger.debug(f"Profile cache hit for user {user_id}")
-            return json.loads(data)
-        logger.debug(f"Profile cache miss for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis get_profile_cache failed for user {user_id}: {e}")
-    return None
+    return await profile_cache.get(user_id)
 
 
 async def set_profile_cache(user_id: UUID, profile_data: dict, expire: int = DEFAULT_PROFILE_TTL):
     """Met en cache un profil individuel"""
-    try:
-        await r.set(
-            f"profile:{user_id}",
-            json.dumps(profile_data, default=serialize),
-            ex=expire
-        )
-        logger.debug(f"Profile cached for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis set_profile_cache failed for user {user_id}: {e}")
+    await profile_cache.set(user_id, profile_data, ttl=expire)
 
 
 async def invalidate_profile_cache(user_id: UUID):
     """Supprime le cache d'un profil spécifique"""
-    try:
-        await r.delete(f"profile:{user_id}")
-        logger.debug(f"Profile cache invalidated for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis invalidate_profile_cache failed for user {user_id}: {e}")
+    await profile_cache.delete(user_id)
 
 
 # --- Profile stats ---
 async def get_profile_stats_cache(user_id: UUID) -> Optional[dict]:
     """Récupère les stats d'un profil depuis le cache"""
-    try:
-        data = await r.get(f"profile:stats:{user_id}")
-        if data:
-            logger.debug(f"Profile stats cache hit for user {user_id}")
-            return json.loads(data)
-    except Exception as e:
-        logger.warning(f"Redis get_profile_stats_cache failed for user {user_id}: {e}")
-    return None
+    return await profile_stats_cache.get(user_id)
 
 
 async def set_profile_stats_cache(user_id: UUID, stats_data: dict, expire: int = DEFAULT_STATS_TTL):
     """Met en cache les stats d'un profil"""
-    try:
-        await r.set(
-            f"profile:stats:{user_id}",
-            json.dumps(stats_data, default=serialize),
-            ex=expire
-        )
-        logger.debug(f"Profile stats cached for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis set_profile_stats_cache failed for user {user_id}: {e}")
+    await profile_stats_cache.set(user_id, stats_data, ttl=expire)
 
 
 async def invalidate_profile_stats_cache(user_id: UUID):
     """Supprime le cache des stats d'un profil"""
-    try:
-        await r.delete(f"profile:stats:{user_id}")
-        logger.debug(f"Profile stats cache invalidated for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis invalidate_profile_stats_cache failed for user {user_id}: {e}")
+    await profile_stats_cache.delete(user_id)
 
 
 # --- Leaderboard ---
 async def get_leaderboard_cache() -> Optional[List[dict]]:
     """Récupère le leaderboard depuis le cache"""
-    try:
-        data = await r.get("leaderboard:xp")
-        if data:
-            logger.debug("Leaderboard cache hit")
-            return json.loads(data)
-        logger.debug("Leaderboard cache miss")
-    except Exception as e:
-        logger.warning(f"Redis get_leaderboard_cache failed: {e}")
-    return None
+    return await leaderboard_cache.get(LEADERBOARD_CACHE_ID)
 
 
 async def set_leaderboard_cache(leaderboard_data: List[dict], expire: int = DEFAULT_LEADERBOARD_TTL):
     """Met en cache le leaderboard"""
-    try:
-        await r.set(
-            "leaderboard:xp",
-            json.dumps(leaderboard_data, default=serialize),
-            ex=expire
-        )
-        logger.debug("Leaderboard cached")
-    except Exception as e:
-        logger.warning(f"Redis set_leaderboard_cache failed: {e}")
+    await leaderboard_cache.set(LEADERBOARD_CACHE_ID, leaderboard_data, ttl=expire)
 
 
 async def invalidate_leaderboard_cache():
     """Supprime le cache du leaderboard"""
-    try:
-        await r.delete("leaderboard:xp")
-        logger.debug("Leaderboard cache invalidated")
-    except Exception as e:
-        logger.warning(f"Redis invalidate_leaderboard_cache failed: {e}")
+    await leaderboard_cache.delete(LEADERBOARD_CACHE_ID)
 
 
 # --- Activity history ---
 async def get_activities_cache(user_id: UUID) -> Optional[List[dict]]:
     """Récupère l'historique des activités depuis le cache"""
-    try:
-        data = await r.get(f"activities:{user_id}")
-        if data:
-            logger.debug(f"Activities cache hit for user {user_id}")
-            return json.loads(data)
-    except Exception as e:
-        logger.warning(f"Redis get_activities_cache failed for user {user_id}: {e}")
-    return None
+    return await activities_cache.get(user_id)
 
 
 async def set_activities_cache(user_id: UUID, activities_data: List[dict], expire: int = 7200):  # 2h
     """Met en cache l'historique des activités"""
-    try:
-        await r.set(
-            f"activities:{user_id}",
-            json.dumps(activities_data, default=serialize),
-            ex=expire
-        )
-        logger.debug(f"Activities cached for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis set_activities_cache failed for user {user_id}: {e}")
+    await activities_cache.set(user_id, activities_data, ttl=expire)
 
 
 async def invalidate_activities_cache(user_id: UUID):
     """Supprime le cache des activités d'un utilisateur"""
-    try:
-        await r.delete(f"activities:{user_id}")
-        logger.debug(f"Activities cache invalidated for user {user_id}")
-    except Exception as e:
-        logger.warning(f"Redis invalidate_activities_cache failed for user {user_id}: {e}")
+    await activities_cache.delete(user_id)
 
 
 # --- Bulk invalidation ---
-async def invalidate_all_profile_caches():
-    """Supprime tous les caches liés aux profils (utile pour maintenance)"""
-    try:
-        # Pattern matching pour supprimer tous les profils
-        keys_to_delete = []
-
-        # Récupérer toutes les clés de profils
-        profile_keys = await r.keys("profile:*")
-        stats_keys = await r.keys("profile:stats:*")
-        activities_keys = await r.keys("activities:*")
-        leaderboard_keys = await r.keys("leaderboard:*")
+PROFILE_NAMESPACES = ("profile", "stats", "activities", "leaderboard")
 
-        keys_to_delete.extend(profile_keys)
-        keys_to_delete.extend(stats_keys)
-        keys_to_delete.extend(activities_keys)
-        keys_to_delete.extend(leaderboard_keys)
 
-        if keys_to_delete:
-            await r.delete(*keys_to_delete)
-            logger.info(f"Invalidated {len(keys_to_delete)} profile-related cache keys")
+async def invalidate_all_profile_caches():
+    """
+    Supprime tous les caches liés aux profils (utile pour maintenance).
+    Suppression par lots (index de namespace + SCAN/UNLINK), jamais de KEYS.
+    """
+    try:
+        removed = 0
+        for namespace in PROFILE_NAMESPACES:
+            removed += await invalidate_namespace(namespace, client=r)
+        logger.info(f"Invalidated {removed} profile-related cache keys")
 
     except Exception as e:
         logger.warning(f"Redis invalidate_all_profile_caches failed: {e}")
@@ -196,30 +114,32 @@ async def invalidate_all_profile_caches():
 
 # --- Helper functions ---
 async def invalidate_user_related_caches(user_id: UUID):
-    """Invalide tous les caches liés à un utilisateur spécifique"""
-    try:
-        await invalidate_profile_cache(user_id)
-        await invalidate_profile_stats_cache(user_id)
-        await invalidate_activities_cache(user_id)
-        # Le leaderboard doit aussi être invalidé car l'utilisateur peut avoir changé de position
-        await invalidate_leaderboard_cache()
-
+    """
+    Invalide tous les caches liés à un utilisateur spécifique (profil, stats,
+    activités) en incrémentant sa version : un seul INCR, les anciennes
+    entrées expirent d'elles-mêmes.
+    """
+    # Le classement (ZSET lb:xp) est tenu à jour par ProfileService, pas de cache à invalider
+    if await bump_version("user", user_id) is not None:
         logger.debug(f"All caches invalidated for user {user_id}")
 
-    except Exception as e:
-        logger.warning(f"Error invalidating user related caches for {user_id}: {e}")
-
 
-async def get_cache_info() -> dict[str, int] | dict[str, str]:
-    """Récupère des informations sur l'état du cache (pour monitoring)"""
+async def get_cache_info() -> dict:
+    """
+    Récupère des informations sur l'état du cache (pour monitoring).
+    Compteurs et mémoire par namespace lus depuis l'index, sans parcourir le keyspace.
+    """
     try:
-        info = {
-            "profiles": len(await r.keys("profile:*")),
-            "stats": len(await r.keys("profile:stats:*")),
-            "activities": len(await r.keys("activities:*")),
-            "leaderboard": len(await r.keys("leaderboard:*")),
+        namespaces = await get_namespace_info(client=r)
+        memory = await r.info("memory")
+        return {
+            **{name: data["keys"] for name, data in namespaces.items()},
+            "namespaces": namespaces,
+            "used_memory": memory.get("used_memory"),
+            "used_memory_human": memory.get("used_memory_human"),
+            "metrics": cache_metrics(),
+            "l1": local_cache_stats(),
         }
-        return info
     except Exception as e:
         logger.warning(f"Error getting cache info: {e}")
-        return {"error": str(e)}
\ No newline at end of file
+        return {"error": str(e)}
@@ -1,19 +1,20 @@
+import time
 import redis.asyncio as redis_async
 import redis  # Client synchrone pour Celery
-import json
 from typing import List, Optional
 from uuid import UUID
 from datetime import datetime
-from src.users.schema import UtilisateurRead
+from src.users.schema import UtilisateurRead, UtilisateurPage
 import logging
 from src.config import Config
+from src.db.cache import TypedCache, bump_version, get_version
+from src.db import token_blocklist
 
 logger = logging.getLogger("redis_cache")
 logger.setLevel(logging.INFO)
 
 # --- Constantes ---
 USER_PREFIX = "user:"
-USERS_ALL_KEY = "users:all"
 TOKEN_BLOCKLIST_PREFIX = "token:blocklist:"
 JTI_EXPIRY = 3600  # 1h
 DEFAULT_EXPIRE = 300  # 5 min pour user cache
@@ -38,73 +39,69 @@ def serialize(obj):
     raise TypeError(f"Type {type(obj)} not serializable")
 
 # --- User cache ---
+# Caches typés (src.db.cache) : sérialisation rapide, TTL avec jitter, métriques
+user_cache = TypedCache("user", ttl=DEFAULT_EXPIRE, version_entity="user")
+# Pages de la liste des utilisateurs : clés préfixées par la version de la liste,
+# incrémentée à chaque inscription (les anciennes pages expirent seules)
+users_page_cache = TypedCache("user", ttl=DEFAULT_EXPIRE, model=UtilisateurPage)
+USERS_LIST_ENTITY, USERS_LIST_ID = "users", "list"
+
+# Utilisateur authentifié enrichi (get_current_user) : L1 + Redis, invalidé par bump_version("user", id)
+principal_cache = TypedCache(
+    "principal",
+    ttl=Config.PRINCIPAL_CACHE_TTL,
+    version_entity="user",
+    model=UtilisateurRead,
+    local_ttl=Config.L1_CACHE_TTL,
+)
+
+
 async def get_user_cache(user_id: UUID) -> Optional[dict]:
-    try:
-        data = await r.get(f"{USER_PREFIX}{user_id}")
-        if data:
-            return json.loads(data)
-    except Exception as e:
-        logger.warning(f"Redis get_user_cache failed for {user_id}: {e}")
-    return None
+    return await user_cache.get(user_id)
 
 async def set_user_cache(user: UtilisateurRead, expire: int = DEFAULT_EXPIRE):
-    try:
-        await r.set(
-            f"{USER_PREFIX}{user.id}",
-            json.dumps(user.model_dump(), default=serialize),
-            ex=expire
-        )
-    except Exception as e:
-        logger.warning(f"Redis set_user_cache failed for {user.id}: {e}")
+    await user_cache.set(user.id, user, ttl=expire)
 
-# --- All users cache ---
-async def get_all_users_cache() -> Optional[List[dict]]:
-    try:
-        data = await r.get(USERS_ALL_KEY)
-        if data:
-            return json.loads(data)
-    except Exception as e:
-        logger.warning(f"Redis get_all_users_cache failed: {e}")
-    return None
-
-async def set_all_users_cache(users: List[UtilisateurRead], expire: int = DEFAULT_EXPIRE):
-    try:
-        users_dict = [u.model_dump() for u in users]
-        await r.set(
-            USERS_ALL_KEY,
-            json.dumps(users_dict, default=serialize),
-            ex=expire
-        )
-    except Exception as e:
-        logger.warning(f"Redis set_all_users_cache failed: {e}")
+# --- Users list pages ---
+async def users_page_key(status: Optional[str], limit: int, cursor: Optional[str]) -> str:
+    version = await get_version(USERS_LIST_ENTITY, USERS_LIST_ID)
+    return f"page:v{version}:{status or 'all'}:{limit}:{cursor or 'first'}"
 
 # --- Invalidate cache ---
 async def invalidate_user_cache(user_id: Optional[UUID] = None):
-    try:
-        if user_id:
-            await r.delete(f"{USER_PREFIX}{user_id}")
-        else:
-            await r.delete(USERS_ALL_KEY)
-    except Exception as e:
-        logger.warning(f"Redis invalidate_user_cache failed for {user_id}: {e}")
+    if user_id:
+        await user_cache.delete(user_id)
+    else:
+        await invalidate_all_users_cache()
 
 async def invalidate_all_users_cache():
-    try:
-        await r.delete(USERS_ALL_KEY)
-    except Exception as e:
-        logger.warning(f"Redis invalidate_all_users_cache failed: {e}")
+    await bump_version(USERS_LIST_ENTITY, USERS_LIST_ID)
 
 # --- Token blocklist ---
 async def add_jti_to_blocklist(jti: str, expiry: int = JTI_EXPIRY) -> bool:
     try:
-        # NX=True → ne pas écraser si déjà présent
-        await r.set(f"{TOKEN_BLOCKLIST_PREFIX}{jti}", "revoked", ex=expiry, nx=True)
+        async with r.pipeline(transaction=True) as pipe:
+            # NX=True → ne pas écraser si déjà présent
+            pipe.set(f"{TOKEN_BLOCKLIST_PREFIX}{jti}", "revoked", ex=expiry, nx=True)
+            # Diffusion aux miroirs locaux des autres workers
+            pipe.xadd(
+                token_blocklist.BLOCKLIST_STREAM,
+                {"jti": jti, "exp": int(time.time()) + expiry},
+                maxlen=token_blocklist.STREAM_MAXLEN,
+                approximate=True,
+            )
+            await pipe.execute()
+        token_blocklist.add(jti, time.time() + expiry)
         return True
     except Exception as e:
         logger.warning(f"Redis add_jti_to_blocklist failed for {jti}: {e}")
         return False
 
 async def is_jti_in_blocklist(jti: str) -> bool:
+    # Cas courant : lecture du miroir local, sans aller-retour Redis
+    revoked = token_blocklist.lookup(jti)
+    if revoked is not None:
+        return revoked
     try:
         exists = await r.exists(f"{TOKEN_BLOCKLIST_PREFIX}{jti}")
         return exists > 0
@@ -0,0 +1,152 @@
+"""
+Miroir local de la blocklist des tokens (JTI révoqués).
+
+Chaque requête authentifiée vérifie que son JTI n'est pas révoqué ; les
+révocations (logout) sont rares. Chaque process API garde donc en mémoire
+l'ensemble exact des JTI révoqués encore valides (jti -> expiration) :
+le cas courant « non révoqué » est une simple lecture de dict.
+
+- Bootstrap : SCAN des clés token:blocklist:* (source de vérité) et de leur TTL.
+- Suivi : add_jti_to_blocklist publie chaque révocation dans le stream
+  token:blocklist:stream, lu en continu (XREAD BLOCK) à partir du dernier
+  identifiant connu avant le bootstrap : aucune révocation n'est perdue
+  entre le SCAN et la lecture.
+- Tant que le miroir n'est pas synchronisé (démarrage, perte de connexion),
+  lookup() retourne None et l'appelant interroge Redis.
+
+Un ensemble exact suffit (pas de filtre de Bloom) : les entrées expirent
+avec les tokens, le volume reste celui des logouts de la dernière heure.
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional
+
+logger = logging.getLogger("redis_cache")
+logger.setLevel(logging.INFO)
+
+BLOCKLIST_PREFIX = "token:blocklist:"
+BLOCKLIST_STREAM = "token:blocklist:stream"
+STREAM_MAXLEN = 10000
+SCAN_BATCH_SIZE = 500
+READ_BLOCK_MS = 5000
+PRUNE_INTERVAL = 60  # secondes
+
+_revoked: Dict[str, float] = {}
+_ready = False
+_last_prune = 0.0
+_task: Optional[asyncio.Task] = None
+
+
+def add(jti: str, expires_at: float) -> None:
+    """Ajoute un JTI révoqué (expiration en timestamp Unix)."""
+    if expires_at > _revoked.get(jti, 0):
+        _revoked[jti] = expires_at
+
+
+def lookup(jti: str) -> Optional[bool]:
+    """True/False si le miroir est synchronisé, None sinon (interroger Redis)."""
+    if not _ready:
+        return None
+    expires_at = _revoked.get(jti)
+    return expires_at is not None and expires_at > time.time()
+
+
+def _prune() -> None:
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    for jti in [jti for jti, expires_at in _revoked.items() if expires_at <= now]:
+        del _revoked[jti]
+
+
+def mirror_stats() -> dict:
+    return {"ready": _ready, "entries": len(_revoked)}
+
+
+async def _last_stream_id(r) -> str:
+    entries = await r.xrevrange(BLOCKLIST_STREAM, count=1)
+    return entries[0][0] if entries else "0-0"
+
+
+async def _bootstrap(r) -> None:
+    """Charge les clés existantes (et leur TTL) par lots de SCAN + PTTL."""
+    _revoked.clear()
+    now = time.time()
+    batch = []
+
+    async def flush(keys):
+        async with r.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.pttl(key)
+            ttls = await pipe.execute()
+        for key, ttl in zip(keys, ttls):
+            if ttl and ttl > 0:
+                add(key[len(BLOCKLIST_PREFIX):], now + ttl / 1000)
+
+    async for key in r.scan_iter(match=f"{BLOCKLIST_PREFIX}*", count=SCAN_BATCH_SIZE):
+        if key == BLOCKLIST_STREAM:
+            continue
+        batch.append(key)
+        if len(batch) >= SCAN_BATCH_SIZE:
+            await flush(batch)
+            batch = []
+    if batch:
+        await flush(batch)
+
+
+async def _follow() -> None:
+    global _ready
+    from src.db.redis import r
+
+    backoff = 1
+    while True:
+        try:
+            last_id = await _last_stream_id(r)
+            await _bootstrap(r)
+            _ready = True
+            backoff = 1
+            logger.info(f"Token blocklist mirror ready ({len(_revoked)} entries)")
+
+            while True:
+                response = await r.xread({BLOCKLIST_STREAM: last_id}, count=500, block=READ_BLOCK_MS)
+                for _stream, entries in response or []:
+                    for entry_id, fields in entries:
+                        last_id = entry_id
+                        try:
+                            add(fields["jti"], float(fields["exp"]))
+                        except (KeyError, ValueError):
+                            continue
+                _prune()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Token blocklist mirror error: {e}")
+        finally:
+            _ready = False
+
+        await asyncio.sleep(backoff)
+        backoff = min(backoff * 2, 30)
+
+
+def start_blocklist_mirror() -> asyncio.Task:
+    """Démarre la synchronisation du miroir (une fois par process)."""
+    global _task
+    if _task is None or _task.done():
+        _task = asyncio.create_task(_follow())
+    return _task
+
+
+async def stop_blocklist_mirror() -> None:
+    global _task, _ready
+    task, _task = _task, None
+    _ready = False
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except (asyncio.CancelledError, Exception):
+            pass
+    _revoked.clear()
@@ -1,4 +1,4 @@
-from typing import Any, Callable, Coroutine
+from typing import Any, Callable, Coroutine, Dict, Optional
 
 from fastapi import FastAPI, status, HTTPException
 
@@ -69,6 +69,12 @@ class UserAlreadyExists(DefaultException):
     """
     pass
 
+class ServiceOverloaded(DefaultException):
+    """
+    Too many concurrent requests for a bounded resource (e.g. password hashing)
+    """
+    pass
+
 # src/error.py (ajouter cette exception)
 class EmailNotVerified(HTTPException):
     def __init__(self):
@@ -79,12 +85,13 @@ class EmailNotVerified(HTTPException):
 
 
 
-def create_error_handler(status_code: int, initial_detail: Any) -> Callable[
+def create_error_handler(status_code: int, initial_detail: Any, headers: Optional[Dict[str, str]] = None) -> Callable[
     [Request, Exception], Coroutine[Any, Any, JSONResponse]]:
     async def exception_handler(request: Request, exception: Exception) -> JSONResponse:
         return JSONResponse(
             content=initial_detail,
             status_code=status_code,
+            headers=headers,
         )
 
     return exception_handler
@@ -180,6 +187,18 @@ def register_error_handler(app: FastAPI):
         )
     )
 
+    app.add_exception_handler(
+        ServiceOverloaded,
+        create_error_handler(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            initial_detail={
+                "message": "Server busy, please retry shortly",
+                "error_code": "service_overloaded"
+            },
+            headers={"Retry-After": "1"}
+        )
+    )
+
     app.add_exception_handler(
         Forbidden,
         create_error_handler(
@@ -0,0 +1,275 @@
+"""
+Outbox transactionnelle des emails.
+
+Les routes n'envoient plus d'email directement : elles ajoutent une ligne
+email_outbox dans la même transaction que l'opération métier (inscription,
+reset...). L'email n'existe donc que si l'opération est validée, et il n'est
+pas perdu si le broker Celery est indisponible à ce moment-là.
+
+Un worker (drain_email_outbox_task, Celery beat + réveil après commit)
+réserve les lignes en attente par lots (FOR UPDATE SKIP LOCKED) et les envoie
+sur une connexion SMTP persistante, réutilisée d'un lot et d'une exécution à
+l'autre : une rafale de vérifications ne coûte plus une poignée de main TLS
+par email. Chaque ligne garde son propre état de retry (attempts,
+next_attempt_at, last_error) ; après OUTBOX_MAX_ATTEMPTS elle passe en
+"failed".
+
+Livraison "au moins une fois" : un worker interrompu au milieu d'un lot
+annule sa transaction, les emails déjà partis de ce lot seront renvoyés.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from email.utils import formataddr
+from typing import Dict, Iterable, List, Optional
+
+import aiosmtplib
+import sqlalchemy.dialects.postgresql as pg
+from sqlalchemy import Column, Index, Text, delete, text
+from sqlmodel import Field, SQLModel, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from src.config import Config
+
+logger = logging.getLogger("mail_outbox")
+logger.setLevel(logging.INFO)
+
+STATUS_PENDING = "pending"
+STATUS_SENT = "sent"
+STATUS_FAILED = "failed"
+
+NUDGE_KEY = "mail:outbox:nudge"
+NUDGE_DEBOUNCE_MS = 1000
+
+
+class EmailOutbox(SQLModel, table=True):
+    """Email à envoyer, écrit dans la transaction de l'opération qui le déclenche."""
+    __tablename__ = "email_outbox"
+    __table_args__ = (
+        Index(
+            "ix_email_outbox_pending",
+            "next_attempt_at",
+            "id",
+            postgresql_where=text("status = 'pending'"),
+        ),
+    )
+
+    id: Optional[int] = Field(
+        default=None,
+        sa_column=Column(pg.BIGINT, primary_key=True, autoincrement=True)
+    )
+    recipients: List[str] = Field(sa_column=Column(pg.JSONB, nullable=False))
+    subject: str = Field(sa_column=Column(Text, nullable=False))
+    body: str = Field(sa_column=Column(Text, nullable=False))
+    status: str = Field(
+        default=STATUS_PENDING,
+        sa_column=Column(Text, nullable=False, server_default=STATUS_PENDING)
+    )
+    attempts: int = Field(
+        default=0,
+        sa_column=Column(pg.INTEGER, nullable=False, server_default=text("0"))
+    )
+    next_attempt_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False))
+    last_error: Optional[str] = Field(default=None, sa_column=Column(Text, nullable=True))
+    created_at: datetime = Field(sa_column=Column(pg.TIMESTAMP, nullable=False))
+    sent_at: Optional[datetime] = Field(default=None, sa_column=Column(pg.TIMESTAMP, nullable=True))
+
+
+def build_email(recipients: Iterable[str], subject: str, body: str) -> EmailOutbox:
+    """Construit une ligne d'outbox sans l'ajouter à une session."""
+    now = datetime.now()
+    return EmailOutbox(
+        recipients=[str(r) for r in recipients],
+        subject=subject,
+        body=body,
+        next_attempt_at=now,
+        created_at=now,
+    )
+
+
+def enqueue_email(session: AsyncSession, recipients: Iterable[str], subject: str, body: str) -> EmailOutbox:
+    """Ajoute un email à la transaction en cours (envoyé après le commit de l'appelant)."""
+    row = build_email(recipients, subject, body)
+    session.add(row)
+    return row
+
+
+async def notify_outbox() -> None:
+    """
+    Réveille le worker après un commit. Au plus un réveil par seconde (SET NX
+    dans Redis) : une rafale d'inscriptions est envoyée par un seul drain.
+    Sans Redis, le passage périodique de Celery beat prend le relais.
+    """
+    try:
+        from src.db.redis import r
+        if await r.set(NUDGE_KEY, "1", nx=True, px=NUDGE_DEBOUNCE_MS):
+            from src.celery_tasks import drain_email_outbox_task
+            drain_email_outbox_task.apply_async(countdown=NUDGE_DEBOUNCE_MS / 1000)
+    except Exception as e:
+        logger.warning(f"Email outbox nudge failed: {e}")
+
+
+# --- Connexion SMTP persistante ---
+class _SmtpConnection:
+    """Une connexion SMTP par process, rouverte si fermée, inactive trop longtemps ou sur une autre boucle."""
+
+    def __init__(self):
+        self._client: Optional[aiosmtplib.SMTP] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._last_used = 0.0
+
+    async def get(self) -> aiosmtplib.SMTP:
+        loop = asyncio.get_running_loop()
+        idle = time.monotonic() - self._last_used
+        if (
+            self._client is None
+            or self._loop is not loop
+            or not self._client.is_connected
+            or idle > Config.SMTP_IDLE_TIMEOUT_SECONDS
+        ):
+            await self.close()
+            client = aiosmtplib.SMTP(
+                hostname=Config.MAIL_SERVER,
+                port=Config.MAIL_PORT,
+                use_tls=Config.MAIL_SSL_TLS,
+                start_tls=Config.MAIL_STARTTLS,
+                validate_certs=Config.VALIDATE_CERTS,
+                timeout=Config.SMTP_TIMEOUT_SECONDS,
+            )
+            await client.connect()
+            if Config.USE_CREDENTIALS:
+                await client.login(Config.MAIL_USERNAME, Config.MAIL_PASSWORD)
+            self._client, self._loop = client, loop
+        self._last_used = time.monotonic()
+        return self._client
+
+    def discard(self) -> None:
+        """Oublie la connexion courante (erreur de transport)."""
+        client, self._client = self._client, None
+        if client is not None:
+            client.close()
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        if client is None:
+            return
+        try:
+            if self._loop is asyncio.get_running_loop() and client.is_connected:
+                await client.quit()
+            else:
+                client.close()
+        except Exception:
+            client.close()
+
+    def reset(self) -> None:
+        """Après un fork : abandonner la socket héritée du parent sans la fermer."""
+        self._client, self._loop = None, None
+
+
+smtp_connection = _SmtpConnection()
+
+
+def _build_message(row: EmailOutbox) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = formataddr((Config.MAIL_FROM_NAME, Config.MAIL_FROM))
+    message["To"] = ", ".join(row.recipients)
+    message["Subject"] = row.subject
+    message.set_content(row.body, subtype="html")
+    return message
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=Config.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+
+
+async def drain_outbox(
+    batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None,
+) -> Dict[str, float]:
+    """
+    Envoie les emails en attente, par lots, jusqu'à épuisement (ou
+    `max_batches` lots). Retourne le nombre d'envois, de reports et d'échecs
+    définitifs, et la durée.
+    """
+    from src.db.main import async_session
+
+    batch_size = batch_size or Config.OUTBOX_BATCH_SIZE
+    max_batches = max_batches or Config.OUTBOX_MAX_BATCHES
+    started = time.perf_counter()
+    report = {"sent": 0, "retried": 0, "failed": 0}
+
+    for _ in range(max_batches):
+        async with async_session() as session:
+            result = await session.execute(
+                select(EmailOutbox)
+                .where(EmailOutbox.status == STATUS_PENDING, EmailOutbox.next_attempt_at <= datetime.now())
+                .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.scalars().all()
+            if not rows:
+                break
+
+            smtp_down = False
+            for row in rows:
+                try:
+                    smtp = await smtp_connection.get()
+                except Exception as e:
+                    # Serveur injoignable : pas une erreur du message, ne pas consommer de tentative
+                    logger.warning(f"SMTP connection failed, outbox drain postponed: {e}")
+                    smtp_down = True
+                    break
+                try:
+                    await smtp.send_message(_build_message(row))
+                    row.status = STATUS_SENT
+                    row.sent_at = datetime.now()
+                    report["sent"] += 1
+                except Exception as e:
+                    if isinstance(e, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, OSError)):
+                        smtp_connection.discard()
+                    row.attempts += 1
+                    row.last_error = str(e)[:1000]
+                    if row.attempts >= Config.OUTBOX_MAX_ATTEMPTS:
+                        row.status = STATUS_FAILED
+                        report["failed"] += 1
+                        logger.error(f"Email {row.id} to {row.recipients} failed permanently: {e}")
+                    else:
+                        row.next_attempt_at = datetime.now() + _retry_delay(row.attempts)
+                        report["retried"] += 1
+                        logger.warning(f"Email {row.id} attempt {row.attempts} failed: {e}")
+
+            await session.commit()
+
+        if smtp_down or len(rows) < batch_size:
+            break
+
+    report["duration_s"] = round(time.perf_counter() - started, 3)
+    return report
+
+
+async def purge_sent_emails(retention_days: Optional[int] = None, batch_size: int = 1000) -> int:
+    """Supprime par lots les emails envoyés depuis plus de `retention_days` jours."""
+    from src.db.main import async_session
+
+    cutoff = datetime.now() - timedelta(days=retention_days or Config.OUTBOX_RETENTION_DAYS)
+    removed = 0
+    async with async_session() as session:
+        while True:
+            batch = (
+                select(EmailOutbox.id)
+                .where(EmailOutbox.status == STATUS_SENT, EmailOutbox.sent_at < cutoff)
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                delete(EmailOutbox)
+                .where(EmailOutbox.id.in_(batch))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            removed += result.rowcount
+            if result.rowcount < batch_size:
+                return removed
@@ -0,0 +1,329 @@
+"""
+Classement XP servi depuis Redis.
+
+- lb:xp          ZSET  utilisateur_id -> xp
+- lb:usernames   HASH  utilisateur_id -> username
+- lb:meta        HASH  utilisateur_id -> {"niveau", "badges_count"} (JSON)
+
+Le ZSET est mis à jour à chaque écriture d'XP dans ProfileService, avec la
+valeur absolue relue dans MongoDB (pas d'incrément : aucune dérive possible).
+Un top N coûte deux allers-retours Redis, un rang individuel est en O(log N).
+
+Les clés sont hors du préfixe "leaderboard:*" pour ne pas être purgées par
+la maintenance des caches. Reconstruction complète depuis MongoDB :
+
+    python -m src.profile.leaderboard rebuild
+
+Tant que lb:built est absent (premier déploiement), get_top retourne None
+(repli MongoDB) et lance la reconstruction en tâche de fond. Pendant une
+reconstruction, les écritures sont aussi appliquées aux clés temporaires
+(scripts Lua, atomiques vis-à-vis de la bascule) : rien n'est perdu au RENAME.
+"""
+import asyncio
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+from uuid import UUID
+
+from sqlmodel import select
+
+from src.db.main import async_session
+from src.db.mongo_db import get_async_mongo_db
+from src.db.profile_redis import r
+from src.db.local_cache import MISSING, get_local_cache, publish_invalidation
+from src.config import Config
+from src.profile.mongo_models import ProfilMongoDB
+
+logger = logging.getLogger("leaderboard")
+logger.setLevel(logging.INFO)
+
+LEADERBOARD_KEY = "lb:xp"
+USERNAMES_KEY = "lb:usernames"
+META_KEY = "lb:meta"
+BUILT_KEY = "lb:built"
+REBUILD_LOCK_KEY = "lb:rebuild:lock"
+TMP_LEADERBOARD_KEY = f"{LEADERBOARD_KEY}:rebuild"
+TMP_META_KEY = f"{META_KEY}:rebuild"
+TMP_USERNAMES_KEY = f"{USERNAMES_KEY}:rebuild"
+REMOVED_DURING_REBUILD_KEY = "lb:rebuild:removed"
+REBUILD_LOCK_TTL = 120  # secondes
+REBUILD_BATCH_SIZE = 500
+ANONYMOUS_USERNAME = "Utilisateur anonyme"
+
+# L1 du top N (clé = limit), vidé sur tous les workers à chaque changement de score
+TOP_L1_NAME = "leaderboard:top"
+_top_l1 = get_local_cache(TOP_L1_NAME, ttl=Config.L1_LEADERBOARD_TTL, max_entries=100)
+
+# Écritures appliquées aux clés live, et aux clés temporaires si une reconstruction est en cours
+# KEYS: verrou, zset, meta, zset tmp, meta tmp ; ARGV: membre, xp, meta
+_RECORD_SCRIPT = """
+redis.call('zadd', KEYS[2], ARGV[2], ARGV[1])
+redis.call('hset', KEYS[3], ARGV[1], ARGV[3])
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('zadd', KEYS[4], ARGV[2], ARGV[1])
+    redis.call('hset', KEYS[5], ARGV[1], ARGV[3])
+end
+"""
+# KEYS: verrou, usernames, usernames tmp ; ARGV: membre, username
+_USERNAME_SCRIPT = """
+redis.call('hset', KEYS[2], ARGV[1], ARGV[2])
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('hset', KEYS[3], ARGV[1], ARGV[2])
+end
+"""
+# KEYS: verrou, zset, meta, usernames, zset tmp, meta tmp, usernames tmp, supprimés ; ARGV: membre
+_REMOVE_SCRIPT = """
+redis.call('zrem', KEYS[2], ARGV[1])
+redis.call('hdel', KEYS[3], ARGV[1])
+redis.call('hdel', KEYS[4], ARGV[1])
+if redis.call('exists', KEYS[1]) == 1 then
+    redis.call('zrem', KEYS[5], ARGV[1])
+    redis.call('hdel', KEYS[6], ARGV[1])
+    redis.call('hdel', KEYS[7], ARGV[1])
+    redis.call('sadd', KEYS[8], ARGV[1])
+end
+"""
+
+_rebuild_task: Optional[asyncio.Task] = None
+
+
+async def _invalidate_top() -> None:
+    await publish_invalidation(cache=TOP_L1_NAME)
+
+
+async def record_entry(user_id: UUID | str, xp: int, niveau: int, badges_count: int) -> None:
+    """Positionne (atomiquement) le score et les métadonnées d'un utilisateur."""
+    member = str(user_id)
+    try:
+        await r.eval(
+            _RECORD_SCRIPT, 5,
+            REBUILD_LOCK_KEY, LEADERBOARD_KEY, META_KEY, TMP_LEADERBOARD_KEY, TMP_META_KEY,
+            member, xp, json.dumps({"niveau": niveau, "badges_count": badges_count}),
+        )
+    except Exception as e:
+        logger.warning(f"Redis leaderboard update failed for user {member}: {e}")
+    await _invalidate_top()
+
+
+async def record_profile(profil: ProfilMongoDB) -> None:
+    """Raccourci : met à jour le classement depuis un profil MongoDB."""
+    await record_entry(profil.utilisateur_id, profil.xp, profil.niveau, len(profil.badges))
+
+
+async def set_username(user_id: UUID | str, username: str) -> None:
+    """Enregistre le username affiché pour un utilisateur."""
+    try:
+        await r.eval(_USERNAME_SCRIPT, 3, REBUILD_LOCK_KEY, USERNAMES_KEY, TMP_USERNAMES_KEY, str(user_id), username)
+    except Exception as e:
+        logger.warning(f"Redis leaderboard username update failed for user {user_id}: {e}")
+
+
+async def remove_entry(user_id: UUID | str) -> None:
+    """Retire un utilisateur du classement (profil supprimé)."""
+    member = str(user_id)
+    try:
+        await r.eval(
+            _REMOVE_SCRIPT, 8,
+            REBUILD_LOCK_KEY, LEADERBOARD_KEY, META_KEY, USERNAMES_KEY,
+            TMP_LEADERBOARD_KEY, TMP_META_KEY, TMP_USERNAMES_KEY, REMOVED_DURING_REBUILD_KEY,
+            member,
+        )
+    except Exception as e:
+        logger.warning(f"Redis leaderboard removal failed for user {member}: {e}")
+    await _invalidate_top()
+
+
+async def fetch_usernames(user_ids: Iterable[str]) -> Dict[str, str]:
+    """Usernames PostgreSQL en une seule requête (IN) pour un lot d'utilisateurs."""
+    from src.users.models import Utilisateur
+
+    ids = []
+    for user_id in user_ids:
+        try:
+            ids.append(UUID(str(user_id)))
+        except ValueError:
+            continue
+    if not ids:
+        return {}
+
+    async with async_session() as session:
+        result = await session.execute(
+            select(Utilisateur.id, Utilisateur.username).where(Utilisateur.id.in_(ids))
+        )
+        return {str(row[0]): row[1] for row in result.all()}
+
+
+async def _background_rebuild() -> None:
+    try:
+        await rebuild_leaderboard()
+    except Exception as e:
+        logger.warning(f"Leaderboard background rebuild failed: {e}")
+
+
+def _schedule_rebuild() -> None:
+    """Reconstruction hors requête (une tâche par worker ; le verrou Redis n'en laisse passer qu'une)."""
+    global _rebuild_task
+    if _rebuild_task is None or _rebuild_task.done():
+        _rebuild_task = asyncio.create_task(_background_rebuild())
+
+
+async def get_top(limit: int = 10) -> Optional[List[Dict[str, Any]]]:
+    """
+    Top `limit` du classement (copie, l'appelant peut la modifier).
+    Retourne None si Redis est indisponible ou si le classement n'a pas encore
+    été construit (l'appelant se rabat sur MongoDB).
+    """
+    cached = _top_l1.get(limit)
+    if cached is not MISSING:
+        return [dict(entry) for entry in cached]
+
+    generation = _top_l1.generation
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.exists(BUILT_KEY)
+            pipe.zrevrange(LEADERBOARD_KEY, 0, limit - 1, withscores=True)
+            built, entries = await pipe.execute()
+        if not built:
+            # Premier accès après déploiement : lb:xp ne contient que les profils
+            # modifiés depuis, construire le classement complet en arrière-plan
+            _schedule_rebuild()
+            return None
+        if not entries:
+            return []
+
+        members = [member for member, _ in entries]
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.hmget(USERNAMES_KEY, members)
+            pipe.hmget(META_KEY, members)
+            usernames, metas = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis leaderboard read failed: {e}")
+        return None
+
+    # Usernames manquants : un seul lot PostgreSQL, puis mémorisés dans le hash
+    missing = [members[i] for i, username in enumerate(usernames) if username is None]
+    if missing:
+        fetched = await fetch_usernames(missing)
+        if fetched:
+            try:
+                await r.hset(USERNAMES_KEY, mapping=fetched)
+            except Exception as e:
+                logger.warning(f"Redis leaderboard username backfill failed: {e}")
+        usernames = [username if username is not None else fetched.get(members[i]) for i, username in enumerate(usernames)]
+
+    leaderboard = []
+    for i, (member, score) in enumerate(entries):
+        meta = json.loads(metas[i]) if metas[i] else {}
+        leaderboard.append({
+            "rank": i + 1,
+            "username": usernames[i] or ANONYMOUS_USERNAME,
+            "niveau": meta.get("niveau", 1),
+            "xp": int(score),
+            "badges_count": meta.get("badges_count", 0)
+        })
+
+    _top_l1.set(limit, leaderboard, generation=generation)
+    return [dict(entry) for entry in leaderboard]
+
+
+async def get_rank(user_id: UUID | str) -> Optional[Dict[str, Any]]:
+    """Rang (1 = premier) et XP d'un utilisateur, en O(log N). None si absent."""
+    member = str(user_id)
+    try:
+        async with r.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(LEADERBOARD_KEY, member)
+            pipe.zscore(LEADERBOARD_KEY, member)
+            pipe.zcard(LEADERBOARD_KEY)
+            rank, score, total = await pipe.execute()
+    except Exception as e:
+        logger.warning(f"Redis leaderboard rank failed for user {member}: {e}")
+        return None
+
+    if rank is None:
+        return None
+    return {"rank": rank + 1, "xp": int(score), "total_players": total}
+
+
+async def rebuild_leaderboard() -> int:
+    """
+    Reconstruit le classement complet depuis MongoDB (et les usernames depuis
+    PostgreSQL) dans des clés temporaires, puis les bascule atomiquement.
+    Les écritures concurrentes vont aussi dans les clés temporaires : le scan
+    n'écrase pas leurs valeurs (NX), plus récentes que sa lecture.
+    Retourne le nombre de profils indexés (-1 si une reconstruction est déjà en cours).
+    """
+    if not await r.set(REBUILD_LOCK_KEY, "1", nx=True, ex=REBUILD_LOCK_TTL):
+        return -1
+
+    tmp_zset, tmp_meta, tmp_names = TMP_LEADERBOARD_KEY, TMP_META_KEY, TMP_USERNAMES_KEY
+    try:
+        await r.delete(tmp_zset, tmp_meta, tmp_names, REMOVED_DURING_REBUILD_KEY)
+
+        cursor = get_async_mongo_db().profils.find(
+            {},
+            {"utilisateur_id": 1, "xp": 1, "niveau": 1, "badges": 1}
+        ).batch_size(REBUILD_BATCH_SIZE)
+
+        count = 0
+        batch: List[Dict[str, Any]] = []
+
+        async def flush(docs: List[Dict[str, Any]]) -> None:
+            usernames = await fetch_usernames(doc["utilisateur_id"] for doc in docs)
+            async with r.pipeline(transaction=False) as pipe:
+                pipe.zadd(tmp_zset, {doc["utilisateur_id"]: doc.get("xp", 0) for doc in docs}, nx=True)
+                for doc in docs:
+                    pipe.hsetnx(tmp_meta, doc["utilisateur_id"], json.dumps({
+                        "niveau": doc.get("niveau", 1),
+                        "badges_count": len(doc.get("badges") or [])
+                    }))
+                for member, username in usernames.items():
+                    pipe.hsetnx(tmp_names, member, username)
+                # Verrou prolongé : les écritures concurrentes restent doublées jusqu'à la bascule
+                pipe.expire(REBUILD_LOCK_KEY, REBUILD_LOCK_TTL)
+                await pipe.execute()
+
+        async for doc in cursor:
+            if not doc.get("utilisateur_id"):
+                continue
+            doc["utilisateur_id"] = str(doc["utilisateur_id"])
+            batch.append(doc)
+            if len(batch) >= REBUILD_BATCH_SIZE:
+                await flush(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            await flush(batch)
+            count += len(batch)
+
+        # Profils supprimés pendant le scan (lus avant leur suppression)
+        removed = await r.smembers(REMOVED_DURING_REBUILD_KEY)
+
+        # Bascule atomique (RENAME échoue sur une clé absente : supprimer à la place)
+        async with r.pipeline(transaction=True) as pipe:
+            if removed:
+                pipe.zrem(tmp_zset, *removed)
+                pipe.hdel(tmp_meta, *removed)
+                pipe.hdel(tmp_names, *removed)
+            for tmp, live in ((tmp_zset, LEADERBOARD_KEY), (tmp_meta, META_KEY), (tmp_names, USERNAMES_KEY)):
+                if await r.exists(tmp):
+                    pipe.rename(tmp, live)
+                else:
+                    pipe.delete(live)
+            pipe.set(BUILT_KEY, "1")
+            pipe.delete(REMOVED_DURING_REBUILD_KEY)
+            await pipe.execute()
+
+        await _invalidate_top()
+        logger.info(f"Leaderboard rebuilt with {count} profiles")
+        return count
+    finally:
+        await r.delete(REBUILD_LOCK_KEY)
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "rebuild":
+        print(f"Profils indexés : {asyncio.run(rebuild_leaderboard())}")
+    else:
+        print(__doc__)
@@ -11,15 +11,20 @@ from src.profile.mongo_models import (
     ChatConversationMongoDB,
     LearningPathMongoDB
 )
-from src.db.mongo_db import async_mongo_db
+from src.db.mongo_db import get_async_mongo_db
 
 
 class CourseService:
     """Service de gestion des cours"""
 
-    def __init__(self):
-        self.db = async_mongo_db
-        self.collection = self.db["courses"]
+    @property
+    def db(self):
+        # Résolu à chaque appel : client Motor de la boucle courante
+        return get_async_mongo_db()
+
+    @property
+    def collection(self):
+        return self.db["courses"]
 
     async def create_course(self, course_data: Dict[str, Any]) -> str:
         """Créer un nouveau cours"""
@@ -71,9 +76,14 @@ class CourseService:
 class ProgressionService:
     """Service de gestion de la progression utilisateur"""
 
-    def __init__(self):
-        self.db = async_mongo_db
-        self.collection = self.db["user_progressions"]
+    @property
+    def db(self):
+        # Résolu à chaque appel : client Motor de la boucle courante
+        return get_async_mongo_db()
+
+    @property
+    def collection(self):
+        return self.db["user_progressions"]
 
     async def create_progression(
         self,
@@ -221,9 +231,14 @@ class ProgressionService:
 class ChatbotService:
     """Service de gestion des conversations chatbot"""
 
-    def __init__(self):
-        self.db = async_mongo_db
-        self.collection = self.db["chat_conversations"]
+    @property
+    def db(self):
+        # Résolu à chaque appel : client Motor de la boucle courante
+        return get_async_mongo_db()
+
+    @property
+    def collection(self):
+        return self.db["chat_conversations"]
 
     async def create_conversation(
         self,
@@ -298,6 +313,22 @@ class ChatbotService:
         )
         return result.modified_count > 0 or result.upserted_id is not None
 
+    async def get_recent_messages(
+        self,
+        utilisateur_id: UUID,
+        session_id: str,
+        limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """Derniers messages d'une conversation (projection $slice : lecture bornée)"""
+        conversation_doc = await self.collection.find_one(
+            {
+                "utilisateur_id": str(utilisateur_id),
+                "session_id": session_id
+            },
+            {"messages": {"$slice": -limit}, "_id": 0}
+        )
+        return (conversation_doc or {}).get("messages", [])
+
     async def get_recent_conversations(
         self,
         utilisateur_id: UUID,
@@ -336,9 +367,14 @@ class ChatbotService:
 class LearningPathService:
     """Service de gestion des parcours d'apprentissage"""
 
-    def __init__(self):
-        self.db = async_mongo_db
-        self.collection = self.db["learning_paths"]
+    @property
+    def db(self):
+        # Résolu à chaque appel : client Motor de la boucle courante
+        return get_async_mongo_db()
+
+    @property
+    def collection(self):
+        return self.db["learning_paths"]
 
     async def create_learning_path(
         self,
@@ -6,12 +6,11 @@ from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta, UTC
 from uuid import UUID
 import logging
-import os
 
-from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorClient
+from motor.motor_asyncio import AsyncIOMotorDatabase
 
 
-from src.config import Config
+from src.db.mongo_db import get_async_mongo_db
 from src.profile.mongo_models import (
     ProfilMongoDB
 )
@@ -24,20 +23,22 @@ logger = logging.getLogger(__name__)
 class RoadmapService:
     """Service de gestion des roadmaps personnalisées"""
 
-    def __init__(self):
-        # Créer un client Motor dédié à la boucle courante pour éviter les erreurs de boucle croisée
-        self._client = AsyncIOMotorClient(
-            host=Config.MONGO_HOST if os.getenv('DOCKER_ENV', 'false').lower() == 'true' else 'localhost',
-            port=Config.MONGO_PORT,
-            username=Config.MONGO_APP_USERNAME,
-            password=Config.MONGO_APP_PASSWORD,
-            authSource=Config.MONGO_DATABASE,
-            serverSelectionTimeoutMS=5000,
-        )
-        self.db: AsyncIOMotorDatabase = self._client[Config.MONGO_DATABASE]
-        self.courses_collection = self.db["courses"]
-        self.progressions_collection = self.db["user_progressions"]
-        self.profiles_collection = self.db["profils"]
+    @property
+    def db(self) -> AsyncIOMotorDatabase:
+        # Client Motor partagé de la boucle courante (registre src.db.mongo_db)
+        return get_async_mongo_db()
+
+    @property
+    def courses_collection(self):
+        return self.db["courses"]
+
+    @property
+    def progressions_collection(self):
+        return self.db["user_progressions"]
+
+    @property
+    def profiles_collection(self):
+        return self.db["profils"]
 
     def _convert_uuids_to_strings(self, obj: Any) -> Any:
         """
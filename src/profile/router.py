@@ -8,6 +8,7 @@ from fastapi import APIRouter, Depends, HTTPException, status, Query, Body
 from src.error import ProfileNotFound
 from src.profile.schema import ProfilResponse, ProfilCreate, ProfilUpdate, XPRequest, BadgeRequest, ActivityRequest
 from src.profile.services import profile_service
+from src.profile import leaderboard as leaderboard_engine
 from src.users.dependencies import get_current_user
 from src.users.models import Utilisateur
 from src.users.schema import UtilisateurRead  # pour typing facultatif
@@ -15,16 +16,11 @@ from src.users.schema import UtilisateurRead  # pour typing facultatif
 
 # Import des fonctions Redis pour les profils
 from src.db.profile_redis import (
-    get_profile_cache,
     set_profile_cache,
-    get_leaderboard_cache,
-    set_leaderboard_cache,
-    invalidate_leaderboard_cache,
-    get_profile_stats_cache,
-    set_profile_stats_cache,
-    get_activities_cache,
-    set_activities_cache,
-    invalidate_user_related_caches
+    invalidate_user_related_caches,
+    profile_cache,
+    profile_stats_cache,
+    activities_cache
 )
 from ..celery_tasks import  generate_profile_question_task
 # Ajout import de la tâche d'analyse
@@ -35,6 +31,24 @@ router = APIRouter()
 logger = logging.getLogger("profile_router")
 
 
+@profile_stats_cache.cached(key=lambda user_id: user_id)
+async def _load_profile_stats(user_id):
+    return await profile_service.get_profile_stats(user_id)
+
+
+@activities_cache.cached(key=lambda user_id: user_id)
+async def _load_activities(user_id):
+    """Historique complet trié (le plus récent d'abord) ; None si pas de profil."""
+    profile = await profile_service.get_profile_by_user_id(user_id)
+    if not profile:
+        return None
+    return sorted(
+        profile.historique_activites,
+        key=lambda x: x.get("timestamp", datetime.min),
+        reverse=True
+    )
+
+
 @router.post("/", response_model=ProfilResponse, status_code=status.HTTP_201_CREATED)
 async def create_profile(
         profile_data: ProfilCreate,
@@ -52,8 +66,8 @@ async def create_profile(
         try:
             profile_dict = profile.model_dump() if hasattr(profile, 'model_dump') else profile.__dict__
             await set_profile_cache(current_user.id, profile_dict)
-            # Invalider le leaderboard car nouveau profil
-            await invalidate_leaderboard_cache()
+            # Username affiché dans le classement
+            await leaderboard_engine.set_username(current_user.id, current_user.username)
         except Exception as e:
             logger.warning(f"Redis caching failed after profile creation: {e}")
 
@@ -85,17 +99,11 @@ async def get_my_profile(
     Le frontend doit rediriger vers /questionnaire dans ce cas.
     """
 
-    # Tentative de récupération depuis le cache
-    try:
-        cached_profile = await get_profile_cache(current_user.id)
-        if cached_profile:
-            logger.info(f"Profile cache hit for user {current_user.id}")
-            return ProfilResponse.model_validate(cached_profile)
-    except Exception as e:
-        logger.warning(f"Redis unavailable for profile cache: {e}")
-
-    # Récupération depuis la base de données
-    profile = await profile_service.get_profile_by_user_id(current_user.id)
+    # Cache (un seul chargement MongoDB par utilisateur même sous requêtes concurrentes)
+    profile = await profile_cache.get_or_load(
+        current_user.id,
+        lambda: profile_service.get_profile_by_user_id(current_user.id)
+    )
 
     if not profile:
         # ✅ CHANGEMENT: Ne plus créer automatiquement le profil
@@ -103,13 +111,6 @@ async def get_my_profile(
         logger.info(f"Profile not found for user {current_user.id} - questionnaire required")
         raise ProfileNotFound()
 
-    # Mettre en cache le profil récupéré
-    try:
-        profile_dict = profile.model_dump() if hasattr(profile, 'model_dump') else profile.__dict__
-        await set_profile_cache(current_user.id, profile_dict)
-    except Exception as e:
-        logger.warning(f"Redis caching failed after profile retrieval: {e}")
-
     return profile
 
 
@@ -176,7 +177,7 @@ async def add_xp(
     if not profile:
         raise ProfileNotFound()
 
-    # Invalider les caches (profil, stats, leaderboard)
+    # Invalider les caches (profil, stats) ; le classement est mis à jour par add_xp
     try:
         await invalidate_user_related_caches(current_user.id)
         # Mettre à jour le cache du profil
@@ -198,26 +199,10 @@ async def get_profile_stats(
 ):
     """Obtenir les statistiques du profil de l'utilisateur connecté"""
 
-    # Vérifier le cache des stats
-    try:
-        cached_stats = await get_profile_stats_cache(current_user.id)
-        if cached_stats:
-            logger.info(f"Profile stats cache hit for user {current_user.id}")
-            return cached_stats
-    except Exception as e:
-        logger.warning(f"Redis unavailable for stats cache: {e}")
-
-    # Récupérer depuis le service
-    stats = await profile_service.get_profile_stats(current_user.id)
+    stats = await _load_profile_stats(current_user.id)
     if not stats:
         raise ProfileNotFound()
 
-    # Mettre en cache les stats
-    try:
-        await set_profile_stats_cache(current_user.id, stats)
-    except Exception as e:
-        logger.warning(f"Redis caching failed for profile stats: {e}")
-
     return stats
 
 
@@ -276,42 +261,19 @@ async def get_leaderboard(
     SÉCURITÉ: Affiche username au lieu de UUID pour protéger la vie privée
     """
 
-    # Vérifier le cache du leaderboard
-    try:
-        cached_leaderboard = await get_leaderboard_cache()
-        if cached_leaderboard:
-            logger.info("Leaderboard cache hit")
-            # Appliquer la limite sur les données cachées
-            limited_data = cached_leaderboard[:limit]
-
-            # Marquer l'utilisateur connecté
-            for entry in limited_data:
-                entry["is_me"] = (entry.get("username") == current_user.username)
-
-            return {
-                "leaderboard": limited_data,
-                "total_results": len(limited_data)
-            }
-    except Exception as e:
-        logger.warning(f"Redis unavailable for leaderboard cache: {e}")
-
     try:
+        # ZSET Redis : top N + rang de l'utilisateur connecté en O(log N)
         leaderboard = await profile_service.get_leaderboard(limit)
+        my_rank = await leaderboard_engine.get_rank(current_user.id)
 
         # Marquer l'utilisateur connecté
         for entry in leaderboard:
             entry["is_me"] = (entry.get("username") == current_user.username)
 
-        # Mettre en cache le leaderboard complet (sans le flag is_me)
-        try:
-            full_leaderboard = await profile_service.get_leaderboard(100)
-            await set_leaderboard_cache(full_leaderboard)
-        except Exception as e:
-            logger.warning(f"Redis caching failed for leaderboard: {e}")
-
         return {
             "leaderboard": leaderboard,
-            "total_results": len(leaderboard)
+            "total_results": len(leaderboard),
+            "my_rank": my_rank
         }
     except Exception:
         raise HTTPException(
@@ -327,40 +289,13 @@ async def get_activity_history(
 ):
     """Obtenir l'historique des activités de l'utilisateur connecté"""
 
-    # Vérifier le cache des activités
-    try:
-        cached_activities = await get_activities_cache(current_user.id)
-        if cached_activities:
-            logger.info(f"Activities cache hit for user {current_user.id}")
-            limited_activities = cached_activities[:limit]
-            return {
-                "activities": limited_activities,
-                "total_activities": len(cached_activities)
-            }
-    except Exception as e:
-        logger.warning(f"Redis unavailable for activities cache: {e}")
-
-    # Récupérer depuis la base de données
-    profile = await profile_service.get_profile_by_user_id(current_user.id)
-    if not profile:
+    activities = await _load_activities(current_user.id)
+    if activities is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Profile not found"
         )
 
-    # Retourner les dernières activités triées par timestamp
-    activities = sorted(
-        profile.historique_activites,
-        key=lambda x: x.get("timestamp", datetime.min),
-        reverse=True
-    )
-
-    # Mettre en cache toutes les activités
-    try:
-        await set_activities_cache(current_user.id, activities)
-    except Exception as e:
-        logger.warning(f"Redis caching failed for activities: {e}")
-
     limited_activities = activities[:limit]
     return {
         "activities": limited_activities,
@@ -831,28 +766,13 @@ async def get_enriched_leaderboard(
     Marque l'utilisateur connecté avec 'is_me': true
     """
 
-    # Tenter de récupérer depuis le cache
-    try:
-        cached = await get_leaderboard_cache()
-        if cached:
-            # Marquer l'utilisateur connecté dans le cache
-            for entry in cached[:limit]:
-                entry["is_me"] = (entry.get("username") == current_user.username)
-            return {"leaderboard": cached[:limit], "source": "cache"}
-    except Exception as e:
-        logger.warning(f"Redis unavailable for leaderboard: {e}")
-
-    # Récupérer depuis la DB
+    # Classement servi par le ZSET Redis (repli MongoDB si Redis indisponible)
     leaderboard_basic = await profile_service.get_leaderboard(limit)
 
     # Enrichir avec des données supplémentaires
     enriched = []
     for entry in leaderboard_basic:
-        # Le leaderboard retourne maintenant username au lieu de UUID
         username = entry["username"]
-
-        # Trouver le profil par username (on doit d'abord trouver l'UUID)
-        # Pour l'instant, on va juste utiliser les données de base
         enriched.append({
             "rank": entry["rank"],
             "username": username,  # USERNAME SÉCURISÉ
@@ -862,19 +782,9 @@ async def get_enriched_leaderboard(
             "is_me": (username == current_user.username),  # Marquer si c'est l'utilisateur connecté
         })
 
-    # Mettre en cache (sans le flag is_me)
-    try:
-        cache_data = [
-            {k: v for k, v in item.items() if k != "is_me"}
-            for item in enriched
-        ]
-        await set_leaderboard_cache(cache_data)
-    except Exception as e:
-        logger.warning(f"Failed to cache leaderboard: {e}")
-
     return {
         "leaderboard": enriched,
-        "source": "database"
+        "source": "redis"
     }
 
 
@@ -4,9 +4,10 @@ from datetime import datetime
 from bson import ObjectId
 from pymongo.errors import DuplicateKeyError
 
-from src.db.mongo_db import async_mongo_db
+from src.db.mongo_db import get_async_mongo_db
 from src.profile.mongo_models import ProfilMongoDB
 from src.profile.schema import ProfilCreate, ProfilUpdate
+from src.profile import leaderboard
 from src.profile.gamification import (
     GamificationEngine,
     BADGE_CONFIG
@@ -16,8 +17,10 @@ from src.profile.gamification import (
 class ProfileService:
     """Service pour gérer les profils utilisateurs dans MongoDB"""
 
-    def __init__(self):
-        self.collection = async_mongo_db.profils
+    @property
+    def collection(self):
+        # Résolu à chaque appel : client Motor de la boucle courante
+        return get_async_mongo_db().profils
 
     async def create_profile(self, profile_data: ProfilCreate) -> ProfilMongoDB:
         """Créer un nouveau profil utilisateur"""
@@ -35,7 +38,9 @@ class ProfileService:
         try:
             result = await self.collection.insert_one(profil_dict)
             created_profil = await self.collection.find_one({"_id": result.inserted_id})
-            return ProfilMongoDB(**created_profil)
+            profil = ProfilMongoDB(**created_profil)
+            await leaderboard.record_profile(profil)
+            return profil
         except DuplicateKeyError:
             raise ValueError(f"Profile already exists for user {profile_data.utilisateur_id}")
 
@@ -68,12 +73,16 @@ class ProfileService:
         )
 
         if result:
-            return ProfilMongoDB(**result)
+            profil = ProfilMongoDB(**result)
+            await leaderboard.record_profile(profil)
+            return profil
         return None
 
     async def delete_profile(self, user_id: UUID) -> bool:
         """Supprimer le profil d'un utilisateur"""
         result = await self.collection.delete_one({"utilisateur_id": str(user_id)})
+        if result.deleted_count > 0:
+            await leaderboard.remove_entry(user_id)
         return result.deleted_count > 0
 
     async def add_xp(self, user_id: UUID, xp_points: int) -> Optional[ProfilMongoDB]:
@@ -92,7 +101,9 @@ class ProfileService:
             await self._check_level_up(profil)
             # Récupérer le profil mis à jour
             updated_profil = await self.collection.find_one({"_id": profil.id})
-            return ProfilMongoDB(**updated_profil) if updated_profil else profil
+            profil = ProfilMongoDB(**updated_profil) if updated_profil else profil
+            await leaderboard.record_profile(profil)
+            return profil
         return None
 
     async def add_badge(self, user_id: UUID, badge: str) -> Optional[ProfilMongoDB]:
@@ -107,7 +118,9 @@ class ProfileService:
         )
 
         if result:
-            return ProfilMongoDB(**result)
+            profil = ProfilMongoDB(**result)
+            await leaderboard.record_profile(profil)
+            return profil
         return None
 
     async def add_competence(self, user_id: UUID, competence: str) -> Optional[ProfilMongoDB]:
@@ -205,38 +218,32 @@ class ProfileService:
     async def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """
         Obtenir le classement des utilisateurs par XP (anonymisé)
-        Retourne username au lieu de UUID pour protéger la vie privée
+        Retourne username au lieu de UUID pour protéger la vie privée.
+        Servi par le ZSET Redis ; MongoDB n'est lu que si Redis est indisponible.
         """
-        from src.db.main import get_session
-        from src.users.models import Utilisateur
-        from sqlmodel import select
-
-        cursor = self.collection.find({}).sort("xp", -1).limit(limit)
+        top = await leaderboard.get_top(limit)
+        if top is not None:
+            return top
+
+        cursor = self.collection.find(
+            {},
+            {"utilisateur_id": 1, "xp": 1, "niveau": 1, "badges": 1}
+        ).sort("xp", -1).limit(limit)
         profiles = await cursor.to_list(length=limit)
 
-        leaderboard = []
-
-        # Récupérer les usernames depuis PostgreSQL
-        async with get_session() as session:
-            for i, profil_data in enumerate(profiles, 1):
-                profil = ProfilMongoDB(**profil_data)
-
-                # Récupérer le username de l'utilisateur
-                stmt = select(Utilisateur.username).where(Utilisateur.id == profil.utilisateur_id)
-                result = await session.execute(stmt)
-                user = result.first()
+        # Usernames PostgreSQL en une seule requête
+        usernames = await leaderboard.fetch_usernames(p.get("utilisateur_id") for p in profiles)
 
-                username = user[0] if user else "Utilisateur anonyme"
-
-                leaderboard.append({
-                    "rank": i,
-                    "username": username,  # USERNAME au lieu de UUID
-                    "niveau": profil.niveau,
-                    "xp": profil.xp,
-                    "badges_count": len(profil.badges)
-                })
-
-        return leaderboard
+        return [
+            {
+                "rank": i,
+                "username": usernames.get(str(p.get("utilisateur_id")), leaderboard.ANONYMOUS_USERNAME),  # USERNAME au lieu de UUID
+                "niveau": p.get("niveau", 1),
+                "xp": p.get("xp", 0),
+                "badges_count": len(p.get("badges") or [])
+            }
+            for i, p in enumerate(profiles, 1)
+        ]
 
     async def _check_level_up(self, profil: ProfilMongoDB) -> None:
         """Vérifier et mettre à jour le niveau basé sur l'XP"""
@@ -467,6 +474,12 @@ class ProfileService:
             {"utilisateur_id": str(user_id)},
             {"$set": update_fields}
         )
+        await leaderboard.record_entry(
+            user_id,
+            new_xp_total,
+            new_level,
+            len(update_fields.get("badges", profile.badges))
+        )
 
         # 8. Logger l'activité
         await self.log_activity(
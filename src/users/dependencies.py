@@ -6,8 +6,8 @@ from fastapi import Request, HTTPException, status, Depends
 from sqlmodel.ext.asyncio.session import AsyncSession
 from .schema import UtilisateurRead
 from src.users.utils import decode_token
-from src.db.redis import is_jti_in_blocklist
-from src.db.main import get_session
+from src.db.redis import is_jti_in_blocklist, principal_cache
+from src.db.main import async_session, get_session
 from .services import UserService
 from src.error import (
     RevokedToken,
@@ -71,11 +71,52 @@ class RefreshTokenBearer(AccessToken):
             raise AccessTokenRequired()
 
 
-# python
+def _build_principal(user) -> UtilisateurRead:
+    """UtilisateurRead enrichi avec les champs du profil lié (Etudiant/Professeur)."""
+    data = UtilisateurRead.model_validate(user, from_attributes=True)
+    if user.status == "Etudiant" and user.etudiant:
+        data.niveau_technique = user.etudiant.niveau_technique
+        data.competences = user.etudiant.competences
+        data.objectifs_apprentissage = user.etudiant.objectifs_apprentissage
+        data.motivation = user.etudiant.motivation
+        data.niveau_energie = user.etudiant.niveau_energie
+    elif user.status == "Professeur" and user.professeur:
+        data.niveau_experience = user.professeur.niveau_experience
+        data.specialites = user.professeur.specialites
+        data.motivation_principale = user.professeur.motivation_principale
+        data.niveau_technologique = user.professeur.niveau_technologique
+    return data
+
+
+async def _load_principal(user_email: str, session: AsyncSession) -> UtilisateurRead:
+    # Charger l'utilisateur avec ses relations
+    user = await users_service.get_user_by_email(user_email, session=session)
+    if not user:
+        logger.warning(f"User not found for email: {user_email}")
+        raise UserNotFound()
+    # Lever avant la mise en cache : seuls les comptes vérifiés sont mis en cache
+    if not getattr(user, 'is_verified', False):
+        logger.warning(f"User {user_email} attempted to access with unverified email")
+        raise EmailNotVerified()
+    return _build_principal(user)
+
+
+async def _load_principal_own_session(user_email: str) -> UtilisateurRead:
+    # Chargement partagé (single-flight) : sa propre session, la session de la
+    # requête appelante peut être fermée si celle-ci est annulée
+    async with async_session() as session:
+        return await _load_principal(user_email, session)
+
+
 async def get_current_user(
     session: AsyncSession = Depends(get_session),
     token_details: dict = Depends(AccessTokenBearer())
 ) -> UtilisateurRead:
+    """
+    Utilisateur authentifié. Servi depuis principal_cache (L1 puis Redis) ;
+    PostgreSQL n'est interrogé qu'après une mise à jour de l'utilisateur
+    (bump_version("user", id)) ou l'expiration du cache.
+    """
     try:
         user_data = token_details.get("user")
         if isinstance(user_data, dict) and "user" in user_data:
@@ -90,28 +131,19 @@ async def get_current_user(
         if not user_email:
             logger.error(f"No email found in token data: {user_data}")
             raise InvalidToken()
-        # Charger l'utilisateur avec ses relations
-        user = await users_service.get_user_by_email(user_email, session=session)
-        if not user:
-            logger.warning(f"User not found for email: {user_email}")
-            raise UserNotFound()
-        if not getattr(user, 'is_verified', False):
-            logger.warning(f"User {user_email} attempted to access with unverified email")
-            raise EmailNotVerified()
-        # Enrichir avec les champs du profil lié
-        data = UtilisateurRead.model_validate(user, from_attributes=True)
-        if user.status == "Etudiant" and user.etudiant:
-            data.niveau_technique = user.etudiant.niveau_technique
-            data.competences = user.etudiant.competences
-            data.objectifs_apprentissage = user.etudiant.objectifs_apprentissage
-            data.motivation = user.etudiant.motivation
-            data.niveau_energie = user.etudiant.niveau_energie
-        elif user.status == "Professeur" and user.professeur:
-            data.niveau_experience = user.professeur.niveau_experience
-            data.specialites = user.professeur.specialites
-            data.motivation_principale = user.professeur.motivation_principale
-            data.niveau_technologique = user.professeur.niveau_technologique
-        return data
+
+        user_id = user_data.get("id")
+        if not user_id:
+            # Anciens tokens sans id : pas de clé de cache
+            return await _load_principal(user_email, session)
+
+        principal = await principal_cache.get_or_load(
+            str(user_id),
+            lambda: _load_principal_own_session(user_email)
+        )
+        if str(principal.id) != str(user_id):
+            raise InvalidToken()
+        return principal
     except (UserNotFound, InvalidToken, RevokedToken, EmailNotVerified):
         raise
     except Exception as e:
@@ -1,10 +1,13 @@
 """
 Templates HTML pour les emails
+
+Les templates sont compilés une seule fois à l'import (string.Template) ;
+le rendu est une simple substitution, et les valeurs sont échappées en HTML.
 """
+from html import escape
+from string import Template
 
-def get_verification_email_template(username: str, verification_link: str) -> str:
-    """Template HTML pour l'email de vérification"""
-    return f"""
+_VERIFICATION_TEMPLATE = Template("""
 <!DOCTYPE html>
 <html lang="fr">
 <head>
@@ -12,50 +15,50 @@ def get_verification_email_template(username: str, verification_link: str) -> st
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Vérification de compte</title>
     <style>
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background-color: #f4f4f4;
             margin: 0;
             padding: 0;
-        }}
-        .email-container {{
+        }
+        .email-container {
             max-width: 600px;
             margin: 40px auto;
             background-color: #ffffff;
             border-radius: 10px;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
             overflow: hidden;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
             color: white;
             padding: 40px 30px;
             text-align: center;
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             margin: 0;
             font-size: 28px;
             font-weight: 600;
-        }}
-        .content {{
+        }
+        .content {
             padding: 40px 30px;
-        }}
-        .greeting {{
+        }
+        .greeting {
             font-size: 18px;
             color: #333;
             margin-bottom: 20px;
-        }}
-        .message {{
+        }
+        .message {
             font-size: 16px;
             color: #555;
             line-height: 1.6;
             margin-bottom: 30px;
-        }}
-        .button-container {{
+        }
+        .button-container {
             text-align: center;
             margin: 30px 0;
-        }}
-        .verify-button {{
+        }
+        .verify-button {
             display: inline-block;
             padding: 15px 40px;
             background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
@@ -66,38 +69,38 @@ def get_verification_email_template(username: str, verification_link: str) -> st
             font-weight: 600;
             box-shadow: 0 4px 15px rgba(102, 126, 234, 0.4);
             transition: transform 0.2s;
-        }}
-        .verify-button:hover {{
+        }
+        .verify-button:hover {
             transform: translateY(-2px);
             box-shadow: 0 6px 20px rgba(102, 126, 234, 0.6);
-        }}
-        .alternative-link {{
+        }
+        .alternative-link {
             margin-top: 20px;
             padding: 20px;
             background-color: #f8f9fa;
             border-radius: 8px;
             font-size: 14px;
             color: #666;
-        }}
-        .alternative-link p {{
+        }
+        .alternative-link p {
             margin: 5px 0;
-        }}
-        .alternative-link a {{
+        }
+        .alternative-link a {
             color: #667eea;
             word-break: break-all;
-        }}
-        .footer {{
+        }
+        .footer {
             background-color: #f8f9fa;
             padding: 30px;
             text-align: center;
             font-size: 14px;
             color: #888;
             border-top: 1px solid #eee;
-        }}
-        .footer p {{
+        }
+        .footer p {
             margin: 5px 0;
-        }}
-        .warning {{
+        }
+        .warning {
             margin-top: 30px;
             padding: 15px;
             background-color: #fff3cd;
@@ -105,11 +108,11 @@ def get_verification_email_template(username: str, verification_link: str) -> st
             border-radius: 4px;
             font-size: 14px;
             color: #856404;
-        }}
-        .icon {{
+        }
+        .icon {
             font-size: 48px;
             margin-bottom: 10px;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -121,7 +124,7 @@ def get_verification_email_template(username: str, verification_link: str) -> st
         
         <div class="content">
             <div class="greeting">
-                Bonjour <strong>{username}</strong> ! 👋
+                Bonjour <strong>${username}</strong> ! 👋
             </div>
             
             <div class="message">
@@ -130,14 +133,14 @@ def get_verification_email_template(username: str, verification_link: str) -> st
             </div>
             
             <div class="button-container">
-                <a href="{verification_link}" class="verify-button">
+                <a href="${verification_link}" class="verify-button">
                     ✓ Vérifier mon compte
                 </a>
             </div>
             
             <div class="alternative-link">
                 <p>Si le bouton ne fonctionne pas, copiez et collez ce lien dans votre navigateur :</p>
-                <p><a href="{verification_link}">{verification_link}</a></p>
+                <p><a href="${verification_link}">${verification_link}</a></p>
             </div>
             
             <div class="warning">
@@ -154,12 +157,10 @@ def get_verification_email_template(username: str, verification_link: str) -> st
     </div>
 </body>
 </html>
-"""
+""")
 
 
-def get_password_reset_email_template(username: str, reset_link: str) -> str:
-    """Template HTML pour l'email de réinitialisation de mot de passe"""
-    return f"""
+_PASSWORD_RESET_TEMPLATE = Template("""
 <!DOCTYPE html>
 <html lang="fr">
 <head>
@@ -167,50 +168,50 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Réinitialisation de mot de passe</title>
     <style>
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background-color: #f4f4f4;
             margin: 0;
             padding: 0;
-        }}
-        .email-container {{
+        }
+        .email-container {
             max-width: 600px;
             margin: 40px auto;
             background-color: #ffffff;
             border-radius: 10px;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
             overflow: hidden;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
             color: white;
             padding: 40px 30px;
             text-align: center;
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             margin: 0;
             font-size: 28px;
             font-weight: 600;
-        }}
-        .content {{
+        }
+        .content {
             padding: 40px 30px;
-        }}
-        .greeting {{
+        }
+        .greeting {
             font-size: 18px;
             color: #333;
             margin-bottom: 20px;
-        }}
-        .message {{
+        }
+        .message {
             font-size: 16px;
             color: #555;
             line-height: 1.6;
             margin-bottom: 30px;
-        }}
-        .button-container {{
+        }
+        .button-container {
             text-align: center;
             margin: 30px 0;
-        }}
-        .reset-button {{
+        }
+        .reset-button {
             display: inline-block;
             padding: 15px 40px;
             background: linear-gradient(135deg, #f093fb 0%, #f5576c 100%);
@@ -221,38 +222,38 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
             font-weight: 600;
             box-shadow: 0 4px 15px rgba(245, 87, 108, 0.4);
             transition: transform 0.2s;
-        }}
-        .reset-button:hover {{
+        }
+        .reset-button:hover {
             transform: translateY(-2px);
             box-shadow: 0 6px 20px rgba(245, 87, 108, 0.6);
-        }}
-        .alternative-link {{
+        }
+        .alternative-link {
             margin-top: 20px;
             padding: 20px;
             background-color: #f8f9fa;
             border-radius: 8px;
             font-size: 14px;
             color: #666;
-        }}
-        .alternative-link p {{
+        }
+        .alternative-link p {
             margin: 5px 0;
-        }}
-        .alternative-link a {{
+        }
+        .alternative-link a {
             color: #f5576c;
             word-break: break-all;
-        }}
-        .footer {{
+        }
+        .footer {
             background-color: #f8f9fa;
             padding: 30px;
             text-align: center;
             font-size: 14px;
             color: #888;
             border-top: 1px solid #eee;
-        }}
-        .footer p {{
+        }
+        .footer p {
             margin: 5px 0;
-        }}
-        .security-notice {{
+        }
+        .security-notice {
             margin-top: 30px;
             padding: 15px;
             background-color: #fff3cd;
@@ -260,8 +261,8 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
             border-radius: 4px;
             font-size: 14px;
             color: #856404;
-        }}
-        .warning-box {{
+        }
+        .warning-box {
             margin-top: 20px;
             padding: 15px;
             background-color: #f8d7da;
@@ -269,11 +270,11 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
             border-radius: 4px;
             font-size: 14px;
             color: #721c24;
-        }}
-        .icon {{
+        }
+        .icon {
             font-size: 48px;
             margin-bottom: 10px;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -285,7 +286,7 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
         
         <div class="content">
             <div class="greeting">
-                Bonjour <strong>{username}</strong>,
+                Bonjour <strong>${username}</strong>,
             </div>
             
             <div class="message">
@@ -294,14 +295,14 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
             </div>
             
             <div class="button-container">
-                <a href="{reset_link}" class="reset-button">
+                <a href="${reset_link}" class="reset-button">
                     🔑 Réinitialiser mon mot de passe
                 </a>
             </div>
             
             <div class="alternative-link">
                 <p>Si le bouton ne fonctionne pas, copiez et collez ce lien dans votre navigateur :</p>
-                <p><a href="{reset_link}">{reset_link}</a></p>
+                <p><a href="${reset_link}">${reset_link}</a></p>
             </div>
             
             <div class="security-notice">
@@ -323,12 +324,10 @@ def get_password_reset_email_template(username: str, reset_link: str) -> str:
     </div>
 </body>
 </html>
-"""
+""")
 
 
-def get_welcome_email_template(username: str) -> str:
-    """Template HTML pour l'email de bienvenue après vérification"""
-    return f"""
+_WELCOME_TEMPLATE = Template("""
 <!DOCTYPE html>
 <html lang="fr">
 <head>
@@ -336,76 +335,76 @@ def get_welcome_email_template(username: str) -> str:
     <meta name="viewport" content="width=device-width, initial-scale=1.0">
     <title>Compte vérifié !</title>
     <style>
-        body {{
+        body {
             font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
             background-color: #f4f4f4;
             margin: 0;
             padding: 0;
-        }}
-        .email-container {{
+        }
+        .email-container {
             max-width: 600px;
             margin: 40px auto;
             background-color: #ffffff;
             border-radius: 10px;
             box-shadow: 0 4px 6px rgba(0, 0, 0, 0.1);
             overflow: hidden;
-        }}
-        .header {{
+        }
+        .header {
             background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
             color: white;
             padding: 40px 30px;
             text-align: center;
-        }}
-        .header h1 {{
+        }
+        .header h1 {
             margin: 0;
             font-size: 28px;
             font-weight: 600;
-        }}
-        .content {{
+        }
+        .content {
             padding: 40px 30px;
-        }}
-        .greeting {{
+        }
+        .greeting {
             font-size: 20px;
             color: #333;
             margin-bottom: 20px;
             text-align: center;
-        }}
-        .message {{
+        }
+        .message {
             font-size: 16px;
             color: #555;
             line-height: 1.6;
             margin-bottom: 30px;
-        }}
-        .features {{
+        }
+        .features {
             margin: 30px 0;
-        }}
-        .feature {{
+        }
+        .feature {
             display: flex;
             align-items: start;
             margin-bottom: 20px;
             padding: 15px;
             background-color: #f8f9fa;
             border-radius: 8px;
-        }}
-        .feature-icon {{
+        }
+        .feature-icon {
             font-size: 24px;
             margin-right: 15px;
-        }}
-        .feature-content h3 {{
+        }
+        .feature-content h3 {
             margin: 0 0 5px 0;
             color: #333;
             font-size: 16px;
-        }}
-        .feature-content p {{
+        }
+        .feature-content p {
             margin: 0;
             color: #666;
             font-size: 14px;
-        }}
-        .button-container {{
+        }
+        .button-container {
             text-align: center;
             margin: 30px 0;
-        }}
-        .start-button {{
+        }
+        .start-button {
             display: inline-block;
             padding: 15px 40px;
             background: linear-gradient(135deg, #11998e 0%, #38ef7d 100%);
@@ -416,26 +415,26 @@ def get_welcome_email_template(username: str) -> str:
             font-weight: 600;
             box-shadow: 0 4px 15px rgba(56, 239, 125, 0.4);
             transition: transform 0.2s;
-        }}
-        .start-button:hover {{
+        }
+        .start-button:hover {
             transform: translateY(-2px);
             box-shadow: 0 6px 20px rgba(56, 239, 125, 0.6);
-        }}
-        .footer {{
+        }
+        .footer {
             background-color: #f8f9fa;
             padding: 30px;
             text-align: center;
             font-size: 14px;
             color: #888;
             border-top: 1px solid #eee;
-        }}
-        .footer p {{
+        }
+        .footer p {
             margin: 5px 0;
-        }}
-        .icon {{
+        }
+        .icon {
             font-size: 64px;
             margin-bottom: 10px;
-        }}
+        }
     </style>
 </head>
 <body>
@@ -447,7 +446,7 @@ def get_welcome_email_template(username: str) -> str:
         
         <div class="content">
             <div class="greeting">
-                Félicitations <strong>{username}</strong> ! 🎊
+                Félicitations <strong>${username}</strong> ! 🎊
             </div>
             
             <div class="message">
@@ -504,5 +503,19 @@ def get_welcome_email_template(username: str) -> str:
     </div>
 </body>
 </html>
-"""
+""")
+
 
+def get_verification_email_template(username: str, verification_link: str) -> str:
+    """Template HTML pour l'email de vérification"""
+    return _VERIFICATION_TEMPLATE.substitute(username=escape(username), verification_link=escape(verification_link))
+
+
+def get_password_reset_email_template(username: str, reset_link: str) -> str:
+    """Template HTML pour l'email de réinitialisation de mot de passe"""
+    return _PASSWORD_RESET_TEMPLATE.substitute(username=escape(username), reset_link=escape(reset_link))
+
+
+def get_welcome_email_template(username: str) -> str:
+    """Template HTML pour l'email de bienvenue après vérification"""
+    return _WELCOME_TEMPLATE.substitute(username=escape(username))
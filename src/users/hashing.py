@@ -0,0 +1,98 @@
+"""
+Hachage argon2 hors de la boucle asyncio.
+
+argon2 coûte plusieurs dizaines de millisecondes de CPU par appel : exécuté
+directement dans une route async, il bloque toutes les autres requêtes du
+worker. Les appels passent ici par un pool de threads borné (argon2-cffi
+relâche le GIL, les hachages s'exécutent donc réellement en parallèle sur
+plusieurs coeurs).
+
+Au-delà de PASSWORD_HASH_MAX_PENDING opérations en cours ou en attente, la
+requête est refusée immédiatement (ServiceOverloaded -> 429) plutôt que
+d'allonger la file : la latence des requêtes acceptées reste bornée.
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, Tuple
+
+from src.config import Config
+from src.error import ServiceOverloaded
+from src.users.utils import password_context
+
+logger = logging.getLogger("password_hashing")
+logger.setLevel(logging.INFO)
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+_stats = {"hashed": 0, "verified": 0, "rehashed": 0, "rejected": 0}
+
+
+def _workers() -> int:
+    return Config.PASSWORD_HASH_WORKERS or os.cpu_count() or 1
+
+
+def _max_pending() -> int:
+    return Config.PASSWORD_HASH_MAX_PENDING or _workers() * 4
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="argon2")
+    return _executor
+
+
+async def _run(func: Callable[..., Any], *args: Any) -> Any:
+    global _pending
+    if _pending >= _max_pending():
+        _stats["rejected"] += 1
+        logger.warning(f"Password hashing saturated ({_pending} pending), shedding request")
+        raise ServiceOverloaded()
+
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password(password: str) -> str:
+    """Équivalent async de generate_password_hash."""
+    if not password:
+        raise ValueError("Le mot de passe ne peut pas être vide")
+    result = await _run(password_context.hash, password)
+    _stats["hashed"] += 1
+    return result
+
+
+async def verify_password(password: str, password_hash: str) -> Tuple[bool, Optional[str]]:
+    """
+    Vérifie un mot de passe. Retourne (valide, nouveau_hash) : nouveau_hash est
+    renseigné quand le hash stocké utilise des paramètres obsolètes et doit
+    être remplacé (re-hachage transparent).
+    """
+    if not password or not password_hash:
+        return False, None
+    try:
+        valid, new_hash = await _run(password_context.verify_and_update, password, password_hash)
+    except ValueError:
+        # Hash illisible (format inconnu) : même comportement qu'un mauvais mot de passe
+        return False, None
+    _stats["verified"] += 1
+    if valid and new_hash:
+        _stats["rehashed"] += 1
+    return valid, new_hash
+
+
+def hashing_stats() -> dict:
+    return {**_stats, "pending": _pending, "workers": _workers(), "max_pending": _max_pending()}
+
+
+def shutdown_hash_executor() -> None:
+    global _executor
+    executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -4,7 +4,7 @@ from datetime import datetime
 from uuid import UUID, uuid4
 
 from sqlmodel import SQLModel, Field, Relationship
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, func
 import sqlalchemy.dialects.postgresql as pg
 
 
@@ -60,6 +60,11 @@ class UtilisateurBase(SQLModel):
 
 class Utilisateur(UtilisateurBase, table=True):
     __tablename__ = "utilisateur"
+    __table_args__ = (
+        # Pagination par curseur (created_at DESC, id DESC), avec ou sans filtre de statut
+        Index("ix_utilisateur_created_at_id", "created_at", "id"),
+        Index("ix_utilisateur_status_created_at_id", "status", "created_at", "id"),
+    )
     id: UUID = Field(
         sa_column=Column(
             pg.UUID,
@@ -73,6 +78,11 @@ class Utilisateur(UtilisateurBase, table=True):
     etudiant: Optional["Etudiant"] = Relationship(back_populates="utilisateur")
 
 
+# Unicité de l'email insensible à la casse : c'est cette contrainte qui
+# détecte les doublons à l'inscription (UserService.create_user)
+Index("ux_utilisateur_email_lower", func.lower(Utilisateur.__table__.c.email), unique=True)
+
+
 class Professeur(SQLModel, table=True):
     __tablename__ = "professeur"
     id: UUID = Field(
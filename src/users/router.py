@@ -1,22 +1,24 @@
 from datetime import timedelta, datetime, timezone
-from typing import List
-from fastapi import APIRouter, status, Depends, HTTPException,BackgroundTasks
+from typing import List, Optional
+from uuid import uuid4
+from fastapi import APIRouter, status, Depends, HTTPException, BackgroundTasks, Query
 from sqlmodel.ext.asyncio.session import AsyncSession
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import logging
 
-from src.db.main import get_session
+from src.db.main import get_session, async_session
 from src.db.redis import (
-    get_all_users_cache,
-    set_all_users_cache,
+    users_page_cache,
+    users_page_key,
     set_user_cache,
     invalidate_all_users_cache,
     add_jti_to_blocklist
 )
 from .models import StatutUtilisateur
-from .utils import create_access_token
+from .utils import create_access_token, encode_cursor, decode_cursor
 from src.users.schema import (
     UtilisateurRead,
+    UtilisateurPage,
     UtilisateurCreateBase,
     UserLogin,
     EmailModel,
@@ -24,17 +26,18 @@ from src.users.schema import (
     PasswordResetConfirm
 )
 from src.users.services import UserService
-from src.users.utils import verify_password_hash ,generate_password_hash
+from src.users.hashing import hash_password, verify_password
 from src.users.dependencies import AccessTokenBearer
 from .dependencies import RefreshTokenBearer
 from .dependencies import get_current_user, RoleChecker
-from ..celery_tasks import send_email
+from src.mail_outbox import build_email, enqueue_email, notify_outbox
 from ..error import (
     InvalidToken,
     UserNotFound,
     UserAlreadyExists,
     ExpiredToken,
-    AccessTokenRequired
+    AccessTokenRequired,
+    ServiceOverloaded
 )
 from src.config import Config
 
@@ -56,11 +59,13 @@ user_service = UserService()
 REFRESH_TOKEN_EXPIRATION = 2  # en jours
 
 @user_router.post("/send_mail")
-async def send_mail(emailmodel:EmailModel):
+async def send_mail(emailmodel:EmailModel, session: AsyncSession = Depends(get_session)):
     email = emailmodel.mails
     subject = "welcome"
     body = "<h1>Welcome to my app</h1>"
-    send_email.delay(email,subject,body)
+    enqueue_email(session, email, subject, body)
+    await session.commit()
+    await notify_outbox()
     return JSONResponse(
         "message sent",
         status_code=status.HTTP_201_CREATED
@@ -103,16 +108,13 @@ async def verify_email(token: str, session: AsyncSession = Depends(get_session))
                 status_code=status.HTTP_200_OK
             )
 
-        # Vérifier le compte
-        await user_service.update_user(user, {'is_verified': True}, session)
-
-        # Envoyer un email de bienvenue
+        # Email de bienvenue dans l'outbox, validé avec la vérification du compte
         welcome_html = get_welcome_email_template(username=user.username)
-        send_email.delay(
-            [user.email],
-            "🎉 Bienvenue sur AI4D !",
-            welcome_html
-        )
+        enqueue_email(session, [user.email], "🎉 Bienvenue sur AI4D !", welcome_html)
+
+        # Vérifier le compte (commit)
+        await user_service.update_user(user, {'is_verified': True}, session)
+        await notify_outbox()
 
         logger.info(f"User verified successfully: {user.id}")
 
@@ -143,41 +145,45 @@ async def verify_email(token: str, session: AsyncSession = Depends(get_session))
 
 
 # --- GET all users ---
-@user_router.get("/", response_model=List[UtilisateurRead])
+USERS_PAGE_MAX_LIMIT = 100
+EXPORT_BATCH_SIZE = 500
+
+
+@user_router.get("/", response_model=UtilisateurPage)
 async def get_all_users(
-        session: AsyncSession = Depends(get_session),
+        limit: int = Query(20, ge=1, le=USERS_PAGE_MAX_LIMIT),
+        cursor: Optional[str] = None,
+        status_filter: Optional[StatutUtilisateur] = Query(None, alias="status"),
         user_details=Depends(AccessTokenBearer()),
 ):
+    """
+    Liste paginée des utilisateurs (du plus récent au plus ancien).
+    Passer `next_cursor` de la réponse en `cursor` pour la page suivante.
+    """
     try:
-        if not user_details:
-            raise AccessTokenRequired()
-
-        jti = user_details.get('jti')
-        if not jti:
-            raise InvalidToken()
-        # Tentative de récupération depuis le cache
-        try:
-            cached = await get_all_users_cache()
-            if cached:
-                logger.info("Cache hit for all users")
-                return [UtilisateurRead.model_validate(u) for u in cached]
-        except Exception as e:
-            logger.warning(f"Redis unavailable for all users cache: {e}")
-
-        # Récupération depuis la base de données
-        users_result = await user_service.get_all_users(session)
-        if not users_result:
-            return []
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
 
-        users_data = [UtilisateurRead.model_validate(u, from_attributes=True) for u in users_result]
+    async def load_page() -> UtilisateurPage:
+        # Session propre : la page est partagée entre requêtes concurrentes (get_or_load)
+        async with async_session() as session:
+            users, next_after = await user_service.list_users_page(session, limit, after, status_filter)
+        return UtilisateurPage(
+            items=[UtilisateurRead.model_validate(u, from_attributes=True) for u in users],
+            next_cursor=encode_cursor(*next_after) if next_after else None
+        )
 
-        # Mise à jour du cache
+    try:
         try:
-            await set_all_users_cache(users_data)
+            key = await users_page_key(status_filter.value if status_filter else None, limit, cursor)
         except Exception as e:
-            logger.warning(f"Redis unavailable, cannot cache all users: {e}")
-
-        return users_data
+            logger.warning(f"Redis unavailable for users page cache: {e}")
+            return await load_page()
+        return await users_page_cache.get_or_load(key, load_page)
 
     except Exception as e:
         logger.error(f"Error getting all users: {str(e)}")
@@ -187,6 +193,29 @@ async def get_all_users(
         )
 
 
+@user_router.get("/export")
+async def export_users(
+        status_filter: Optional[StatutUtilisateur] = Query(None, alias="status"),
+        _admin: UtilisateurRead = Depends(RoleChecker([StatutUtilisateur.Administrateur.value])),
+):
+    """
+    Export de tous les utilisateurs en NDJSON (une ligne JSON par utilisateur),
+    envoyé au fil de l'eau par lots : la mémoire utilisée ne dépend pas du
+    nombre d'utilisateurs.
+    """
+    async def generate():
+        # Session propre au flux : celle de la dépendance est fermée avant l'envoi
+        async with async_session() as session:
+            async for user in user_service.iter_users(session, status_filter, EXPORT_BATCH_SIZE):
+                yield UtilisateurRead.model_validate(user, from_attributes=True).model_dump_json() + "\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="users.ndjson"'}
+    )
+
+
 # --- CREATE user ---
 @user_router.options("/signup")
 async def options_signup():
@@ -230,10 +259,6 @@ async def create_user(
         # Normaliser l'email dès le début
         normalized_email = str(data.email).strip().lower()
 
-        existing_user = await user_service.get_user_by_email(normalized_email, session)
-        if existing_user:
-            raise UserAlreadyExists()
-
         # Normaliser le domaine (accepter majuscules et minuscules)
         from src.users.models import Domaine as DomaineEnum
         domaine_raw = getattr(data, 'domaine', None)
@@ -262,29 +287,27 @@ async def create_user(
 
         logger.info(f"Domaine normalized: {domaine_raw} -> {domaine_found.value}")
 
-        # ✅ Créer l'utilisateur de base
-        user = await user_service.create_user(session, data)
-        user_data = UtilisateurRead.model_validate(user, from_attributes=True)
-
-        # Créer un token de vérification sécurisé avec expiration (24h)
-        verification_token = await TokenService.create_verification_token(
-            user_id=str(user.id),
-            session=session,
-            token_type="email_verification",
-            expiry_hours=24
-        )
+        # Token de vérification (24h) et email construits avant l'insertion
+        user_id = uuid4()
+        verification_token = TokenService.build_token(user_id, "email_verification", expiry_hours=24)
 
         # Créer le lien de vérification
         verification_link = f"http://{Config.DOMAIN}/api/auth/v1/verify/{verification_token.token}"
 
         # Générer l'email HTML professionnel
         html_message = get_verification_email_template(
-            username=user.username,
+            username=data.username,
             verification_link=verification_link
         )
+        verification_email = build_email([normalized_email], "🚀 Vérifiez votre compte AI4D", html_message)
 
-        # Envoyer l'email de vérification via Celery (asynchrone, ne bloque pas)
-        send_email.delay([normalized_email], "🚀 Vérifiez votre compte AI4D", html_message)
+        # ✅ Utilisateur, token et email dans la même transaction ; un doublon
+        # lève UserAlreadyExists (contraintes uniques)
+        user = await user_service.create_user(
+            session, data, user_id=user_id, extra=[verification_token, verification_email]
+        )
+        user_data = UtilisateurRead.model_validate(user, from_attributes=True)
+        await notify_outbox()
 
         # Mettre à jour le cache en arrière-plan
         async def update_cache():
@@ -308,7 +331,7 @@ async def create_user(
             }
         }
 
-    except UserAlreadyExists:
+    except (UserAlreadyExists, ServiceOverloaded):
         raise
     except HTTPException:
         raise
@@ -348,13 +371,21 @@ async def login_user(login: UserLogin, session: AsyncSession = Depends(get_sessi
         if not user:
             raise UserNotFound()
 
-        # Vérification du mot de passe
-        if not verify_password_hash(password, user.motDePasseHash):
+        # Vérification du mot de passe (pool argon2, hors boucle)
+        password_ok, new_hash = await verify_password(password, user.motDePasseHash)
+        if not password_ok:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid credentials"
             )
 
+        # Paramètres argon2 modifiés depuis le dernier hachage : mettre le hash à jour
+        if new_hash and Config.PASSWORD_REHASH_ON_LOGIN:
+            try:
+                await user_service.update_user(user, {'motDePasseHash': new_hash}, session)
+            except Exception as e:
+                logger.warning(f"Password rehash failed for user {user.id}: {e}")
+
         # ✅ NOUVEAU: Vérifier que le compte est vérifié
         if not user.is_verified:
             raise HTTPException(
@@ -401,7 +432,7 @@ async def login_user(login: UserLogin, session: AsyncSession = Depends(get_sessi
             }
         )
 
-    except UserNotFound:
+    except (UserNotFound, ServiceOverloaded):
         raise
     except HTTPException:
         raise
@@ -548,13 +579,9 @@ async def password_reset_request(
                 status_code=status.HTTP_200_OK
             )
 
-        # Créer un token de reset avec expiration d'1 heure
-        reset_token = await TokenService.create_verification_token(
-            user_id=str(user.id),
-            session=session,
-            token_type="password_reset",
-            expiry_hours=1  # 1 heure pour plus de sécurité
-        )
+        # Créer un token de reset avec expiration d'1 heure (1 heure pour plus de sécurité)
+        await TokenService.invalidate_user_tokens(user.id, "password_reset", session, commit=False)
+        reset_token = TokenService.build_token(user.id, "password_reset", expiry_hours=1)
 
         # Créer le lien de reset
         reset_link = f"http://{Config.DOMAIN}/api/auth/v1/password_reset_confirm/{reset_token.token}"
@@ -565,11 +592,11 @@ async def password_reset_request(
             reset_link=reset_link
         )
 
-        send_email.delay(
-            [email],
-            "🔐 Réinitialisation de votre mot de passe AI4D",
-            html_message
-        )
+        # Anciens tokens révoqués, nouveau token et email validés dans la même transaction
+        session.add(reset_token)
+        enqueue_email(session, [email], "🔐 Réinitialisation de votre mot de passe AI4D", html_message)
+        await session.commit()
+        await notify_outbox()
 
         logger.info(f"Password reset requested for user: {user.id}")
 
@@ -628,11 +655,14 @@ async def password_reset_confirm(
                 detail="Le mot de passe doit contenir au moins 8 caractères"
             )
 
-        # Vérifier et valider le token
+        # Vérifier le token sans le consommer : il n'est marqué utilisé qu'avec
+        # le nouveau mot de passe (même commit), un hachage refusé (429) ou en
+        # échec laisse le lien valide
         token_obj = await TokenService.verify_token(
             token=token,
             token_type="password_reset",
-            session=session
+            session=session,
+            commit=False
         )
 
         if not token_obj:
@@ -646,8 +676,8 @@ async def password_reset_confirm(
         if not user:
             raise UserNotFound()
 
-        # Mettre à jour le mot de passe
-        password_hash = generate_password_hash(new_password)
+        # Mettre à jour le mot de passe (commit du token utilisé et du hash)
+        password_hash = await hash_password(new_password)
         await user_service.update_user(user, {'motDePasseHash': password_hash}, session)
 
         logger.info(f"Password reset successfully for user: {user.id}")
@@ -661,7 +691,7 @@ async def password_reset_confirm(
 
     except HTTPException:
         raise
-    except UserNotFound:
+    except (UserNotFound, ServiceOverloaded):
         raise
     except Exception as e:
         logger.error(f"Error in password reset confirm: {str(e)}")
@@ -712,12 +742,8 @@ async def resend_verification_email(
             )
 
         # Créer un nouveau token de vérification
-        verification_token = await TokenService.create_verification_token(
-            user_id=str(user.id),
-            session=session,
-            token_type="email_verification",
-            expiry_hours=24
-        )
+        await TokenService.invalidate_user_tokens(user.id, "email_verification", session, commit=False)
+        verification_token = TokenService.build_token(user.id, "email_verification", expiry_hours=24)
 
         # Créer le lien de vérification
         verification_link = f"http://{Config.DOMAIN}/api/auth/v1/verify/{verification_token.token}"
@@ -728,11 +754,11 @@ async def resend_verification_email(
             verification_link=verification_link
         )
 
-        send_email.delay(
-            [email],
-            "🚀 Vérifiez votre compte AI4D",
-            html_message
-        )
+        # Anciens tokens révoqués, nouveau token et email validés dans la même transaction
+        session.add(verification_token)
+        enqueue_email(session, [email], "🚀 Vérifiez votre compte AI4D", html_message)
+        await session.commit()
+        await notify_outbox()
 
         logger.info(f"Verification email resent to user: {user.id}")
 
@@ -105,6 +105,12 @@ class UtilisateurRead(BaseModel):
         from_attributes = True
 
 
+class UtilisateurPage(BaseModel):
+    """Page de la liste des utilisateurs (pagination par curseur)."""
+    items: List[UtilisateurRead]
+    next_cursor: Optional[str] = None
+
+
 class ProfesseurRead(UtilisateurRead):
     niveau_experience: int
     specialites: List[str]
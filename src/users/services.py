@@ -1,16 +1,32 @@
 from datetime import datetime
-from uuid import UUID
-from typing import Union, Optional, Dict, Any
+from uuid import UUID, uuid4
+from typing import Union, Optional, Dict, Any, AsyncIterator, Iterable, List, Tuple
 
-from sqlmodel import select, desc
+from sqlalchemy import func, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlmodel import SQLModel, select, desc
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from .utils import generate_password_hash
+from .hashing import hash_password
+from src.db.cache import bump_version
 from src.users.models import Utilisateur, Professeur, Etudiant, StatutUtilisateur
 from src.users.schema import ProfesseurCreate, EtudiantCreate, StatutUtilisateur as StatutEnum, UtilisateurCreateBase
 from ..error import UserAlreadyExists
 
+UNIQUE_VIOLATION = "23505"
+
+
+def _is_unique_violation(error: IntegrityError) -> bool:
+    """Vrai si l'erreur PostgreSQL est une violation de contrainte unique."""
+    orig = error.orig
+    for candidate in (orig, getattr(orig, "__cause__", None)):
+        code = getattr(candidate, "sqlstate", None) or getattr(candidate, "pgcode", None)
+        if code == UNIQUE_VIOLATION:
+            return True
+    return False
+
+
 class UserService:
 
     @staticmethod
@@ -18,6 +34,8 @@ class UserService:
         for key, value in user_data.items():
             setattr(user, key, value)
         await  session.commit()
+        # Vérification, mot de passe, statut... : le principal en cache est périmé
+        await bump_version("user", user.id)
         return user
 
 
@@ -27,6 +45,48 @@ class UserService:
         result = await session.execute(stmt)
         return result.scalars().all()
 
+    @staticmethod
+    async def list_users_page(
+            session: AsyncSession,
+            limit: int,
+            after: Optional[Tuple[datetime, UUID]] = None,
+            status: Optional[StatutUtilisateur] = None
+    ) -> Tuple[List[Utilisateur], Optional[Tuple[datetime, UUID]]]:
+        """
+        Page d'utilisateurs triés par (created_at, id) décroissants, à partir
+        du curseur `after` (exclu). Retourne la page et le curseur suivant
+        (None sur la dernière page). Coût borné par `limit`, quel que soit
+        le rang de la page.
+        """
+        stmt = select(Utilisateur).order_by(desc(Utilisateur.created_at), desc(Utilisateur.id))
+        if status is not None:
+            stmt = stmt.where(Utilisateur.status == status)
+        if after is not None:
+            stmt = stmt.where(tuple_(Utilisateur.created_at, Utilisateur.id) < tuple_(*after))
+        result = await session.execute(stmt.limit(limit + 1))
+        users = list(result.scalars().all())
+
+        if len(users) <= limit:
+            return users, None
+        users = users[:limit]
+        return users, (users[-1].created_at, users[-1].id)
+
+    @staticmethod
+    async def iter_users(
+            session: AsyncSession,
+            status: Optional[StatutUtilisateur] = None,
+            batch_size: int = 500
+    ) -> AsyncIterator[Utilisateur]:
+        """Parcourt tous les utilisateurs par lots successifs de pagination par curseur."""
+        after = None
+        while True:
+            users, after = await UserService.list_users_page(session, batch_size, after, status)
+            for user in users:
+                yield user
+            session.expunge_all()
+            if after is None:
+                return
+
     @staticmethod
     async def get_user(user_id: UUID, session: AsyncSession):
         stmt = select(Utilisateur).where(Utilisateur.id == user_id)
@@ -46,7 +106,8 @@ class UserService:
     async def get_user_by_email(email: str, session: AsyncSession):
         stmt = (
             select(Utilisateur)
-            .where(Utilisateur.email == email)
+            # Index unique fonctionnel sur lower(email)
+            .where(func.lower(Utilisateur.email) == email.strip().lower())
             .options(
                 selectinload(Utilisateur.professeur),
                 selectinload(Utilisateur.etudiant),
@@ -75,93 +136,98 @@ class UserService:
     @staticmethod
     async def create_user(
             session: AsyncSession,
-            data: Union[EtudiantCreate, ProfesseurCreate, UtilisateurCreateBase]
+            data: Union[EtudiantCreate, ProfesseurCreate, UtilisateurCreateBase],
+            user_id: Optional[UUID] = None,
+            extra: Iterable[SQLModel] = ()
     ):
         """
         Crée un utilisateur avec son profil Etudiant ou Professeur.
         Le domaine est sauvegardé immédiatement lors de l'inscription.
-        """
-        try:
-            # L'email est déjà normalisé dans router.py
-            normalized_email = str(data.email).strip().lower()
 
-            # Vérifier si l'email existe déjà (avec l'email normalisé)
-            if await UserService.email_exists(normalized_email, session):
-                raise UserAlreadyExists()
+        Une seule transaction, sans requête de vérification préalable : l'id
+        est généré côté application, les lignes (utilisateur, profil, `extra`
+        comme le token de vérification) partent en un seul flush, et les
+        doublons d'email (index unique sur lower(email)) ou de username sont
+        détectés par les contraintes puis traduits en UserAlreadyExists.
+        """
+        # L'email est déjà normalisé dans router.py
+        normalized_email = str(data.email).strip().lower()
+
+        # Hachage argon2 hors boucle (peut lever ServiceOverloaded -> 429)
+        password_hash = await hash_password(data.motDePasseHash)
+
+        now = datetime.now()
+        utilisateur = Utilisateur(
+            id=user_id or uuid4(),
+            nom=data.nom,
+            prenom=data.prenom,
+            username=data.username,
+            email=normalized_email,
+            motDePasseHash=password_hash,
+            status=data.status,
+            created_at=now,
+            updated_at=now,
+            is_verified=False
+        )
 
-            if await UserService.username_exists(data.username, session):
-                raise UserAlreadyExists()
+        # Récupérer le domaine et le normaliser en enum
+        from src.users.models import Domaine as DomaineEnum
+
+        domaine_raw = getattr(data, 'domaine', 'Général') or 'Général'
+
+        # Convertir en enum si c'est une string
+        if isinstance(domaine_raw, str):
+            domaine_enum = DomaineEnum.GENERAL  # Default
+            for dom in DomaineEnum:
+                if dom.value.lower() == domaine_raw.lower() or dom.name.lower() == domaine_raw.lower():
+                    domaine_enum = dom
+                    break
+        elif isinstance(domaine_raw, DomaineEnum):
+            domaine_enum = domaine_raw
+        else:
+            domaine_enum = DomaineEnum.GENERAL
+
+        rows: List[SQLModel] = [utilisateur]
+        # Créer le profil spécifique selon le statut
+        if data.status == StatutUtilisateur.ETUDIANT:
+            rows.append(Etudiant(
+                id=utilisateur.id,
+                domaine=domaine_enum,  # Utiliser l'enum
+                niveau_technique=5,  # Valeur par défaut, sera mise à jour après questionnaire
+                competences=[],
+                objectifs_apprentissage=None,
+                motivation=None,
+                niveau_energie=5
+            ))
+        elif data.status == StatutUtilisateur.PROFESSEUR:
+            rows.append(Professeur(
+                id=utilisateur.id,
+                domaine=domaine_enum,  # Utiliser l'enum
+                niveau_experience=1,  # Valeur par défaut
+                specialites=[],
+                motivation_principale=None,
+                niveau_technologique=5
+            ))
 
-            # Créer l'utilisateur de base
-            utilisateur = Utilisateur(
-                nom=data.nom,
-                prenom=data.prenom,
-                username=data.username,
-                email=normalized_email,
-                motDePasseHash=generate_password_hash(data.motDePasseHash),
-                status=data.status,
-                created_at=datetime.now(),
-                updated_at=datetime.now()
-            )
-            session.add(utilisateur)
-            await session.flush()  # Obtenir l'ID de l'utilisateur
-
-            # Récupérer le domaine et le normaliser en enum
-            from src.users.models import Domaine as DomaineEnum
-
-            domaine_raw = getattr(data, 'domaine', 'Général') or 'Général'
-
-            # Convertir en enum si c'est une string
-            if isinstance(domaine_raw, str):
-                domaine_enum = DomaineEnum.GENERAL  # Default
-                for dom in DomaineEnum:
-                    if dom.value.lower() == domaine_raw.lower() or dom.name.lower() == domaine_raw.lower():
-                        domaine_enum = dom
-                        break
-            elif isinstance(domaine_raw, DomaineEnum):
-                domaine_enum = domaine_raw
-            else:
-                domaine_enum = DomaineEnum.GENERAL
-
-            # Créer le profil spécifique selon le statut
-            if data.status == StatutUtilisateur.ETUDIANT:
-                etudiant = Etudiant(
-                    id=utilisateur.id,
-                    domaine=domaine_enum,  # Utiliser l'enum
-                    niveau_technique=5,  # Valeur par défaut, sera mise à jour après questionnaire
-                    competences=[],
-                    objectifs_apprentissage=None,
-                    motivation=None,
-                    niveau_energie=5
-                )
-                session.add(etudiant)
-
-            elif data.status == StatutUtilisateur.PROFESSEUR:
-                professeur = Professeur(
-                    id=utilisateur.id,
-                    domaine=domaine_enum,  # Utiliser l'enum
-                    niveau_experience=1,  # Valeur par défaut
-                    specialites=[],
-                    motivation_principale=None,
-                    niveau_technologique=5
-                )
-                session.add(professeur)
-
-            # Commit final
+        try:
+            session.add_all(rows)
+            # Les lignes `extra` n'ont pas de relationship vers Utilisateur :
+            # flush d'abord pour garantir l'ordre des INSERT (même transaction)
+            await session.flush()
+            session.add_all(list(extra))
+            # expire_on_commit=False : pas de refresh nécessaire après le commit
             await session.commit()
-            await session.refresh(utilisateur)
-
             return utilisateur
 
-        except UserAlreadyExists:
+        except IntegrityError as e:
             await session.rollback()
-            raise
+            if _is_unique_violation(e):
+                raise UserAlreadyExists()
+            raise Exception(f"Erreur lors de la création de l'utilisateur: {str(e)}")
         except Exception as e:
             await session.rollback()
             raise Exception(f"Erreur lors de la création de l'utilisateur: {str(e)}")
 
-
-
     @staticmethod
     async def ensure_sql_profile_after_questionnaire(
         user_id: UUID,
@@ -202,6 +268,7 @@ class UserService:
                     etu.motivation = d.get("motivation") or etu.motivation
                     etu.niveau_energie = int(d.get("energie", d.get("niveau_energie", etu.niveau_energie)) or etu.niveau_energie)
                     await session.commit()
+                    await bump_version("user", user_id)
 
             elif status == StatutEnum.PROFESSEUR:
                 # Mettre à jour le profil professeur
@@ -216,6 +283,7 @@ class UserService:
                     prof.motivation_principale = d.get("motivation_principale") or d.get("motivation") or prof.motivation_principale
                     prof.niveau_technologique = int(d.get("niveau_technologique", d.get("energie", prof.niveau_technologique)) or prof.niveau_technologique)
                     await session.commit()
+                    await bump_version("user", user_id)
         finally:
             if close_session:
                 await session.close()
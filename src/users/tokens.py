@@ -2,12 +2,13 @@
 Gestion des tokens de vérification et reset de mot de passe
 """
 from datetime import datetime, timedelta
-from typing import Optional, Union
+from typing import Dict, Optional, Union
 from uuid import UUID
 import secrets
+import time
 
 from sqlmodel import SQLModel, Field, select
-from sqlalchemy import Column, ForeignKey
+from sqlalchemy import Column, ForeignKey, Index, and_, delete, text
 from sqlalchemy.ext.asyncio import AsyncSession
 import sqlalchemy.dialects.postgresql as pg
 
@@ -15,6 +16,14 @@ import sqlalchemy.dialects.postgresql as pg
 class VerificationToken(SQLModel, table=True):
     """Token de vérification d'email"""
     __tablename__ = "verification_token"
+    __table_args__ = (
+        # Purge des tokens utilisés (cleanup_expired_tokens)
+        Index(
+            "ix_verification_token_used_at",
+            "used_at",
+            postgresql_where=text("is_used"),
+        ),
+    )
 
     id: int = Field(primary_key=True)
     # Use UUID type so SQLAlchemy/asyncpg bind UUID parameters (avoid uuid=varchar operator error)
@@ -26,7 +35,7 @@ class VerificationToken(SQLModel, table=True):
         sa_column=Column(pg.TIMESTAMP, default=datetime.now)
     )
     expires_at: datetime = Field(
-        sa_column=Column(pg.TIMESTAMP)
+        sa_column=Column(pg.TIMESTAMP, index=True)
     )
     used_at: Optional[datetime] = Field(
         sa_column=Column(pg.TIMESTAMP, nullable=True),
@@ -44,6 +53,23 @@ class TokenService:
         """Génère un token sécurisé"""
         return secrets.token_urlsafe(32)
 
+    @staticmethod
+    def build_token(
+        user_id: UUID,
+        token_type: str = "email_verification",
+        expiry_hours: int = 24
+    ) -> VerificationToken:
+        """Construit un token sans l'enregistrer (à ajouter à la transaction de l'appelant)."""
+        now = datetime.now()
+        return VerificationToken(
+            user_id=user_id,
+            token=TokenService.generate_token(),
+            token_type=token_type,
+            created_at=now,
+            expires_at=now + timedelta(hours=expiry_hours),
+            is_used=False
+        )
+
     @staticmethod
     async def create_verification_token(
         user_id: Union[str, UUID],
@@ -75,17 +101,7 @@ class TokenService:
         # Invalider les tokens précédents non utilisés
         await TokenService.invalidate_user_tokens(user_uuid, token_type, session)
 
-        token = TokenService.generate_token()
-        expires_at = datetime.now() + timedelta(hours=expiry_hours)
-
-        verification_token = VerificationToken(
-            user_id=user_uuid,
-            token=token,
-            token_type=token_type,
-            created_at=datetime.now(),
-            expires_at=expires_at,
-            is_used=False
-        )
+        verification_token = TokenService.build_token(user_uuid, token_type, expiry_hours)
 
         session.add(verification_token)
         await session.commit()
@@ -97,11 +113,15 @@ class TokenService:
     async def verify_token(
         token: str,
         token_type: str,
-        session: AsyncSession
+        session: AsyncSession,
+        commit: bool = True
     ) -> Optional[VerificationToken]:
         """
         Vérifie un token et le marque comme utilisé
 
+        Avec commit=False, la ligne est verrouillée et le marquage reste dans
+        la transaction de l'appelant (validé avec ses propres écritures).
+
         Returns:
             VerificationToken si valide, None sinon
         """
@@ -110,6 +130,8 @@ class TokenService:
             VerificationToken.token_type == token_type,
             VerificationToken.is_used == False
         )
+        if not commit:
+            stmt = stmt.with_for_update()
         result = await session.execute(stmt)
         token_obj = result.scalar_one_or_none()
 
@@ -123,7 +145,8 @@ class TokenService:
         # Marquer comme utilisé
         token_obj.is_used = True
         token_obj.used_at = datetime.now()
-        await session.commit()
+        if commit:
+            await session.commit()
 
         return token_obj
 
@@ -131,9 +154,10 @@ class TokenService:
     async def invalidate_user_tokens(
         user_id: Union[str, UUID],
         token_type: str,
-        session: AsyncSession
+        session: AsyncSession,
+        commit: bool = True
     ):
-        """Invalide tous les tokens non utilisés d'un utilisateur"""
+        """Invalide tous les tokens non utilisés d'un utilisateur (commit=False : dans la transaction de l'appelant)"""
         # Ensure user_id is UUID
         if isinstance(user_id, str):
             try:
@@ -157,19 +181,66 @@ class TokenService:
             token.is_used = True
             token.used_at = datetime.now()
 
-        await session.commit()
+        if commit:
+            await session.commit()
 
     @staticmethod
-    async def cleanup_expired_tokens(session: AsyncSession):
-        """Nettoie les tokens expirés (à exécuter périodiquement)"""
-        stmt = select(VerificationToken).where(
-            VerificationToken.expires_at < datetime.now()
-        )
-        result = await session.execute(stmt)
-        expired_tokens = result.scalars().all()
+    async def _delete_in_batches(session: AsyncSession, condition, order_by, batch_size: int) -> int:
+        """DELETE ... WHERE id IN (SELECT id ... LIMIT n) répété jusqu'à épuisement, un commit par lot."""
+        removed = 0
+        while True:
+            batch = (
+                select(VerificationToken.id)
+                .where(condition)
+                .order_by(order_by)
+                .limit(batch_size)
+                .with_for_update(skip_locked=True)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                delete(VerificationToken)
+                .where(VerificationToken.id.in_(batch))
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
+            removed += result.rowcount
+            if result.rowcount < batch_size:
+                return removed
 
-        for token in expired_tokens:
-            await session.delete(token)
+    @staticmethod
+    async def cleanup_expired_tokens(
+        session: AsyncSession,
+        batch_size: int = 1000,
+        used_retention_hours: int = 24
+    ) -> Dict[str, float]:
+        """
+        Supprime les tokens expirés, et les tokens utilisés depuis plus de
+        `used_retention_hours`, par lots bornés (exécuté par Celery beat).
 
-        await session.commit()
-        return len(expired_tokens)
+        Returns:
+            dict: lignes supprimées par catégorie et durée en secondes
+        """
+        started = time.perf_counter()
+        now = datetime.now()
+
+        expired = await TokenService._delete_in_batches(
+            session,
+            VerificationToken.expires_at < now,
+            VerificationToken.expires_at,
+            batch_size,
+        )
+        used = await TokenService._delete_in_batches(
+            session,
+            and_(
+                VerificationToken.is_used == True,
+                VerificationToken.used_at < now - timedelta(hours=used_retention_hours)
+            ),
+            VerificationToken.used_at,
+            batch_size,
+        )
+
+        return {
+            "expired_deleted": expired,
+            "used_deleted": used,
+            "duration_s": round(time.perf_counter() - started, 3),
+        }
@@ -1,6 +1,7 @@
+import base64
 import logging
 import uuid
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 from fastapi import HTTPException,status
 from passlib.context import CryptContext
@@ -19,9 +20,19 @@ ACCESS_TOKEN_EXPIRE = 3600  # en secondes (1 heure)
 REFRESH_TOKEN_EXPIRE = 7 * 24 * 3600  # 7 jours en secondes
 
 # Configuration du contexte de mot de passe
+_argon2_params = {
+    f"argon2__{name}": value
+    for name, value in (
+        ("time_cost", Config.ARGON2_TIME_COST),
+        ("memory_cost", Config.ARGON2_MEMORY_COST),
+        ("parallelism", Config.ARGON2_PARALLELISM),
+    )
+    if value is not None
+}
 password_context = CryptContext(
     schemes=["argon2"],
-    deprecated="auto"
+    deprecated="auto",
+    **_argon2_params
 )
 
 
@@ -212,6 +223,22 @@ def get_token_jti(token_data: Dict[str, Any]) -> str:
         raise InvalidToken()
     return jti
 
+def encode_cursor(created_at: datetime, user_id: uuid.UUID) -> str:
+    """Curseur opaque de pagination : (created_at, id) du dernier élément de la page."""
+    raw = f"{created_at.isoformat()}|{user_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """Inverse de encode_cursor ; lève ValueError si le curseur est invalide."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        created_at, user_id = raw.split("|", 1)
+        return datetime.fromisoformat(created_at), uuid.UUID(user_id)
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
 serializer = URLSafeTimedSerializer(
         Config.JWT_SECRET,
         salt=" email-configuration"